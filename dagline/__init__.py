@@ -1,3 +1,10 @@
 from .worker import *
 from .dag import *
-from .log_tools import *
\ No newline at end of file
+from .log_tools import *
+from .telemetry import *
+from .queues import *
+from .affinity import *
+from .metrics import *
+from .arena import *
+from .fusion import *
+from .profiler import *
\ No newline at end of file
@@ -0,0 +1,192 @@
+import os
+from dataclasses import dataclass, field
+from typing import List, Dict, Set, Optional, Iterable, Tuple
+from .worker import WorkerNode
+
+SCHED_REALTIME = {getattr(os, 'SCHED_FIFO', 1), getattr(os, 'SCHED_RR', 2)}
+
+def parse_cpu_list(text: str) -> Set[int]:
+    '''parse kernel cpu lists such as "0-3,8,10-11"'''
+
+    cpus = set()
+    for part in text.strip().split(','):
+        if not part:
+            continue
+        if '-' in part:
+            first, last = part.split('-')
+            cpus.update(range(int(first), int(last)+1))
+        else:
+            cpus.add(int(part))
+    return cpus
+
+def read_file(path: str, default: str = '') -> str:
+    try:
+        with open(path, 'r') as f:
+            return f.read().strip()
+    except OSError:
+        return default
+
+@dataclass
+class Cpu:
+    cpu: int
+    package: int = 0
+    core: int = 0
+    numa_node: int = 0
+    l3: int = 0 # lowest cpu sharing the same L3 cache
+    isolated: bool = False
+
+class CpuTopology:
+    '''logical cpus grouped by physical core and L3 cache domain'''
+
+    def __init__(self, cpus: List[Cpu]) -> None:
+        self.cpus = {cpu.cpu: cpu for cpu in cpus}
+
+    @classmethod
+    def from_sysfs(cls, root: str = '/sys') -> 'CpuTopology':
+        '''read cores, SMT siblings, L3 domains, NUMA nodes and isolcpus from sysfs'''
+
+        cpu_dir = os.path.join(root, 'devices', 'system', 'cpu')
+        node_dir = os.path.join(root, 'devices', 'system', 'node')
+
+        online = parse_cpu_list(read_file(os.path.join(cpu_dir, 'online')))
+        if not online:
+            online = set(range(os.cpu_count() or 1))
+        isolated = parse_cpu_list(read_file(os.path.join(cpu_dir, 'isolated')))
+
+        numa = {}
+        if os.path.isdir(node_dir):
+            for entry in os.listdir(node_dir):
+                if entry.startswith('node') and entry[4:].isdigit():
+                    for cpu in parse_cpu_list(read_file(os.path.join(node_dir, entry, 'cpulist'))):
+                        numa[cpu] = int(entry[4:])
+
+        cpus = []
+        for n in sorted(online):
+            topology = os.path.join(cpu_dir, f'cpu{n}', 'topology')
+            package = int(read_file(os.path.join(topology, 'physical_package_id'), '0'))
+            core = int(read_file(os.path.join(topology, 'core_id'), str(n)))
+
+            l3 = None
+            cache = os.path.join(cpu_dir, f'cpu{n}', 'cache')
+            if os.path.isdir(cache):
+                for index in os.listdir(cache):
+                    if read_file(os.path.join(cache, index, 'level')) == '3':
+                        shared = parse_cpu_list(read_file(os.path.join(cache, index, 'shared_cpu_list')))
+                        l3 = min(shared) if shared else None
+
+            cpus.append(Cpu(
+                cpu = n,
+                package = package,
+                core = core,
+                numa_node = numa.get(n, 0),
+                l3 = package if l3 is None else l3,
+                isolated = n in isolated
+            ))
+
+        return cls(cpus)
+
+    def siblings(self, cpu: int) -> Set[int]:
+        '''logical cpus on the same physical core, including cpu'''
+        this = self.cpus[cpu]
+        return {c.cpu for c in self.cpus.values() if (c.package, c.core) == (this.package, this.core)}
+
+    def cores(self, cpus: Iterable[int]) -> List[Tuple[int, ...]]:
+        '''physical cores fully contained in cpus, as sorted tuples of sibling cpus'''
+        cpus = set(cpus)
+        cores = {tuple(sorted(self.siblings(cpu))) for cpu in cpus}
+        return sorted(core for core in cores if cpus.issuperset(core))
+
+    def l3_domains(self) -> Dict[int, Set[int]]:
+        domains = {}
+        for cpu in self.cpus.values():
+            domains.setdefault(cpu.l3, set()).add(cpu.cpu)
+        return domains
+
+    def __repr__(self) -> str:
+        return '\n'.join(
+            f'cpu {c.cpu}: package {c.package}, core {c.core}, numa {c.numa_node}, L3 {c.l3}' + (' (isolated)' if c.isolated else '')
+            for c in self.cpus.values()
+        )
+
+@dataclass
+class AffinityPlan:
+    affinity: Dict[str, Set[int]] = field(default_factory=dict)
+    reasons: Dict[str, str] = field(default_factory=dict)
+
+    def report(self) -> str:
+        return '\n'.join(
+            f'{name}: cpus {sorted(cpus)} ({self.reasons[name]})'
+            for name, cpus in self.affinity.items()
+        )
+
+def plan_affinity(
+        nodes: List[WorkerNode],
+        edges: List[Tuple[WorkerNode, WorkerNode]],
+        topology: CpuTopology
+    ) -> AffinityPlan:
+    '''
+    Assign cpus to nodes that don't have a hand-chosen cpu_affinity:
+        - real-time nodes (SCHED_FIFO / SCHED_RR) get a physical core of their own,
+          from isolated cpus if there are any,
+        - hot nodes get a physical core of their own; the SMT siblings are left idle,
+        - dedicated nodes that are connected by an edge share an L3 domain when possible,
+        - other nodes share the remaining cpus.
+    '''
+
+    plan = AffinityPlan()
+    free = set(topology.cpus)
+    for node in nodes:
+        if node.cpu_affinity is not None:
+            plan.affinity[node.name] = set(node.cpu_affinity)
+            plan.reasons[node.name] = 'hand-chosen'
+            free -= set(node.cpu_affinity)
+
+    to_plan = [node for node in nodes if node.cpu_affinity is None]
+    realtime = [node for node in to_plan if node.scheduler_policy in SCHED_REALTIME]
+    hot = [node for node in to_plan if node.hot and node not in realtime]
+
+    # connected groups of dedicated nodes, largest first
+    groups = []
+    for node in realtime + hot:
+        linked = [g for g in groups if any((node, other) in edges or (other, node) in edges for other in g)]
+        merged = [node] + [n for g in linked for n in g]
+        groups = [g for g in groups if g not in linked] + [merged]
+    groups.sort(key=len, reverse=True)
+
+    isolated = {cpu for cpu in free if topology.cpus[cpu].isolated}
+    domains = topology.l3_domains()
+
+    def take_core(pool: Set[int], domain: Optional[Set[int]]) -> Optional[Set[int]]:
+        candidates = pool & domain if domain is not None else pool
+        cores = topology.cores(candidates) or topology.cores(pool)
+        if cores:
+            cpu = cores[0][0]
+        elif pool:
+            cpu = min(candidates or pool) # e.g. isolcpus covering only one SMT thread
+        else:
+            return None
+        free.difference_update(topology.siblings(cpu))
+        return {cpu}
+
+    for group in groups:
+        # L3 domain with the most free physical cores
+        domain = max(domains.values(), key=lambda d: len(topology.cores(d & free)))
+        for node in sorted(group, key=lambda n: n not in realtime):
+            is_realtime = node in realtime
+            pool = (isolated & free) if (is_realtime and isolated & free) else (free - isolated)
+            cpus = take_core(pool, domain)
+            if cpus is None:
+                continue # no core left, share with light nodes
+            kind = 'real-time' if is_realtime else 'hot'
+            plan.affinity[node.name] = cpus
+            plan.reasons[node.name] = f'{kind}, dedicated core, L3 {topology.cpus[min(cpus)].l3}'
+
+    shared = free - isolated
+    if not shared:
+        shared = set(topology.cpus) - isolated or set(topology.cpus)
+    for node in to_plan:
+        if node.name not in plan.affinity:
+            plan.affinity[node.name] = set(shared)
+            plan.reasons[node.name] = 'shared'
+
+    return plan
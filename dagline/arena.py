@@ -0,0 +1,124 @@
+import numpy as np
+from numpy.typing import NDArray, DTypeLike
+from multiprocessing import RawArray, RawValue, Condition, Event
+from typing import NamedTuple, Optional, Tuple, Any, Callable, List, Dict
+import time
+
+# how often a blocked alloc checks whether the node was stopped
+ALLOC_WAIT_SLICE = 0.01
+
+class ArenaHandle(NamedTuple):
+    '''small picklable reference to a slot of a SharedArena, sent instead of the array'''
+    arena: str
+    slot: int
+
+class SharedArena:
+    '''
+    Fixed number of same-shape array slots in shared memory, with a reference count
+    per slot. A slot is allocated with a count of 1, every node it is sent to holds
+    one more reference, and it is recycled once everybody released it.
+    WorkerNode does the bookkeeping: see WorkerNode.alloc.
+    '''
+
+    def __init__(
+            self,
+            name: str,
+            num_slots: int,
+            item_shape: Tuple[int, ...],
+            data_type: DTypeLike
+        ) -> None:
+
+        self.name = name
+        self.num_slots = num_slots
+        self.item_shape = tuple(item_shape)
+        self.data_type = np.dtype(data_type)
+
+        item_size = int(np.prod(self.item_shape)) * self.data_type.itemsize
+        self.buffer = RawArray('B', num_slots * item_size)
+        self.refcount = RawArray('i', num_slots)
+        self.next_slot = RawValue('i', 0)
+        self.slot_freed = Condition()
+        self.array = np.frombuffer(self.buffer, dtype=self.data_type).reshape((num_slots,) + self.item_shape)
+
+    def __getstate__(self) -> Dict:
+        # the numpy view would be pickled as a copy, rebuild it on the shared buffer
+        state = self.__dict__.copy()
+        del state['array']
+        return state
+
+    def __setstate__(self, state: Dict) -> None:
+        self.__dict__.update(state)
+        self.array = np.frombuffer(self.buffer, dtype=self.data_type).reshape((self.num_slots,) + self.item_shape)
+
+    def alloc(
+            self, 
+            block: bool = True, 
+            timeout: Optional[float] = None, 
+            stop_event: Optional[Event] = None
+        ) -> Optional[ArenaHandle]:
+        '''reserve a free slot, None if there is none before timeout or stop_event is set'''
+
+        if timeout is None:
+            deadline = float('inf')
+        else:
+            deadline = time.monotonic() + timeout
+
+        with self.slot_freed:
+            while True:
+
+                start = self.next_slot.value
+                for i in range(self.num_slots):
+                    slot = (start + i) % self.num_slots
+                    if self.refcount[slot] == 0:
+                        self.refcount[slot] = 1
+                        self.next_slot.value = (slot + 1) % self.num_slots
+                        return ArenaHandle(self.name, slot)
+
+                now = time.monotonic()
+                if not block or now > deadline:
+                    return None
+                if stop_event is not None and stop_event.is_set():
+                    return None
+                # wait in slices to notice stop_event
+                self.slot_freed.wait(min(deadline - now, ALLOC_WAIT_SLICE))
+
+    def view(self, handle: ArenaHandle) -> NDArray:
+        return self.array[handle.slot]
+
+    def retain(self, handle: ArenaHandle, count: int = 1) -> None:
+        with self.slot_freed:
+            self.refcount[handle.slot] += count
+
+    def release(self, handle: ArenaHandle, count: int = 1) -> None:
+        with self.slot_freed:
+            self.refcount[handle.slot] = max(self.refcount[handle.slot] - count, 0)
+            if self.refcount[handle.slot] == 0:
+                self.slot_freed.notify_all()
+
+    def num_free(self) -> int:
+        return sum(1 for count in self.refcount if count == 0)
+
+def map_leaves(data: Any, func: Callable[[Any], Any]) -> Any:
+    '''replace every item of data by func(item), looking into tuples, lists and dicts. Handles are leaves'''
+
+    if isinstance(data, ArenaHandle):
+        return func(data)
+    if isinstance(data, dict):
+        return {key: map_leaves(value, func) for key, value in data.items()}
+    if isinstance(data, (list, tuple)):
+        items = [map_leaves(item, func) for item in data]
+        if hasattr(data, '_make'): # namedtuple
+            return data._make(items)
+        return type(data)(items)
+    return func(data)
+
+def find_handles(data: Any) -> List[ArenaHandle]:
+    '''handles in data, looking into tuples, lists and dicts'''
+
+    if isinstance(data, ArenaHandle):
+        return [data]
+    if isinstance(data, dict):
+        data = data.values()
+    elif not isinstance(data, (list, tuple)):
+        return []
+    return [handle for item in data for handle in find_handles(item)]
@@ -0,0 +1,305 @@
+'''
+Throughput / latency benchmarks on standard topologies.
+
+    python -m dagline.benchmark --duration 5 --output bench.json
+
+Every combination of topology, payload shape and queue type is run for a fixed
+duration. Results (throughput, latency percentiles, cpu use per node, drops) are
+written as a JSON list to compare releases.
+'''
+
+import argparse
+import json
+import platform
+import time
+from datetime import datetime
+from multiprocessing import RawArray, RawValue
+from typing import Any, Dict, List, Optional, Tuple, Callable
+
+import numpy as np
+from multiprocessing_logger import Logger
+
+from .worker import WorkerNode, receive_strategy, send_strategy, executor_type
+from .dag import ProcessingDAG
+from .queues import QueueSpec
+
+MAX_LATENCIES = 1_000_000
+
+class BenchStats:
+    '''per-node counters in shared memory, read by the parent after the run'''
+
+    def __init__(self) -> None:
+        self.items = RawValue('q', 0)
+        self.cpu_s = RawValue('d', 0)
+        self.latency_ns = RawArray('q', MAX_LATENCIES)
+
+    def record_latency(self, latency_ns: int) -> None:
+        index = self.items.value
+        if index < MAX_LATENCIES:
+            self.latency_ns[index] = latency_ns
+        self.items.value = index + 1
+
+    def latencies_ms(self) -> np.ndarray:
+        count = min(self.items.value, MAX_LATENCIES)
+        return np.frombuffer(self.latency_ns, dtype=np.int64, count=count) * 1e-6
+
+class BenchNode(WorkerNode):
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.stats = BenchStats()
+
+    def initialize(self) -> None:
+        super().initialize()
+        self.clock = time.thread_time if self.executor == executor_type.THREAD else time.process_time
+        self.cpu_start = self.clock()
+
+    def cleanup(self) -> None:
+        self.stats.cpu_s.value = self.clock() - self.cpu_start
+        super().cleanup()
+
+    def process_metadata(self, metadata):
+        return None
+
+class Source(BenchNode):
+    '''emits (sequence, perf_counter_ns, payload), optionally one per named output'''
+
+    def __init__(
+            self,
+            item_shape: Tuple[int, ...],
+            rate_hz: Optional[float] = None,
+            outputs: Optional[List[str]] = None,
+            *args, **kwargs
+        ) -> None:
+        super().__init__(*args, target_fps=rate_hz, **kwargs)
+        self.item_shape = item_shape
+        self.outputs = outputs
+
+    def initialize(self) -> None:
+        super().initialize()
+        self.payload = np.random.randint(0, 255, self.item_shape, dtype=np.uint8)
+
+    def output_sample(self):
+        return (0, 0, np.zeros(self.item_shape, dtype=np.uint8))
+
+    def process_data(self, data):
+        self.stats.items.value += 1
+        item = (self.iteration, time.perf_counter_ns(), self.payload)
+        if self.outputs is None:
+            return item
+        return {name: item for name in self.outputs}
+
+    def process_metadata(self, metadata):
+        return None # feedback is consumed, nothing to do with it
+
+class Relay(BenchNode):
+
+    def __init__(self, sample: Any = None, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.sample = sample
+
+    def output_sample(self):
+        return self.sample
+
+    def process_data(self, data):
+        if data is None:
+            return None
+        self.stats.items.value += 1
+        return data
+
+class Sink(BenchNode):
+    '''records the latency since the (oldest) source timestamp'''
+
+    def __init__(self, feedback: bool = False, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.feedback = feedback
+        self.last = None
+        self.last_sent = None
+
+    def process_data(self, data):
+        now = time.perf_counter_ns()
+        if isinstance(data, dict):
+            items = [item for item in data.values() if item is not None]
+            if not items:
+                return None
+            origin = min(item[1] for item in items)
+            self.last = items[0][0]
+        elif data is not None:
+            origin = data[1]
+            self.last = data[0]
+        else:
+            return None
+        self.stats.record_latency(now - origin)
+
+    def process_metadata(self, metadata):
+        if self.feedback and self.last != self.last_sent:
+            self.last_sent = self.last
+            return {'feedback': self.last}
+
+def build_topology(
+        topology: str,
+        make_node: Callable,
+        item_shape: Tuple[int, ...],
+        rate_hz: Optional[float],
+        spec: Optional[QueueSpec]
+    ) -> Tuple[ProcessingDAG, List[BenchNode], List[BenchNode], List[BenchNode]]:
+    '''return the dag, its sources, all nodes and its sinks'''
+
+    dag = ProcessingDAG()
+    sample = (0, 0, np.zeros(item_shape, dtype=np.uint8)) # what sources and relays send
+
+    if topology == 'chain':
+        source = make_node(Source, 'source', item_shape=item_shape, rate_hz=rate_hz)
+        relay = make_node(Relay, 'relay', sample=sample)
+        sink = make_node(Sink, 'sink')
+        dag.connect_data(source, relay, spec, 'source->relay')
+        dag.connect_data(relay, sink, spec, 'relay->sink')
+        sources, sinks = [source], [sink]
+
+    elif topology == 'fan_out':
+        source = make_node(Source, 'source', item_shape=item_shape, rate_hz=rate_hz, send_data_strategy=send_strategy.DISPATCH)
+        sink = make_node(Sink, 'sink')
+        for index in range(2):
+            worker = make_node(Relay, f'worker_{index}', sample=sample)
+            dag.connect_data(source, worker, spec, f'source->worker_{index}')
+            dag.connect_data(worker, sink, spec, f'worker_{index}->sink')
+        sources, sinks = [source], [sink]
+
+    elif topology == 'fan_in':
+        sink = make_node(Sink, 'sink', receive_data_strategy=receive_strategy.POLL)
+        sources = []
+        for index in range(2):
+            source = make_node(Source, f'source_{index}', item_shape=item_shape, rate_hz=rate_hz)
+            dag.connect_data(source, sink, spec, f'source_{index}->sink')
+            sources.append(source)
+        sinks = [sink]
+
+    elif topology == 'collect':
+        sink = make_node(Sink, 'sink', receive_data_strategy=receive_strategy.COLLECT)
+        sources = []
+        for index in range(2):
+            source = make_node(Source, f'source_{index}', item_shape=item_shape, rate_hz=rate_hz)
+            dag.connect_data(source, sink, spec, f'source_{index}')
+            sources.append(source)
+        sinks = [sink]
+
+    elif topology == 'diamond':
+        source = make_node(
+            Source, 'source', item_shape=item_shape, rate_hz=rate_hz,
+            outputs=['left', 'right'], send_data_strategy=send_strategy.BROADCAST
+        )
+        sink = make_node(Sink, 'sink', receive_data_strategy=receive_strategy.COLLECT)
+        for branch in ['left', 'right']:
+            relay = make_node(Relay, branch, sample=sample)
+            dag.connect_data(source, relay, spec, branch)
+            dag.connect_data(relay, sink, spec, f'{branch}->sink')
+        sources, sinks = [source], [sink]
+
+    elif topology == 'metadata_loop':
+        source = make_node(Source, 'source', item_shape=item_shape, rate_hz=rate_hz)
+        sink = make_node(Sink, 'sink', feedback=True)
+        dag.connect_data(source, sink, spec, 'source->sink')
+        dag.connect_metadata(sink, source, None, 'feedback')
+        sources, sinks = [source], [sink]
+
+    else:
+        raise ValueError(f'unknown topology {topology}')
+
+    return dag, sources, dag.nodes, sinks
+
+TOPOLOGIES = ['chain', 'fan_out', 'fan_in', 'collect', 'diamond', 'metadata_loop']
+QUEUES = ['QueueMP', 'ObjectRingBuffer2', 'LocalQueue']
+SHAPES = [(64, 64), (512, 512), (2048, 2048)]
+
+def run_benchmark(
+        topology: str,
+        item_shape: Tuple[int, ...],
+        queue_type: str,
+        duration_s: float = 5.0,
+        rate_hz: Optional[float] = None
+    ) -> Dict:
+
+    logger = Logger('benchmark.log', Logger.ERROR)
+    executor = executor_type.THREAD if queue_type == 'LocalQueue' else executor_type.PROCESS
+
+    # ObjectRingBuffer2: layout from the source's (sequence, timestamp, payload) output_sample, 
+    # QueueMP/LocalQueue: default queue
+    spec = QueueSpec(num_items = 100) if queue_type == 'ObjectRingBuffer2' else None
+
+    def make_node(cls, name, **kwargs):
+        return cls(
+            name = name,
+            logger = logger,
+            logger_queues = logger,
+            executor = executor,
+            timing_log = False,
+            receive_data_timeout = 1.0,
+            **kwargs
+        )
+
+    dag, sources, nodes, sinks = build_topology(topology, make_node, item_shape, rate_hz, spec)
+
+    dag.start()
+    start = time.monotonic()
+    time.sleep(duration_s)
+    received = sum(sink.stats.items.value for sink in sinks)
+    elapsed = time.monotonic() - start
+    dropped = dag.drop_counts()
+    dag.stop(drain_timeout = 0.5)
+
+    queues = {name: type(queue).__name__ for sender, receiver, queue, name in dag.data_edges}
+
+    sent = sum(source.stats.items.value for source in sources)
+    latencies = np.concatenate([sink.stats.latencies_ms() for sink in sinks])
+    percentiles = np.percentile(latencies, [50, 99, 99.9]) if len(latencies) else [None]*3
+
+    return {
+        'topology': topology,
+        'item_shape': list(item_shape),
+        'queue': queue_type,
+        'queue_types': sorted(set(queues.values())),
+        'duration_s': elapsed,
+        'rate_hz': rate_hz,
+        'sent': sent,
+        'received': received,
+        'throughput_hz': received / elapsed,
+        'latency_ms': dict(zip(['p50', 'p99', 'p99.9'], map(lambda p: None if p is None else float(p), percentiles))),
+        'cpu_percent': {node.name: 100 * node.stats.cpu_s.value / elapsed for node in nodes},
+        'items': {node.name: node.stats.items.value for node in nodes},
+        'dropped': {name: dropped.get(name, 0) for name in queues},
+    }
+
+def main(argv: Optional[List[str]] = None) -> List[Dict]:
+
+    parser = argparse.ArgumentParser(description = 'dagline topology benchmarks')
+    parser.add_argument('--topologies', nargs = '+', default = TOPOLOGIES, choices = TOPOLOGIES)
+    parser.add_argument('--queues', nargs = '+', default = QUEUES, choices = QUEUES)
+    parser.add_argument('--shapes', nargs = '+', default = ['x'.join(map(str, s)) for s in SHAPES], help = 'e.g. 512x512')
+    parser.add_argument('--duration', type = float, default = 5.0, help = 'seconds per run')
+    parser.add_argument('--rate', type = float, default = None, help = 'source rate (Hz), as fast as possible by default')
+    parser.add_argument('--output', default = 'benchmark.json')
+    args = parser.parse_args(argv)
+
+    results = []
+    for topology in args.topologies:
+        for shape in args.shapes:
+            item_shape = tuple(int(x) for x in shape.split('x'))
+            for queue_type in args.queues:
+                print(f'{topology} {shape} {queue_type}')
+                result = run_benchmark(topology, item_shape, queue_type, args.duration, args.rate)
+                print(f"    {result['throughput_hz']:.1f} Hz, latency p50 {result['latency_ms']['p50']} ms")
+                results.append(result)
+
+    report = {
+        'date': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent = 2)
+
+    return results
+
+if __name__ == '__main__':
+    main()
@@ -1,22 +1,113 @@
-from .worker import WorkerNode
-from ipc_tools import QueueLike, MonitoredQueue, ModifiableRingBuffer
+from .worker import WorkerNode, executor_type, send_strategy, receive_strategy, ReorderBuffer, OverflowPolicy, queue_load
+from .queues import LocalQueue, QueueSpec, queue_capacity
+from .affinity import CpuTopology, AffinityPlan, plan_affinity
+from .arena import SharedArena
+from .fusion import FusedNode
+from .profiler import merge_collapsed
+from .metrics import MeteredQueue, NodeMetrics, MetricsReader, prometheus_text, serve_metrics
+from ipc_tools import QueueLike, MonitoredQueue, ModifiableRingBuffer, QueueMP
 from multiprocessing import Barrier
+from typing import Any, Optional, Callable, List, Dict, Tuple, Union
+from numpy.typing import DTypeLike
+from dataclasses import dataclass, replace
+import time
+
+def same_process(sender: WorkerNode, receiver: WorkerNode) -> bool:
+    '''thread nodes all run in the parent process'''
+    return sender.executor == executor_type.THREAD and receiver.executor == executor_type.THREAD
+
+def default_queue(
+        sender: WorkerNode, 
+        receiver: WorkerNode, 
+        spec: Optional[QueueSpec], 
+        name: str, 
+        metadata: bool = False
+    ) -> QueueLike:
+    '''
+    Pass references in memory when possible. Otherwise build a queue from the spec, 
+    using the sender's output sample if the spec doesn't describe data items,
+    or pickle through a multiprocessing queue. output_sample describes data only: 
+    metadata specs without a layout pickle.
+    '''
+
+    if same_process(sender, receiver) and not (spec is not None and spec.conflate):
+        return LocalQueue()
+    
+    if spec is None:
+        return QueueMP()
+    
+    if spec.sample is None and spec.item_shape is None and not metadata:
+        spec = replace(spec, sample = sender.output_sample())
+    return spec.build(name)
+
+@dataclass
+class DrainStats:
+    waiting: int = 0 # items in the input queues when upstream nodes were stopped
+    remaining: int = 0 # items left when the node was stopped
+    duration_s: float = 0
+
+    @property
+    def drained(self) -> int:
+        return self.waiting - self.remaining
+
+@dataclass
+class StartupStats:
+    initialize_s: float = 0
+    warmup_s: float = 0
+    ready_s: Optional[float] = None # since the launch, None if the node didn't get ready
+
+@dataclass
+class ControlStats:
+    commands: int = 0
+    mean_latency_ms: Optional[float] = None # from send_control to process_control
+    max_latency_ms: Optional[float] = None
 
 class ProcessingDAG():
 
-    def __init__(self):
+    def __init__(self, metrics: bool = False):
+        '''with metrics=True, queues are wrapped to count traffic and nodes publish stage durations'''
         self.nodes = []
         self.data_edges = []
         self.metadata_edges = []
         self.running = False
+        self.metrics = metrics
+        self.edge_metrics = {}
+        self.metrics_reader = MetricsReader()
+        self.arenas = {}
 
     def add_node(self, node: WorkerNode):
         '''add isolated node'''
         self.nodes.append(node)
 
-    def connect_data(self, sender: WorkerNode, receiver: WorkerNode, queue: QueueLike, name: str):
-        sender.register_send_data_queue(queue, name)
-        receiver.register_receive_data_queue(queue, name)
+    def connect_data(
+            self, 
+            sender: WorkerNode, 
+            receiver: WorkerNode, 
+            queue: Union[QueueLike, QueueSpec, None] = None, 
+            name: Optional[str] = None,
+            overflow: Optional[OverflowPolicy] = None
+        ):
+        '''
+        If queue is None or a QueueSpec, create one suited to the items and to where sender and receiver run.
+        overflow says what the sender does when the queue is full, by default it follows send_data_block/timeout.
+        '''
+
+        if name is None:
+            name = f'{sender.name}->{receiver.name}'
+        self.check_edge_name(name)
+
+        if queue is None or isinstance(queue, QueueSpec):
+            queue = default_queue(sender, receiver, queue, name)
+
+        if self.metrics:
+            queue = MeteredQueue(queue)
+            self.edge_metrics[name] = queue
+
+        if overflow is not None:
+            sender.send_data_overflow[name] = overflow
+
+        sender.register_send_data_queue(queue, name, receiver.receive_data_ready)
+        receiver.register_receive_data_queue(queue, name, sender.send_data_space)
 
         if sender not in self.nodes:
             self.nodes.append(sender)
@@ -26,9 +117,37 @@ class ProcessingDAG():
 
         self.data_edges.append((sender, receiver, queue, name))
 
-    def connect_metadata(self, sender: WorkerNode, receiver: WorkerNode, queue: QueueLike, name: str):
-        sender.register_send_metadata_queue(queue, name)
-        receiver.register_receive_metadata_queue(queue, name)
+    def check_edge_name(self, name: str) -> None:
+        '''edge names key metrics, drop counters and collected items: they must be unique'''
+        for edges in [self.data_edges, self.metadata_edges]:
+            if any(edge_name == name for sender, receiver, queue, edge_name in edges):
+                raise ValueError(f'an edge named {name} already exists')
+
+    def connect_metadata(
+            self, 
+            sender: WorkerNode, 
+            receiver: WorkerNode, 
+            queue: Union[QueueLike, QueueSpec, None] = None, 
+            name: Optional[str] = None
+        ):
+        '''
+        If queue is None or a QueueSpec, create one suited to the items and to where sender and receiver run.
+        The default name, sender->receiver:metadata, doesn't clash with a data edge between the same nodes.
+        '''
+
+        if name is None:
+            name = f'{sender.name}->{receiver.name}:metadata'
+        self.check_edge_name(name)
+
+        if queue is None or isinstance(queue, QueueSpec):
+            queue = default_queue(sender, receiver, queue, name, metadata = True)
+
+        if self.metrics:
+            queue = MeteredQueue(queue)
+            self.edge_metrics[name] = queue
+
+        sender.register_send_metadata_queue(queue, name, receiver.receive_metadata_ready)
+        receiver.register_receive_metadata_queue(queue, name, sender.send_metadata_space)
 
         if sender not in self.nodes:
             self.nodes.append(sender)
@@ -38,36 +157,378 @@ class ProcessingDAG():
 
         self.metadata_edges.append((sender, receiver, queue, name))
 
-    def start(self):
+    def connect_replicated(
+            self,
+            sender: WorkerNode,
+            receiver: WorkerNode,
+            node_factory: Callable[[int], WorkerNode],
+            num_replicas: int,
+            queue_factory: Optional[Callable[[], QueueLike]] = None,
+            name: Optional[str] = None,
+            reorder_timeout: float = 1.0,
+            reorder_capacity: int = 1000
+        ) -> List[WorkerNode]:
+        '''
+        Insert a stage of num_replicas nodes built by node_factory(replica_index) between 
+        sender and receiver. The sender dispatches numbered items to the replicas and the 
+        receiver gets the results back in order: a missing item is skipped after 
+        reorder_timeout seconds or when reorder_capacity items are waiting.
+        Replicas must return one item (or None) per item received, and a Batch of as 
+        many items (or None) per Batch received.
+        Edges must carry python objects. The sender must DISPATCH and the receiver POLL.
+        '''
+
+        if name is None:
+            name = f'{sender.name}->{receiver.name}'
+
+        if sender.send_data_strategy != send_strategy.DISPATCH:
+            raise ValueError(f'{name}: the sender of a replicated stage must use send_strategy.DISPATCH')
+        if receiver.receive_data_strategy != receive_strategy.POLL or receiver.receive_data_aligner is not None:
+            raise ValueError(f'{name}: the receiver of a replicated stage must use receive_strategy.POLL without aligner')
+        if receiver.reorder is not None:
+            raise ValueError(f'{name}: {receiver.name} already receives from a replicated stage')
+
+        sender.send_data_sequence = True
+        receiver.reorder = ReorderBuffer(reorder_timeout, reorder_capacity)
+
+        replicas = []
+        for index in range(num_replicas):
+            replica = node_factory(index)
+            self.connect_data(sender, replica, queue_factory() if queue_factory else None, f'{name}_in_{index}')
+            self.connect_data(replica, receiver, queue_factory() if queue_factory else None, f'{name}_out_{index}')
+            replicas.append(replica)
+
+        return replicas
+
+    def logical_nodes(self) -> List[WorkerNode]:
+        '''nodes, followed by the nodes they fuse'''
+        nodes = []
+        for node in self.nodes:
+            nodes.append(node)
+            if isinstance(node, FusedNode):
+                nodes.extend(node.nodes)
+        return nodes
+
+    def replace_event(self, old, new) -> None:
+        '''make senders and receivers signal new instead of old'''
+        for node in self.logical_nodes():
+            for events in [node.receive_data_space, node.send_data_ready, node.receive_metadata_space, node.send_metadata_ready]:
+                for index, event in enumerate(events):
+                    if event is old:
+                        events[index] = new
+
+    def fuse(self, nodes: List[WorkerNode], name: Optional[str] = None) -> FusedNode:
+        '''
+        Run a linear chain of nodes in a single process, passing objects directly 
+        from one process_data to the next, see FusedNode. Each node but the last must
+        send data only to the next one, which must receive data only from it.
+        Call after connecting the nodes and before start().
+        '''
+
+        if len(nodes) < 2:
+            raise ValueError('fuse needs at least two nodes')
+
+        for node in nodes:
+            if node not in self.nodes:
+                raise ValueError(f'{node.name} is not a node of the DAG')
+
+        for sender, receiver in zip(nodes[:-1], nodes[1:]):
+            outputs = [r for s, r, queue, name in self.data_edges if s is sender]
+            inputs = [s for s, r, queue, name in self.data_edges if r is receiver]
+            if outputs != [receiver] or inputs != [sender]:
+                raise ValueError(f'{sender.name} -> {receiver.name} is not a simple chain link')
+            if sender.send_data_sequence or receiver.reorder is not None:
+                raise ValueError(f'{sender.name} -> {receiver.name} is a replicated stage')
+
+        fused = FusedNode(nodes, name)
+        head, tail = nodes[0], nodes[-1]
+
+        self.replace_event(head.receive_data_ready, fused.receive_data_ready)
+        self.replace_event(tail.send_data_space, fused.send_data_space)
+        for node in nodes:
+            self.replace_event(node.receive_metadata_ready, fused.receive_metadata_ready)
+            self.replace_event(node.send_metadata_space, fused.send_metadata_space)
+            node.receive_metadata_ready = fused.receive_metadata_ready
+            node.send_metadata_space = fused.send_metadata_space
+            # commands sent to inner nodes wake the fused node
+            node.control_ready = fused.control_ready
+            node.receive_data_ready = fused.receive_data_ready
+
+        def rename(node: WorkerNode) -> WorkerNode:
+            return fused if node in nodes else node
+
+        # edges between fused nodes disappear
+        for sender, receiver, queue, name in self.data_edges:
+            if sender in nodes and receiver in nodes:
+                self.edge_metrics.pop(name, None)
+
+        self.data_edges = [
+            (rename(sender), rename(receiver), queue, name) 
+            for sender, receiver, queue, name in self.data_edges
+            if not (sender in nodes and receiver in nodes)
+        ]
+        self.metadata_edges = [
+            (rename(sender), rename(receiver), queue, name) 
+            for sender, receiver, queue, name in self.metadata_edges
+        ]
+
+        index = len([node for node in self.nodes[:self.nodes.index(head)] if node not in nodes])
+        self.nodes = [node for node in self.nodes if node not in nodes]
+        self.nodes.insert(index, fused)
+
+        return fused
+
+    def auto_fuse(self) -> List[FusedNode]:
+        '''fuse every chain of two or more connected nodes marked fusible'''
+
+        def link(sender: WorkerNode, receiver: WorkerNode) -> bool:
+            outputs = [r for s, r, queue, name in self.data_edges if s is sender]
+            inputs = [s for s, r, queue, name in self.data_edges if r is receiver]
+            return (
+                sender.fusible and receiver.fusible 
+                and outputs == [receiver] and inputs == [sender]
+                and not sender.send_data_sequence and receiver.reorder is None
+            )
+
+        chains = []
+        for node in self.topological_order():
+            if not node.fusible or isinstance(node, FusedNode):
+                continue
+            for chain in chains:
+                if link(chain[-1], node):
+                    chain.append(node)
+                    break
+            else:
+                chains.append([node])
+
+        return [self.fuse(chain) for chain in chains if len(chain) > 1]
+
+    def plan_affinity(self, topology: Optional[CpuTopology] = None, apply: bool = True) -> AffinityPlan:
+        '''choose cpu_affinity for the nodes that don't have one, see affinity.plan_affinity'''
+
+        if topology is None:
+            topology = CpuTopology.from_sysfs()
+
+        edges = [(sender, receiver) for sender, receiver, queue, name in self.data_edges + self.metadata_edges]
+        plan = plan_affinity(self.nodes, edges, topology)
+
+        if apply:
+            for node in self.nodes:
+                node.cpu_affinity = plan.affinity[node.name]
+        
+        print(plan.report())
+        return plan
+
+    def create_arena(
+            self, 
+            name: str, 
+            num_slots: int, 
+            item_shape: Tuple[int, ...], 
+            data_type: DTypeLike
+        ) -> SharedArena:
+        '''shared-memory slots for large arrays, nodes get one with self.alloc(name)'''
+
+        arena = SharedArena(name, num_slots, item_shape, data_type)
+        self.arenas[name] = arena
+        return arena
+
+    def suggest_capacities(self, latency_budget_s: float = 0.1) -> Dict[str, int]:
+        '''queue sizes for the rates measured since the previous get_metrics() call, requires metrics=True'''
+
+        edges = self.get_metrics()['edges']
+        return {
+            name: queue_capacity(stats['enqueue_rate_hz'], stats['dequeue_rate_hz'], latency_budget_s)
+            for name, stats in edges.items()
+        }
+
+    def drop_counts(self) -> Dict[str, int]:
+        '''items dropped by senders per edge, see OverflowPolicy'''
+        drops = {}
+        for node in self.logical_nodes():
+            drops.update(node.drop_counts())
+        return drops
+
+    def drop_counters(self) -> Dict:
+        drops = {}
+        for node in self.logical_nodes():
+            drops.update(node.drops)
+        return drops
+
+    def send_control(self, node: Union[WorkerNode, str], command: str, value: Any = None) -> None:
+        '''send a command on the control lane of a node (or node name), see WorkerNode.send_control'''
+        if isinstance(node, str):
+            nodes = {n.name: n for n in self.logical_nodes()}
+            if node not in nodes:
+                raise ValueError(f'unknown node {node}')
+            node = nodes[node]
+        node.send_control(command, value)
+
+    def control_stats(self) -> Dict[str, ControlStats]:
+        '''number of control commands handled by each node and how long they waited'''
+        stats = {}
+        for node in self.logical_nodes():
+            commands, total_ns, max_ns = node.control_latency_ns[:]
+            if commands:
+                stats[node.name] = ControlStats(commands, total_ns / commands * 1e-6, max_ns * 1e-6)
+            else:
+                stats[node.name] = ControlStats()
+        return stats
+
+    def node_metrics(self) -> Dict[str, NodeMetrics]:
+        return {node.name: node.node_metrics for node in self.logical_nodes() if node.node_metrics is not None}
+
+    def get_metrics(self) -> Dict:
+        '''live node and edge counters, rates are computed since the previous call'''
+        return self.metrics_reader.snapshot(self.node_metrics(), self.edge_metrics, self.drop_counters())
+    
+    def get_metrics_text(self) -> str:
+        return prometheus_text(self.node_metrics(), self.edge_metrics, self.drop_counters())
+
+    def serve_metrics(self, port: int = 9100, host: str = '127.0.0.1'):
+        '''expose the metrics over http in Prometheus text format, call after start()'''
+        return serve_metrics(self.node_metrics(), self.edge_metrics, port, host, self.drop_counters())
+
+    def merge_profiles(self, filename: str = 'dag.collapsed') -> Dict[str, int]:
+        '''
+        After stop(), merge the <name>.collapsed stacks dumped by nodes profiled with 
+        profiler_type.SAMPLING into one file, under a root frame per node. 
+        Render with flamegraph.pl or speedscope. Return the number of samples per node.
+        '''
+        files = {node.name: node.name + '.collapsed' for node in self.nodes}
+        total, samples = merge_collapsed(files, filename)
+        print(f'{total} samples from {len(samples)} nodes written to {filename}')
+        return samples
+
+    def enable_tracing(self):
+        '''attach a trace context to data items, sink nodes log end-to-end latency'''
+        for node in self.nodes:
+            node.trace = True
+
+    def topological_order(self) -> List[WorkerNode]:
+        '''nodes from sources to sinks along data edges. Nodes on a cycle come last, in insertion order'''
+
+        num_inputs = {node: 0 for node in self.nodes}
+        for sender, receiver, queue, name in self.data_edges:
+            num_inputs[receiver] += 1
+
+        order = []
+        ready = [node for node in self.nodes if num_inputs[node] == 0]
+        while ready:
+            node = ready.pop(0)
+            order.append(node)
+            for sender, receiver, queue, name in self.data_edges:
+                if sender is node:
+                    num_inputs[receiver] -= 1
+                    if num_inputs[receiver] == 0:
+                        ready.append(receiver)
+
+        order += [node for node in self.nodes if node not in order]
+        return order
+
+    def start(self, timeout: Optional[float] = None) -> Dict[str, StartupStats]:
+        '''
+        Launch all nodes, which initialize and warm up concurrently, then release them 
+        together. If some nodes are not ready after timeout seconds, the DAG is killed 
+        and a TimeoutError names them.
+        '''
 
         self.running = True
 
         barrier = Barrier(len(self.nodes)+1)
 
         for node in self.nodes:
+            node.arenas.update(self.arenas)
+
+        if self.metrics:
+            for node in self.logical_nodes():
+                if node.node_metrics is None:
+                    node.node_metrics = NodeMetrics()
+
+        # consumers first so that they are ready when data comes in
+        launch = time.monotonic_ns()
+        for node in reversed(self.topological_order()):
             node.set_barrier(barrier)
             print(f'starting node {node.name}')
             node.start()
 
+        startup = self.wait_ready(launch, timeout)
+        not_ready = [name for name, stats in startup.items() if stats.ready_s is None]
+        if not_ready:
+            barrier.abort() # nodes already waiting exit without running
+            self.kill()
+            raise TimeoutError(f'nodes not ready after {timeout}s: {", ".join(not_ready)}')
+
         barrier.wait()
         
         print('dag started')
+        return startup
 
-    def stop(self):
-        # ask everyone to stop
-        for node in self.nodes:
+    def wait_ready(self, launch: int, timeout: Optional[float]) -> Dict[str, StartupStats]:
+        '''wait until nodes are initialized and warmed up, print their startup durations as they arrive'''
+
+        deadline = float('inf') if timeout is None else time.monotonic() + timeout
+        startup = {node.name: StartupStats() for node in self.nodes}
+        pending = list(self.nodes)
+
+        while pending and time.monotonic() < deadline:
+            pending[0].ready.wait(0.01)
+            for node in [node for node in pending if node.ready.is_set()]:
+                pending.remove(node)
+                initialize_ns, warmup_ns, ready_ns = node.startup_ns
+                stats = StartupStats(initialize_ns*1e-9, warmup_ns*1e-9, (ready_ns - launch)*1e-9)
+                startup[node.name] = stats
+                print(f'{node.name} ready after {stats.ready_s:.3f}s: initialize {stats.initialize_s:.3f}s, warmup {stats.warmup_s:.3f}s')
+
+        return startup
+
+    def drain(self, node: WorkerNode, timeout: float) -> DrainStats:
+        '''wait until the node has consumed its input data queues, or timeout'''
+
+        inputs = [queue for sender, receiver, queue, name in self.data_edges if receiver is node]
+        waiting = sum(queue_load(queue) for queue in inputs)
+        
+        start = time.monotonic()
+        deadline = start + timeout
+        remaining = waiting
+        while remaining > 0 and time.monotonic() < deadline:
+            time.sleep(0.001)
+            remaining = sum(queue_load(queue) for queue in inputs)
+
+        return DrainStats(waiting, remaining, time.monotonic() - start)
+
+    def stop(self, drain_timeout: float = 1.0) -> Dict[str, DrainStats]:
+        '''
+        Stop nodes from sources to sinks. Each node is given up to drain_timeout 
+        seconds to consume what its (already stopped) upstream nodes left in the 
+        queues before being stopped itself. Processes keep flushing their queues
+        until they exit, so they are only joined once all nodes are stopped:
+        a node still running after drain_timeout is killed.
+        '''
+
+        drain_stats = {}
+        for node in self.topological_order():
+            drain_stats[node.name] = self.drain(node, drain_timeout)
             print(f'stopping node {node.name}')
             node.stop()
+            # its last items must be in the queues before the next node drains them
+            node.stopped.wait(drain_timeout)
 
-        # make sure everyone is done and cleaned up
-        for node in self.nodes:
-            node.join()
+        for node in self.topological_order():
+            node.join(drain_timeout)
+            if node.process.is_alive():
+                node.kill()
 
         self.running = False
         print('dag stopped')
 
+        for name, stats in drain_stats.items():
+            if stats.waiting > 0:
+                print(f"Node: {name}, drained: {stats.drained}/{stats.waiting} in {stats.duration_s:.3f}s, lost: {stats.remaining}")
+
         # display stats
         for sender, receiver, queue, name in self.data_edges:
+            if isinstance(queue, MeteredQueue):
+                queue = queue.queue
             if isinstance(queue, MonitoredQueue):
                 base_queue = queue.queue
                 if isinstance(base_queue, ModifiableRingBuffer):
@@ -75,10 +536,10 @@ class ProcessingDAG():
                 else:
                     print(f"Name: {name}, freq: {queue.get_average_freq()}")
 
+        return drain_stats
 
     def kill(self):
-        # TODO stop from root to leave
-        for node in self.nodes:
+        for node in self.topological_order():
             print(f'killing node {node.name}')
             node.kill()
 
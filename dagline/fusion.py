@@ -0,0 +1,187 @@
+from typing import Any, List, Optional
+import time
+from .worker import WorkerNode, Timing, Batch, executor_type
+
+RECEIVE_DATA, PROCESS_DATA, SEND_DATA, RECEIVE_METADATA, PROCESS_METADATA, SEND_METADATA = range(6)
+
+# copied from the first node of the chain
+RECEIVE_ATTRIBUTES = [
+    'receive_data_queues', 'receive_data_queue_names', 'receive_data_space', 'receive_data_queues_iterator',
+    'receive_data_block', 'receive_data_timeout', 'receive_data_strategy', 'receive_data_spin_time',
+    'receive_data_batch_size', 'receive_data_batch_timeout', 'receive_data_aligner',
+    'receive_data_collect_mode', 'receive_data_collect_count', 'reorder',
+    'cpu_affinity', 'scheduler_policy', 'process_priority', 'profile', 'profiler_type', 'profile_interval', 'disable_gc', 'executor', 'trace',
+    'metadata_schedule', 'metadata_period', 'target_fps', 'overrun_policy', 'pacing_spin_time'
+]
+
+# copied from the last node of the chain
+SEND_ATTRIBUTES = [
+    'send_data_queues', 'send_data_queue_names', 'send_data_ready', 'send_data_queues_iterator',
+    'send_data_block', 'send_data_timeout', 'send_data_strategy', 'send_data_dispatch_policy',
+    'send_data_sequence', 'send_data_overflow', 'overflow_congested', 'drops'
+]
+
+class FusedNode(WorkerNode):
+    '''
+    Run a linear chain of nodes in one process: the first node's inputs are received,
+    each process_data result is passed directly to the next node, and the last node's
+    result is sent. Built by ProcessingDAG.fuse, which also rewires the edges.
+
+    Inner nodes keep their own metadata queues, serviced in the fused metadata stage,
+    their own control lanes, serviced between the fused stages,
+    and their own timing log / ring / metrics: each one records its process_data and
+    metadata durations, the first one the receive time and the last one the send time.
+    Inner nodes stop running as nodes of their own: their process settings (affinity,
+    scheduler, profiling, gc) are replaced by the first node's.
+    '''
+
+    def __init__(self, nodes: List[WorkerNode], name: Optional[str] = None) -> None:
+
+        head, tail = nodes[0], nodes[-1]
+
+        super().__init__(
+            name = name or '+'.join(node.name for node in nodes),
+            logger = head.logger,
+            logger_queues = head.logger_queues,
+            log_level = head.log_level,
+            hot = any(node.hot for node in nodes),
+            warmup_iterations = max(node.warmup_iterations for node in nodes),
+            timing_log = False # inner nodes log their own timings
+        )
+
+        for attr in RECEIVE_ATTRIBUTES:
+            setattr(self, attr, getattr(head, attr))
+
+        for attr in SEND_ATTRIBUTES:
+            setattr(self, attr, getattr(tail, attr))
+
+        self.nodes = nodes
+        self.stage_ns = [[0] * 6 for node in nodes]
+        self.control_interrupt = any(node.control_interrupt for node in nodes)
+
+        for node in nodes:
+            # inner nodes run inside this node's process, like threads
+            node.stop_event = self.stop_event
+            node.executor = executor_type.THREAD
+            node.cpu_affinity = None
+            node.scheduler_policy = 0
+            node.profile = False
+            node.disable_gc = False
+
+    def initialize(self) -> None:
+        super().initialize()
+        for node in self.nodes:
+            # slots allocated by inner nodes are sent and released by the fused node
+            node.arenas = self.arenas
+            node.arena_views = self.arena_views
+            node.initialize()
+
+    def warmup(self) -> None:
+        super().warmup()
+        for durations in self.stage_ns:
+            durations[:] = [0] * 6
+
+    def cleanup(self) -> None:
+        for node in self.nodes:
+            node.cleanup()
+        super().cleanup()
+
+    def kill(self) -> None:
+        for node in self.nodes:
+            for q in node.send_metadata_queues:
+                q.cancel_join_thread()
+        super().kill()
+
+    def handle_control(self) -> None:
+        super().handle_control()
+        for node in self.nodes:
+            node.drain_control()
+
+    def output_sample(self) -> Optional[Any]:
+        return self.nodes[-1].output_sample()
+
+    def on_overflow(self, name: str, item: Any) -> Optional[Any]:
+        return self.nodes[-1].on_overflow(name, item)
+
+    def process_data(self, data: Any) -> Any:
+        return self.run_chain(0, data)
+
+    def run_chain(self, first: int, data: Any) -> Any:
+        '''pass data through the nodes from index first, item by item for batches'''
+
+        for index in range(first, len(self.nodes)):
+
+            if index > first and data is None:
+                return None
+
+            if index > first and isinstance(data, Batch):
+                results = Batch()
+                for item in data:
+                    result = self.run_chain(index, item)
+                    if isinstance(result, Batch):
+                        results.extend(result)
+                    elif result is not None:
+                        results.append(result)
+                return results or None
+
+            node = self.nodes[index]
+            node.iteration = self.iteration
+            start = time.monotonic_ns()
+            data = node.process_data(data)
+            self.stage_ns[index][PROCESS_DATA] += time.monotonic_ns() - start
+
+        return data
+
+    def has_metadata(self) -> bool:
+        return any(node.has_metadata() for node in self.nodes)
+
+    def receive_metadata(self) -> List[Any]:
+        metadata = []
+        for index, node in enumerate(self.nodes):
+            start = time.monotonic_ns()
+            metadata.append(node.receive_metadata() if node.has_metadata() else None)
+            self.stage_ns[index][RECEIVE_METADATA] += time.monotonic_ns() - start
+        return metadata
+
+    def process_metadata(self, metadata: List[Any]) -> List[Any]:
+        results = []
+        for index, (node, item) in enumerate(zip(self.nodes, metadata)):
+            start = time.monotonic_ns()
+            results.append(node.process_metadata(item) if node.has_metadata() else None)
+            self.stage_ns[index][PROCESS_METADATA] += time.monotonic_ns() - start
+        return results
+
+    def send_metadata(self, metadata: List[Any]) -> None:
+        for index, (node, item) in enumerate(zip(self.nodes, metadata)):
+            start = time.monotonic_ns()
+            node.send_metadata(item)
+            self.stage_ns[index][SEND_METADATA] += time.monotonic_ns() - start
+
+    def record_timing(self, timing: Timing) -> None:
+        super().record_timing(timing)
+
+        self.stage_ns[0][RECEIVE_DATA] = timing.receive_data_relative_ns - timing.start_relative_ns
+        self.stage_ns[-1][SEND_DATA] = timing.send_data_relative_ns - timing.process_data_relative_ns
+
+        for node, durations in zip(self.nodes, self.stage_ns):
+            node.iteration = self.iteration
+            node.record_timing(self.logical_timing(timing, durations))
+            durations[:] = [0] * 6
+
+    # static method
+    def logical_timing(self, timing: Timing, durations: List[int]) -> Timing:
+        '''timing of one inner node, as if its stages had run back to back from the start of the iteration'''
+
+        checkpoints = []
+        t = timing.start_relative_ns
+        for duration in durations:
+            t += duration
+            checkpoints.append(t)
+
+        return Timing(
+            timing.start_absolute_ns,
+            timing.start_relative_ns,
+            *checkpoints,
+            timing.start_absolute_ns + sum(durations),
+            timing.deadline_misses
+        )
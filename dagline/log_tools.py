@@ -1,69 +1,197 @@
 import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt  
+import numpy as np
+from numpy.typing import NDArray
 import re
-from typing import List, Dict, Optional
+import os
+import mmap
+from typing import Dict, Optional, List, Tuple
 
 #TODO remove ylabel and use title instead
 
-def parse_logs(filename: str) -> List[Dict]:
-
-    log_entry = re.compile(r"""
-        (?P<datetime>\d+-\d+-\d+ \s+ \d+:\d+:\d+,\d+) \s+
-        (?P<process_id>Process-\d+) \s+
-        (?P<pid>Process-\d+) \s+
-        (?P<process_name>(\w|\.)+) \s+
-        (?P<loglevel>\w+) \s+
-        [#](?P<num>\d+) \s,\s+
-        t_start:\s (?P<t_start>\d+\.\d+) ,\s+
-        receive_data_time:\s (?P<receive_data_time>\d+\.\d+) ,\s+
-        process_data_time:\s (?P<process_data_time>\d+\.\d+) ,\s+
-        send_data_time:\s (?P<send_data_time>\d+\.\d+) ,\s+
-        receive_metadata_time:\s (?P<receive_metadata_time>\d+\.\d+) ,\s+
-        process_metadata_time:\s (?P<process_metadata_time>\d+\.\d+) ,\s+
-        send_metadata_time:\s (?P<send_metadata_time>\d+\.\d+) ,\s+
-        total_time:\s (?P<total_time>\d+\.\d+) ,\s+
-        t_stop:\s (?P<t_stop>\d+\.\d+)
-        """, re.VERBOSE)
-    
+LOG_ENTRY = re.compile(rb"""
+    (?P<datetime>\d+-\d+-\d+ \s+ \d+:\d+:\d+,\d+) \s+
+    (?P<process_id>Process-\d+) \s+
+    (?P<pid>Process-\d+) \s+
+    (?P<process_name>(?:\w|\.)+) \s+
+    (?P<loglevel>\w+) \s+
+    [#](?P<num>\d+) \s,\s+
+    t_start:\s (?P<t_start>\d+\.\d+) ,\s+
+    receive_data_time:\s (?P<receive_data_time>\d+\.\d+) ,\s+
+    process_data_time:\s (?P<process_data_time>\d+\.\d+) ,\s+
+    send_data_time:\s (?P<send_data_time>\d+\.\d+) ,\s+
+    receive_metadata_time:\s (?P<receive_metadata_time>\d+\.\d+) ,\s+
+    process_metadata_time:\s (?P<process_metadata_time>\d+\.\d+) ,\s+
+    send_metadata_time:\s (?P<send_metadata_time>\d+\.\d+) ,\s+
+    total_time:\s (?P<total_time>\d+\.\d+) ,\s+
+    t_stop:\s (?P<t_stop>\d+\.\d+)
+    (?: ,\s+ deadline_misses:\s (?P<deadline_misses>\d+) )? # missing in older logs
+    """, re.VERBOSE)
+
+LOG_COLUMNS = {
+    'datetime': 'datetime64[ms]',
+    'process_id': 'str',
+    'pid': 'str',
+    'process_name': 'str',
+    'loglevel': 'str',
+    'num': 'int64',
+    't_start': 'float64',
+    'receive_data_time': 'float64',
+    'process_data_time': 'float64',
+    'send_data_time': 'float64',
+    'receive_metadata_time': 'float64',
+    'process_metadata_time': 'float64',
+    'send_metadata_time': 'float64',
+    'total_time': 'float64',
+    't_stop': 'float64',
+    'deadline_misses': 'int64'
+}
+
+MAX_ENTRY_SIZE = 4096 # bytes, an entry is never split across more than two chunks
+
+def parse_chunk(chunk: bytes) -> Dict[str, NDArray]:
+    '''parse log entries in a chunk of bytes into typed columns'''
+    return parse_rows(LOG_ENTRY.findall(chunk))
+
+def parse_rows(rows: List[Tuple[bytes, ...]]) -> Dict[str, NDArray]:
+    '''typed columns from the groups of LOG_ENTRY matches'''
+
+    columns = {}
+    for (name, dtype), values in zip(LOG_COLUMNS.items(), zip(*rows)):
+        values = np.array(values)
+        if name == 'datetime':
+            columns[name] = np.char.replace(values, b',', b'.').astype('U').astype(dtype)
+        elif dtype == 'str':
+            columns[name] = values.astype('U')
+        elif name == 'deadline_misses':
+            columns[name] = np.where(values == b'', b'0', values).astype(dtype)
+        else:
+            columns[name] = values.astype(dtype)
+    return columns
+
+def parse_log_file(filename: str, chunk_size: int = 64*1024*1024) -> Dict[str, NDArray]:
+    '''stream through a memory-mapped log file chunk by chunk'''
+
+    if chunk_size < 2 * MAX_ENTRY_SIZE:
+        raise ValueError(f'chunk_size must be at least {2 * MAX_ENTRY_SIZE} bytes')
+
+    chunks = []
+    size = os.path.getsize(filename)
+
+    if size > 0:
+        with open(filename, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            
+            start = 0
+            while start < size:
+                stop = min(start + chunk_size, size)
+                chunk = mm[start:stop]
+
+                # entries starting near the end may be truncated, leave them for the next chunk
+                if stop == size:
+                    cut = len(chunk)
+                else:
+                    cut = len(chunk) - MAX_ENTRY_SIZE
+
+                end = 0
+                rows = []
+                for match in LOG_ENTRY.finditer(chunk):
+                    if match.start() >= cut:
+                        break
+                    rows.append(match.groups(b''))
+                    end = match.end()
+
+                chunks.append(parse_rows(rows))
+                start += max(cut, end)
+
+    columns = {}
+    for name, dtype in LOG_COLUMNS.items():
+        parts = [c[name] for c in chunks if name in c]
+        if parts:
+            columns[name] = np.concatenate(parts)
+        else:
+            columns[name] = np.array([], dtype = 'U' if dtype == 'str' else dtype)
+
+    return columns
+
+def parse_logs(filename: str, cache: bool = True, chunk_size: int = 64*1024*1024) -> Dict[str, NDArray]:
+    '''
+    Parse timing log entries into typed columns. 
+    The result is cached next to the log in <filename>.npz, keyed by file size 
+    and modification time, and reused as long as the log is unchanged.
+    '''
+
+    stat = os.stat(filename)
+    key = np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+    cache_file = filename + '.npz'
+
+    if cache and os.path.exists(cache_file):
+        with np.load(cache_file) as cached:
+            # caches written before a column was added are parsed again
+            if np.array_equal(cached['_key'], key) and all(name in cached for name in LOG_COLUMNS):
+                return {name: cached[name] for name in LOG_COLUMNS}
+
+    columns = parse_log_file(filename, chunk_size)
+
+    if cache:
+        try:
+            with open(cache_file, 'wb') as f:
+                np.savez(f, _key=key, **columns)
+        except OSError:
+            pass # read-only location, skip caching
+
+    return columns
+
+TRACE_ENTRY = re.compile(r"""
+    trace\s[#](?P<sequence>\d+) ,\s
+    origin:\s (?P<origin>[-+.\de]+) ,\s
+    latency:\s (?P<latency>[-+.\de]+) ,\s
+    hops:\s (?P<hops>\S+)
+    """, re.VERBOSE)
+
+def parse_traces(filename: str) -> pd.DataFrame:
+    '''
+    Parse end-to-end traces logged by sink nodes, one row per hop. 
+    Latency distributions per path: data.groupby('path')['latency'].
+    '''
+
+    rows = []
     with open(filename, 'r') as f:
-        content = f.read()
-        entries = [e.groupdict() for e in log_entry.finditer(content)]
+        for line in f:
+            match = TRACE_ENTRY.search(line)
+            if match is None:
+                continue
+
+            hops = [hop.split(':') for hop in match.group('hops').split(';')]
+            path = '>'.join(node for node, queue_wait, processing in hops)
+            for index, (node, queue_wait, processing) in enumerate(hops):
+                rows.append((
+                    int(match.group('sequence')),
+                    float(match.group('origin')),
+                    float(match.group('latency')),
+                    path,
+                    index,
+                    node,
+                    float(queue_wait),
+                    float(processing)
+                ))
 
-    return entries
+    return pd.DataFrame(rows, columns=[
+        'sequence', 'origin', 'latency', 'path', 'hop', 'node', 'queue_wait', 'processing'
+    ])
 
 
 def plot_logs(filename: str, outlier_thresh: Optional[float] = None) -> None:
     
-    # get entries using regexp
-    entries = parse_logs(filename)
-
-    # convert entries to pandas dataframe
-    data = pd.DataFrame(entries)
-    data = data.astype({
-        'datetime': 'datetime64[ns]',
-        'process_id': 'str',
-        'pid': 'str',
-        'process_name': 'str',
-        'loglevel': 'str',
-        'num': 'int64',
-        't_start': 'float64',
-        'receive_data_time': 'float64',
-        'process_data_time': 'float64',
-        'send_data_time': 'float64',
-        'receive_metadata_time': 'float64',
-        'process_metadata_time': 'float64',
-        'send_metadata_time': 'float64',
-        'total_time': 'float64',
-        't_stop': 'float64'
-    })
+    # get typed columns 
+    data = pd.DataFrame(parse_logs(filename))
 
     if outlier_thresh:
         data = data[data['receive_data_time']<outlier_thresh] 
 
     # boxplot by process
     fig, axes = plt.subplots(1, 4, figsize=(8,2))
-    for id, y in enumerate(['receive_data_time', 'process_data_time', 'send_datatime', 'total_time']):
+    for id, y in enumerate(['receive_data_time', 'process_data_time', 'send_data_time', 'total_time']):
         ax = axes[id]
         g = sns.boxplot(ax=ax, data=data, x='process_name', y=y)
         g.set_title(y)
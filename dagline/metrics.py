@@ -0,0 +1,215 @@
+from multiprocessing import RawArray
+from queue import Full
+from typing import Any, Optional, Dict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread
+import time
+from ipc_tools import QueueLike
+from .worker import Timing
+from .telemetry import TIMING_DURATIONS
+
+EDGE_COUNTERS = ['enqueued', 'dequeued', 'full', 'put_blocked_ns', 'get_blocked_ns']
+ENQUEUED, DEQUEUED, FULL, PUT_BLOCKED_NS, GET_BLOCKED_NS = range(len(EDGE_COUNTERS))
+
+class MeteredQueue:
+    '''
+    Wrap a queue and count puts, gets, rejected puts (Full) and time spent inside 
+    put/get in shared memory, so the parent can read them while the DAG runs.
+    With BROADCAST a rejected put is a dropped item, DISPATCH tries another queue.
+    Counters are not locked: put counters belong to the sender and get counters to
+    the receiver, they may be slightly off if several nodes share the queue.
+    Nodes mostly use put_nowait/get_nowait and wait on events in poll/collect/dispatch:
+    that time is counted per node, see NodeMetrics receive_blocked_ns and send_blocked_ns.
+    '''
+
+    def __init__(self, queue: QueueLike) -> None:
+        self.queue = queue
+        self.counters = RawArray('q', len(EDGE_COUNTERS))
+
+    def put(self, item: Any, block: bool = True, timeout: Optional[float] = None) -> None:
+        start = time.perf_counter_ns()
+        try:
+            self.queue.put(item, block=block, timeout=timeout)
+        except Full:
+            self.counters[FULL] += 1
+            raise
+        finally:
+            self.counters[PUT_BLOCKED_NS] += time.perf_counter_ns() - start
+        self.counters[ENQUEUED] += 1
+
+    def get(self, block: bool = True, timeout: Optional[float] = None) -> Any:
+        start = time.perf_counter_ns()
+        try:
+            item = self.queue.get(block=block, timeout=timeout)
+        finally:
+            self.counters[GET_BLOCKED_NS] += time.perf_counter_ns() - start
+        self.counters[DEQUEUED] += 1
+        return item
+
+    def put_nowait(self, item: Any) -> None:
+        self.put(item, block=False)
+
+    def get_nowait(self) -> Any:
+        return self.get(block=False)
+
+    def qsize(self) -> int:
+        return self.queue.qsize()
+
+    def __getattr__(self, attr):
+        # delegate everything else (cancel_join_thread, close...) to the wrapped queue
+        if attr == 'queue':
+            raise AttributeError(attr) # not set yet, e.g. while unpickling
+        return getattr(self.queue, attr)
+
+    def read(self) -> Dict[str, int]:
+        return dict(zip(EDGE_COUNTERS, self.counters))
+
+NODE_COUNTERS = ['iterations'] + [f'{name}_ns' for name in TIMING_DURATIONS] + [f'{name}_total_ns' for name in TIMING_DURATIONS] + [
+    'deadline_misses', 
+    'receive_blocked_ns', # waiting for a sender to signal data, in poll/collect
+    'send_blocked_ns' # waiting for a receiver to signal space, in dispatch
+]
+
+class NodeMetrics:
+    '''iteration count, last and cumulated stage durations of a node, time blocked on queues, in shared memory'''
+
+    def __init__(self) -> None:
+        self.counters = RawArray('q', len(NODE_COUNTERS))
+        self.stages = list(TIMING_DURATIONS.values())
+        self.index = {name: index for index, name in enumerate(NODE_COUNTERS)}
+
+    def add(self, counter: str, value: int) -> None:
+        self.counters[self.index[counter]] += value
+
+    def update(self, timing: Timing) -> None:
+        counters = self.counters
+        counters[0] += 1
+        n = len(self.stages)
+        for index, (stop, start) in enumerate(self.stages):
+            duration = getattr(timing, stop) - getattr(timing, start)
+            counters[1 + index] = duration
+            counters[1 + n + index] += duration
+        counters[1 + 2*n] += timing.deadline_misses
+
+    def read(self) -> Dict[str, int]:
+        return dict(zip(NODE_COUNTERS, self.counters))
+
+class MetricsReader:
+    '''snapshots of node and edge counters, with rates computed since the previous snapshot'''
+
+    def __init__(self) -> None:
+        self.previous = {}
+        self.previous_time = None
+
+    def snapshot(
+            self, 
+            nodes: Dict[str, NodeMetrics], 
+            edges: Dict[str, MeteredQueue], 
+            drops: Optional[Dict[str, Any]] = None
+        ) -> Dict:
+        '''drops: per-edge shared counters of items dropped by senders (WorkerNode.drops)'''
+
+        now = time.monotonic()
+        elapsed = None if self.previous_time is None else now - self.previous_time
+
+        def rate(key, value):
+            if elapsed is None or elapsed == 0:
+                return None
+            return (value - self.previous.get(key, 0)) / elapsed
+
+        current = {}
+        result = {'nodes': {}, 'edges': {}}
+
+        for name, metrics in nodes.items():
+            counters = metrics.read()
+            current[('node', name)] = counters['iterations']
+            stats = {
+                'iterations': counters['iterations'],
+                'rate_hz': rate(('node', name), counters['iterations']),
+                'deadline_misses': counters['deadline_misses'],
+                'receive_blocked_s': counters['receive_blocked_ns'] * 1e-9,
+                'send_blocked_s': counters['send_blocked_ns'] * 1e-9
+            }
+            for stage in TIMING_DURATIONS:
+                stats[f'{stage}_ms'] = counters[f'{stage}_ns'] * 1e-6
+                stats[f'{stage}_mean_ms'] = counters[f'{stage}_total_ns'] * 1e-6 / max(counters['iterations'], 1)
+            result['nodes'][name] = stats
+
+        for name, queue in edges.items():
+            counters = queue.read()
+            current[('put', name)] = counters['enqueued']
+            current[('get', name)] = counters['dequeued']
+            result['edges'][name] = {
+                **counters,
+                'depth': counters['enqueued'] - counters['dequeued'],
+                'enqueue_rate_hz': rate(('put', name), counters['enqueued']),
+                'dequeue_rate_hz': rate(('get', name), counters['dequeued'])
+            }
+
+        for name, counter in (drops or {}).items():
+            result['edges'].setdefault(name, {})['dropped'] = counter.value
+
+        self.previous = current
+        self.previous_time = now
+        return result
+
+def prometheus_text(
+        nodes: Dict[str, NodeMetrics], 
+        edges: Dict[str, MeteredQueue], 
+        drops: Optional[Dict[str, Any]] = None
+    ) -> str:
+    '''Prometheus text exposition format'''
+
+    lines = []
+    for name, metrics in nodes.items():
+        counters = metrics.read()
+        lines.append(f'dagline_node_iterations_total{{node="{name}"}} {counters["iterations"]}')
+        lines.append(f'dagline_node_deadline_misses_total{{node="{name}"}} {counters["deadline_misses"]}')
+        lines.append(f'dagline_node_receive_blocked_seconds_total{{node="{name}"}} {counters["receive_blocked_ns"]*1e-9}')
+        lines.append(f'dagline_node_send_blocked_seconds_total{{node="{name}"}} {counters["send_blocked_ns"]*1e-9}')
+        for stage in TIMING_DURATIONS:
+            lines.append(f'dagline_node_stage_seconds{{node="{name}",stage="{stage}"}} {counters[f"{stage}_ns"]*1e-9}')
+            lines.append(f'dagline_node_stage_seconds_total{{node="{name}",stage="{stage}"}} {counters[f"{stage}_total_ns"]*1e-9}')
+
+    for name, queue in edges.items():
+        counters = queue.read()
+        lines.append(f'dagline_edge_enqueued_total{{edge="{name}"}} {counters["enqueued"]}')
+        lines.append(f'dagline_edge_dequeued_total{{edge="{name}"}} {counters["dequeued"]}')
+        lines.append(f'dagline_edge_full_total{{edge="{name}"}} {counters["full"]}')
+        lines.append(f'dagline_edge_depth{{edge="{name}"}} {counters["enqueued"] - counters["dequeued"]}')
+        lines.append(f'dagline_edge_put_blocked_seconds_total{{edge="{name}"}} {counters["put_blocked_ns"]*1e-9}')
+        lines.append(f'dagline_edge_get_blocked_seconds_total{{edge="{name}"}} {counters["get_blocked_ns"]*1e-9}')
+
+    for name, counter in (drops or {}).items():
+        lines.append(f'dagline_edge_dropped_total{{edge="{name}"}} {counter.value}')
+
+    return '\n'.join(lines) + '\n'
+
+def serve_metrics(
+        nodes: Dict[str, NodeMetrics],
+        edges: Dict[str, MeteredQueue],
+        port: int = 9100,
+        host: str = '127.0.0.1',
+        drops: Optional[Dict[str, Any]] = None
+    ) -> ThreadingHTTPServer:
+    '''serve prometheus_text on http://host:port/metrics from a daemon thread'''
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path.rstrip('/') != '/metrics':
+                self.send_error(404)
+                return
+            body = prometheus_text(nodes, edges, drops).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,104 @@
+import os
+import signal
+from collections import Counter
+from types import FrameType
+from typing import Optional, Dict, Tuple
+
+# method called by WorkerNode.main_loop: stage
+STAGES = {
+    'receive': 'receive_data',
+    'process_data': 'process_data',
+    'send': 'send_data',
+    'receive_metadata': 'receive_metadata',
+    'process_metadata': 'process_metadata',
+    'send_metadata': 'send_metadata',
+    'record_timing': 'timing',
+    'initialize': 'initialize',
+    'warmup': 'warmup',
+}
+
+class StackSampler:
+    '''
+    Statistical profiler: a SIGPROF timer interrupts the process every `interval`
+    seconds of cpu time and the handler counts the current call stack. Nothing runs
+    between samples, and waiting for data doesn't use cpu so it is not sampled.
+    Stacks are attributed to the main loop stage they were taken in.
+    Must be started from the main thread of the process.
+    '''
+
+    def __init__(self, interval: float = 0.005) -> None:
+        self.interval = interval
+        self.counts = Counter()
+        self.previous_handler = None
+
+    def start(self) -> None:
+        self.previous_handler = signal.signal(signal.SIGPROF, self.sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self) -> None:
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self.previous_handler or signal.SIG_DFL)
+
+    def sample(self, signum: int, frame: Optional[FrameType]) -> None:
+        # keep it cheap: code objects only, formatted when dumped
+        codes = []
+        stage = 'other'
+        while frame is not None:
+            code = frame.f_code
+            if code.co_name == 'main_loop':
+                if codes:
+                    stage = STAGES.get(codes[-1].co_name, 'other')
+                break
+            codes.append(code)
+            frame = frame.f_back
+        self.counts[(stage, tuple(codes))] += 1
+
+    def collapsed(self) -> Dict[str, int]:
+        '''counts per "stage;outer_function;...;inner_function" stack'''
+
+        stacks = Counter()
+        for (stage, codes), count in self.counts.items():
+            frames = [stage] + [
+                f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+                for code in reversed(codes)
+            ]
+            stacks[';'.join(frames)] += count
+        return stacks
+
+    def dump(self, filename: str) -> None:
+        '''collapsed-stack format, one "stack count" line per stack, see flamegraph.pl or speedscope'''
+        with open(filename, 'w') as f:
+            for stack, count in self.collapsed().items():
+                f.write(f'{stack} {count}\n')
+
+def read_collapsed(filename: str) -> Dict[str, int]:
+    stacks = Counter()
+    with open(filename, 'r') as f:
+        for line in f:
+            stack, _, count = line.rstrip('\n').rpartition(' ')
+            if stack:
+                stacks[stack] += int(count)
+    return stacks
+
+def merge_collapsed(files: Dict[str, str], filename: str) -> Tuple[int, Dict[str, int]]:
+    '''
+    Merge collapsed-stack files into one, each stack under a root frame named after
+    its key in files (e.g. node name: file). Missing files are skipped.
+    Return the total number of samples and the number of samples per root.
+    '''
+
+    stacks = Counter()
+    samples = {}
+    for root, path in files.items():
+        if not os.path.exists(path):
+            continue
+        node_stacks = read_collapsed(path)
+        samples[root] = sum(node_stacks.values())
+        for stack, count in node_stacks.items():
+            stacks[f'{root};{stack}'] += count
+
+    with open(filename, 'w') as f:
+        for stack, count in stacks.items():
+            f.write(f'{stack} {count}\n')
+
+    return sum(samples.values()), samples
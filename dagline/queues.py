@@ -0,0 +1,307 @@
+import queue
+import math
+import time
+import pickle
+import numpy as np
+from numpy.typing import NDArray, DTypeLike
+from dataclasses import dataclass
+from multiprocessing import RawArray, RawValue, Event
+from typing import Any, Optional, Tuple, Callable, Dict
+from ipc_tools import QueueLike, QueueMP, RingBuffer, ObjectRingBuffer2
+from .arena import find_handles
+
+class LocalQueue(queue.Queue):
+    '''
+    In-memory queue for edges between nodes running in the same process 
+    (executor_type.THREAD). Items are passed by reference, without serialization:
+    the sender must not modify an item after sending it.
+    '''
+
+    def close(self) -> None:
+        pass
+
+    def join_thread(self) -> None:
+        pass
+
+    def cancel_join_thread(self) -> None:
+        pass
+
+class ConflatingQueue:
+    '''
+    Edge that only keeps the latest value: put overwrites the pending item and never
+    blocks or fails, get returns the newest item written since the previous get. 
+    For display and control nodes, which would otherwise show stale items or make 
+    the producer drop new ones. 
+    
+    The item lives in a single shared buffer protected by a seqlock: the writer bumps
+    a sequence number to odd, writes, then bumps it to even. The reader copies the 
+    buffer and retries if the sequence changed meanwhile. One writer, one reader.
+    Items are laid out as
+        - arrays of item_shape and data_type,
+        - a structured data_type filled by serialize(buffer, item) and read back by 
+          deserialize(buffer), as with ObjectRingBuffer2,
+        - otherwise pickled, up to max_bytes.
+    The reader finds the number of items it missed in get_with_skipped(), or in 
+    queue.skipped after a plain get(), and the running total in num_skipped.
+    Items holding arena slots (see SharedArena) are rejected: nobody could release 
+    the slots of an overwritten item.
+    '''
+
+    def __init__(
+            self,
+            item_shape: Optional[Tuple[int, ...]] = None,
+            data_type: Optional[DTypeLike] = None,
+            serialize: Optional[Callable[[NDArray, Any], None]] = None,
+            deserialize: Optional[Callable[[NDArray], Any]] = None,
+            max_bytes: int = 1 << 20
+        ) -> None:
+
+        self.item_shape = item_shape
+        self.data_type = None if data_type is None else np.dtype(data_type)
+        self.serialize = serialize
+        self.deserialize = deserialize
+
+        if self.data_type is None:
+            num_bytes = max_bytes
+        elif item_shape is None:
+            num_bytes = self.data_type.itemsize
+        else:
+            num_bytes = int(np.prod(item_shape)) * self.data_type.itemsize
+
+        self.buffer = RawArray('B', num_bytes)
+        self.num_bytes = RawValue('Q', 0) # size of the pickled item
+        self.sequence = RawValue('Q', 0) # odd while writing, twice the number of puts otherwise
+        self.num_read = RawValue('Q', 0) # number of puts seen by the last get
+        self.num_skipped = RawValue('Q', 0) # items overwritten before being read
+        self.written = Event()
+        self.skipped = 0 # items skipped before the last get, in the reader
+        self.array = self.make_array()
+
+    def make_array(self) -> Optional[NDArray]:
+        if self.data_type is None:
+            return None
+        if self.item_shape is None:
+            return np.frombuffer(self.buffer, dtype=self.data_type, count=1)
+        return np.frombuffer(self.buffer, dtype=self.data_type).reshape(self.item_shape)
+
+    def __getstate__(self) -> Dict:
+        # the numpy view would be pickled as a copy, rebuild it on the shared buffer
+        state = self.__dict__.copy()
+        del state['array']
+        return state
+
+    def __setstate__(self, state: Dict) -> None:
+        self.__dict__.update(state)
+        self.array = self.make_array()
+
+    def put(self, item: Any, block: bool = True, timeout: Optional[float] = None) -> None:
+
+        if self.array is None:
+            if find_handles(item):
+                raise ValueError('arena slots can not be sent over a conflating edge, send a copy instead')
+            payload = pickle.dumps(item, protocol=pickle.HIGHEST_PROTOCOL)
+            if len(payload) > len(self.buffer):
+                raise ValueError(f'item of {len(payload)} bytes does not fit in {len(self.buffer)} bytes')
+
+        sequence = self.sequence.value
+        self.sequence.value = sequence + 1
+
+        if self.array is None:
+            memoryview(self.buffer).cast('B')[:len(payload)] = payload
+            self.num_bytes.value = len(payload)
+        elif self.serialize is not None:
+            self.serialize(self.array, item)
+        else:
+            self.array[...] = item
+
+        self.sequence.value = sequence + 2
+        self.written.set()
+
+    def read(self) -> Tuple[int, Any]:
+        '''consistent copy of the buffer and the number of puts it contains'''
+
+        while True:
+            sequence = self.sequence.value
+            if sequence % 2:
+                continue # write in progress
+
+            if self.array is None:
+                item = memoryview(self.buffer).cast('B')[:self.num_bytes.value].tobytes()
+            else:
+                item = self.array.copy()
+
+            if self.sequence.value == sequence:
+                break
+
+        if self.array is None:
+            item = pickle.loads(item)
+        elif self.deserialize is not None:
+            item = self.deserialize(item)
+
+        return sequence // 2, item
+
+    def get_with_skipped(self, block: bool = True, timeout: Optional[float] = None) -> Tuple[Any, int]:
+        '''latest item and the number of items overwritten since the previous get'''
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            # clear before checking: a put landing in between sets it again
+            self.written.clear()
+            if self.sequence.value // 2 > self.num_read.value:
+                break
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if not block or (remaining is not None and remaining <= 0):
+                raise queue.Empty
+            self.written.wait(remaining)
+
+        num_put, item = self.read()
+        self.skipped = num_put - self.num_read.value - 1
+        self.num_skipped.value += self.skipped
+        self.num_read.value = num_put
+        return item, self.skipped
+
+    def get(self, block: bool = True, timeout: Optional[float] = None) -> Any:
+        return self.get_with_skipped(block, timeout)[0]
+
+    def put_nowait(self, item: Any) -> None:
+        self.put(item, block=False)
+
+    def get_nowait(self) -> Any:
+        return self.get(block=False)
+
+    def qsize(self) -> int:
+        return int(self.sequence.value // 2 > self.num_read.value)
+
+    def empty(self) -> bool:
+        return self.qsize() == 0
+
+    def full(self) -> bool:
+        return False
+
+    def close(self) -> None:
+        pass
+
+    def join_thread(self) -> None:
+        pass
+
+    def cancel_join_thread(self) -> None:
+        pass
+
+@dataclass
+class QueueSpec:
+    '''
+    Declare what goes through an edge instead of building the queue by hand. 
+    The layout comes from item_shape/data_type, from a sample item, or from the 
+    sender's output_sample(). The capacity is num_items if given, otherwise the 
+    number of items the consumer can clear within latency_budget_s.
+    With conflate=True, the edge only keeps the latest item, see ConflatingQueue.
+    '''
+
+    sample: Any = None
+    item_shape: Optional[Tuple[int, ...]] = None
+    data_type: Optional[DTypeLike] = None
+    num_items: Optional[int] = None
+    producer_rate_hz: Optional[float] = None
+    consumer_rate_hz: Optional[float] = None
+    latency_budget_s: float = 0.1
+    max_bytes: Optional[int] = None
+    conflate: bool = False
+
+    def build(self, name: str) -> QueueLike:
+        return make_queue(self, name)
+
+def queue_capacity(
+        producer_rate_hz: Optional[float],
+        consumer_rate_hz: Optional[float] = None,
+        latency_budget_s: float = 0.1,
+        min_items: int = 2
+    ) -> int:
+    '''
+    An item behind k others waits about k / consumer_rate before being read, 
+    so a queue longer than consumer_rate * latency_budget only holds stale items.
+    '''
+
+    rate = consumer_rate_hz or producer_rate_hz
+    if rate is None:
+        return 100
+    return max(min_items, math.ceil(rate * latency_budget_s))
+
+def tuple_layout(sample: tuple) -> Optional[np.dtype]:
+    '''structured dtype with one field per tuple element, None if an element is not numeric'''
+
+    fields = []
+    for index, item in enumerate(sample):
+        item = np.asarray(item)
+        if item.dtype.kind not in 'biufc':
+            return None
+        fields.append((f'f{index}', item.dtype, item.shape))
+    return np.dtype(fields)
+
+class TupleSerializer:
+    '''
+    Write tuples to and read them from a structured buffer with one field per element.
+    A class rather than closures so that queues using it can be pickled for spawned processes.
+    '''
+
+    def __init__(self, field_names: Tuple[str, ...]) -> None:
+        self.field_names = field_names
+
+    def serialize(self, buffer: NDArray, obj: tuple) -> None:
+        for field, value in zip(self.field_names, obj):
+            buffer[field] = value
+
+    def deserialize(self, arr: NDArray) -> tuple:
+        item = arr[0]
+        return tuple(item[field].item() if item[field].ndim == 0 else item[field] for field in self.field_names)
+
+def make_queue(spec: QueueSpec, name: str) -> QueueLike:
+    '''
+    Pick a queue for the items described by spec:
+        - arrays of a fixed shape: RingBuffer,
+        - tuples of numbers and arrays: ObjectRingBuffer2 with a structured dtype,
+        - anything else: QueueMP.
+    or a ConflatingQueue with the same layout if spec.conflate.
+    '''
+
+    item_shape, data_type = spec.item_shape, spec.data_type
+    structured = None
+    if item_shape is None and spec.sample is not None:
+        if isinstance(spec.sample, np.ndarray):
+            item_shape, data_type = spec.sample.shape, spec.sample.dtype
+        elif isinstance(spec.sample, tuple):
+            structured = tuple_layout(spec.sample)
+            
+    if item_shape is None and structured is None:
+        if spec.conflate:
+            return ConflatingQueue(max_bytes = spec.max_bytes or 1 << 20)
+        return QueueMP()
+
+    item_size = structured.itemsize if structured is not None else int(np.prod(item_shape)) * np.dtype(data_type).itemsize
+
+    num_items = spec.num_items or queue_capacity(spec.producer_rate_hz, spec.consumer_rate_hz, spec.latency_budget_s)
+    if spec.max_bytes is not None:
+        num_items = max(1, min(num_items, spec.max_bytes // item_size))
+
+    if structured is None and spec.conflate:
+        return ConflatingQueue(item_shape, data_type)
+
+    if structured is None:
+        return RingBuffer(
+            num_items = num_items,
+            item_shape = item_shape,
+            data_type = data_type
+        )
+
+    serializer = TupleSerializer(structured.names)
+    serialize, deserialize = serializer.serialize, serializer.deserialize
+
+    if spec.conflate:
+        return ConflatingQueue(data_type = structured, serialize = serialize, deserialize = deserialize)
+
+    return ObjectRingBuffer2(
+        num_items = num_items,
+        data_type = structured,
+        serialize = serialize,
+        deserialize = deserialize,
+        name = name
+    )
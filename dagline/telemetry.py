@@ -0,0 +1,119 @@
+import numpy as np
+from numpy.typing import NDArray
+from multiprocessing import RawArray, RawValue
+from dataclasses import fields
+from operator import attrgetter
+from typing import Dict, Tuple, Optional
+from .worker import Timing
+
+TIMING_FIELDS = [field.name for field in fields(Timing)]
+TIMING_DTYPE = np.dtype([('iteration', np.int64)] + [(name, np.int64) for name in TIMING_FIELDS])
+
+# duration name: (stop field, start field), same definitions as the Timing properties
+TIMING_DURATIONS = {
+    'receive_data_time': ('receive_data_relative_ns', 'start_relative_ns'),
+    'process_data_time': ('process_data_relative_ns', 'receive_data_relative_ns'),
+    'send_data_time': ('send_data_relative_ns', 'process_data_relative_ns'),
+    'receive_metadata_time': ('receive_metadata_relative_ns', 'send_data_relative_ns'),
+    'process_metadata_time': ('process_metadata_relative_ns', 'receive_metadata_relative_ns'),
+    'send_metadata_time': ('send_metadata_relative_ns', 'process_metadata_relative_ns'),
+    'total_time': ('stop_absolute_ns', 'start_absolute_ns'),
+}
+
+class TimingRing:
+    '''
+    Preallocated shared-memory ring of fixed-width timing records, one per node.
+    The node writes a record every `every` iterations, the oldest records are 
+    overwritten when the ring is full. Create it in the parent before the DAG is 
+    started and pass it to the node as timing_ring, then call read() or dump() 
+    from the parent at any time.
+    Single writer, no lock: a record being written while it is read may be torn.
+    '''
+
+    def __init__(self, num_items: int = 100_000, every: int = 1) -> None:
+        self.num_items = num_items
+        self.every = every
+        self.buffer = RawArray('B', num_items * TIMING_DTYPE.itemsize)
+        self.count = RawValue('Q', 0) # total number of records written
+        self.records = np.frombuffer(self.buffer, dtype=TIMING_DTYPE)
+        self.get_fields = attrgetter(*TIMING_FIELDS)
+
+    def __getstate__(self) -> Dict:
+        # the numpy view would be pickled as a copy, rebuild it on the shared buffer
+        state = self.__dict__.copy()
+        del state['records']
+        return state
+
+    def __setstate__(self, state: Dict) -> None:
+        self.__dict__.update(state)
+        self.records = np.frombuffer(self.buffer, dtype=TIMING_DTYPE)
+
+    def write(self, iteration: int, timing: Timing) -> None:
+        
+        if iteration % self.every:
+            return
+        
+        count = self.count.value
+        self.records[count % self.num_items] = (iteration, *self.get_fields(timing))
+        self.count.value = count + 1
+
+    def read(self) -> NDArray:
+        '''copy of the records currently in the ring, oldest first'''
+
+        count = self.count.value
+        if count <= self.num_items:
+            return self.records[:count].copy()
+        
+        head = count % self.num_items
+        return np.concatenate((self.records[head:], self.records[:head]))
+    
+    def dump(self, filename: str) -> None:
+        np.save(filename, self.read())
+
+def load_timings(filename: str) -> NDArray:
+    return np.load(filename)
+
+def timing_durations(records: NDArray) -> Dict[str, NDArray]:
+    '''stage durations in ms for each record'''
+
+    durations = {}
+    for name, (stop, start) in TIMING_DURATIONS.items():
+        durations[name] = (records[stop] - records[start]) * 1e-6
+    return durations
+
+def timing_histograms(
+        records: NDArray, 
+        duration: str = 'total_time', 
+        bins: Optional[NDArray] = None,
+        period_s: float = 1.0
+    ) -> Tuple[NDArray, NDArray, NDArray]:
+    '''
+    Histogram of one stage duration (ms) per time period.
+    Returns the start time of each period (s, perf_counter), 
+    the bin edges (ms) and the counts with shape (num_periods, num_bins).
+    '''
+
+    values = timing_durations(records)[duration]
+    
+    if bins is None:
+        bins = np.histogram_bin_edges(values, bins=50)
+    num_bins = len(bins) - 1
+
+    if len(records) == 0:
+        return np.zeros((0,)), bins, np.zeros((0, num_bins), dtype=np.int64)
+
+    t_start = records['start_absolute_ns'] * 1e-9
+    t0 = t_start.min()
+    period = ((t_start - t0) // period_s).astype(np.int64)
+    num_periods = period.max() + 1
+
+    # same convention as np.histogram: last bin includes its right edge
+    bin_index = np.digitize(values, bins) - 1
+    bin_index[values == bins[-1]] = num_bins - 1
+    valid = (bin_index >= 0) & (bin_index < num_bins)
+
+    counts = np.zeros((num_periods, num_bins), dtype=np.int64)
+    np.add.at(counts, (period[valid], bin_index[valid]), 1)
+
+    period_start = t0 + np.arange(num_periods) * period_s
+    return period_start, bins, counts
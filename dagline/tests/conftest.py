@@ -0,0 +1,28 @@
+import pytest
+from multiprocessing_logger import Logger
+from dagline import WorkerNode
+
+class Node(WorkerNode):
+    '''passes data through and records control commands, tests call its methods without starting it'''
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.commands = []
+
+    def process_data(self, data):
+        return data
+
+    def process_metadata(self, metadata):
+        return None
+
+    def process_control(self, command, value):
+        self.commands.append((command, value))
+
+@pytest.fixture
+def make_node(tmp_path):
+    logger = Logger(str(tmp_path / 'test.log'), Logger.ERROR)
+
+    def make_node(name: str = 'node', node_class: type = Node, **kwargs) -> WorkerNode:
+        return node_class(name = name, logger = logger, logger_queues = logger, **kwargs)
+
+    return make_node
@@ -0,0 +1,47 @@
+from types import SimpleNamespace
+from dagline import parse_cpu_list, plan_affinity, CpuTopology, Cpu
+
+def node(name: str, hot: bool = False, cpu_affinity = None, scheduler_policy: int = 0):
+    # plan_affinity only reads these attributes
+    return SimpleNamespace(name = name, hot = hot, cpu_affinity = cpu_affinity, scheduler_policy = scheduler_policy)
+
+def smt_topology(num_cores: int = 4, isolated = ()) -> CpuTopology:
+    '''two SMT threads per core: cpu n and n + num_cores, one L3'''
+    return CpuTopology([
+        Cpu(cpu = core + thread * num_cores, core = core, isolated = core + thread * num_cores in isolated)
+        for thread in range(2) for core in range(num_cores)
+    ])
+
+def test_parse_cpu_list():
+    assert parse_cpu_list('0-3,8,10-11') == {0, 1, 2, 3, 8, 10, 11}
+    assert parse_cpu_list('') == set()
+    assert parse_cpu_list('5\n') == {5}
+
+def test_siblings_and_cores():
+    topology = smt_topology()
+    assert topology.siblings(1) == {1, 5}
+    assert topology.cores({0, 4, 1}) == [(0, 4)]
+
+def test_hot_nodes_get_a_core_of_their_own():
+    topology = smt_topology()
+    camera, tracker, display = node('camera', hot = True), node('tracker', hot = True), node('display')
+    plan = plan_affinity([camera, tracker, display], [(camera, tracker)], topology)
+
+    camera_core = topology.siblings(min(plan.affinity['camera']))
+    tracker_core = topology.siblings(min(plan.affinity['tracker']))
+    assert len(plan.affinity['camera']) == 1
+    assert camera_core != tracker_core
+    assert not plan.affinity['display'] & (camera_core | tracker_core)
+
+def test_hand_chosen_affinity_is_kept():
+    topology = smt_topology()
+    plan = plan_affinity([node('a', cpu_affinity = [0]), node('b', hot = True)], [], topology)
+    assert plan.affinity['a'] == {0}
+    assert plan.reasons['a'] == 'hand-chosen'
+    assert 0 not in plan.affinity['b']
+
+def test_realtime_nodes_use_isolated_cpus():
+    topology = smt_topology(isolated = {3, 7})
+    plan = plan_affinity([node('rt', scheduler_policy = 1), node('light')], [], topology)
+    assert plan.affinity['rt'] <= {3, 7}
+    assert not plan.affinity['light'] & {3, 7}
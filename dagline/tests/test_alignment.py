@@ -0,0 +1,40 @@
+from operator import itemgetter
+from dagline import StreamAligner
+
+def make_aligner(tolerance: float = 0, capacity: int = 16) -> StreamAligner:
+    aligner = StreamAligner(itemgetter(0), tolerance, capacity)
+    aligner.add_input('left')
+    aligner.add_input('right')
+    return aligner
+
+def test_aligner_matches_equal_keys():
+    aligner = make_aligner()
+    aligner.push('left', (1, 'a'))
+    assert aligner.pop() is None
+    aligner.push('right', (1, 'b'))
+    assert aligner.pop() == {'left': (1, 'a'), 'right': (1, 'b')}
+    assert aligner.num_matched == 1
+
+def test_aligner_discards_unmatched_items():
+    aligner = make_aligner()
+    for key in [1, 2, 3]:
+        aligner.push('left', (key, 'a'))
+    aligner.push('right', (3, 'b'))
+    assert aligner.pop() == {'left': (3, 'a'), 'right': (3, 'b')}
+    assert aligner.num_discarded == {'left': 2, 'right': 0}
+    assert aligner.discarded == [(1, 'a'), (2, 'a')]
+
+def test_aligner_tolerance_picks_nearest():
+    aligner = make_aligner(tolerance = 0.5)
+    aligner.push('left', (10.0, 'a'))
+    aligner.push('left', (10.9, 'a'))
+    aligner.push('right', (11.0, 'b'))
+    assert aligner.pop() == {'left': (10.9, 'a'), 'right': (11.0, 'b')}
+    assert aligner.num_discarded['left'] == 1
+
+def test_aligner_capacity():
+    aligner = make_aligner(capacity = 2)
+    for key in range(5):
+        aligner.push('left', (key, 'a'))
+    assert aligner.num_discarded['left'] == 3
+    assert len(aligner.buffers['left']) == 2
@@ -0,0 +1,136 @@
+import time
+from queue import Queue
+from threading import Thread
+import numpy as np
+import pytest
+from dagline import SharedArena, ArenaHandle, ProcessingDAG, ConflatingQueue, ReorderBuffer, Sequenced, send_strategy
+
+def test_alloc_until_exhausted():
+    arena = SharedArena('frames', 2, (4,), np.uint8)
+    first, second = arena.alloc(), arena.alloc()
+    assert {first.slot, second.slot} == {0, 1}
+    assert arena.alloc(block = False) is None
+    assert arena.num_free() == 0
+
+def test_alloc_timeout():
+    arena = SharedArena('frames', 1, (4,), np.uint8)
+    arena.alloc()
+    start = time.monotonic()
+    assert arena.alloc(timeout = 0.05) is None
+    assert time.monotonic() - start >= 0.05
+
+def test_slot_recycled_after_last_release():
+    arena = SharedArena('frames', 1, (4,), np.uint8)
+    handle = arena.alloc()
+    arena.retain(handle)
+    arena.release(handle)
+    assert arena.alloc(block = False) is None
+    arena.release(handle)
+    assert arena.num_free() == 1
+    assert arena.alloc(block = False) == handle
+
+def test_release_wakes_up_alloc():
+    arena = SharedArena('frames', 1, (4,), np.uint8)
+    handle = arena.alloc()
+    Thread(target = lambda: (time.sleep(0.05), arena.release(handle))).start()
+    assert arena.alloc(timeout = 5) == handle
+
+def test_views_share_memory():
+    arena = SharedArena('frames', 2, (2, 2), np.float32)
+    handle = arena.alloc()
+    arena.view(handle)[:] = 3
+    np.testing.assert_array_equal(arena.array[handle.slot], 3)
+
+def connect(dag, sender, receiver, name: str = 'edge') -> Queue:
+    queue = Queue()
+    dag.connect_data(sender, receiver, queue, name)
+    return queue
+
+def test_nodes_send_handles_and_release_slots(make_node):
+    dag = ProcessingDAG()
+    sender, receiver = make_node('sender'), make_node('receiver', receive_data_timeout = 0.1)
+    queue = connect(dag, sender, receiver)
+    arena = dag.create_arena('frames', 2, (2, 2), np.uint8)
+    for node in [sender, receiver]:
+        node.arenas.update(dag.arenas)
+
+    frame = sender.alloc('frames')
+    frame[:] = 7
+    sender.send((1, frame))
+    sender.release_arena_slots() # end of the sender's iteration
+
+    index, handle = queue.queue[0]
+    assert isinstance(handle, ArenaHandle)
+    assert arena.refcount[handle.slot] == 1 # held by the item in flight
+
+    index, received = receiver.receive()
+    np.testing.assert_array_equal(received, 7)
+    receiver.release_arena_slots() # end of the receiver's iteration
+    assert arena.num_free() == 2
+
+def test_broadcast_takes_one_reference_per_receiver(make_node):
+    dag = ProcessingDAG()
+    sender = make_node('sender', send_data_strategy = send_strategy.BROADCAST)
+    receivers = [make_node(f'receiver_{index}', receive_data_timeout = 0.1) for index in range(2)]
+    for receiver in receivers:
+        connect(dag, sender, receiver, receiver.name)
+    arena = dag.create_arena('frames', 1, (2,), np.uint8)
+    for node in [sender] + receivers:
+        node.arenas.update(dag.arenas)
+
+    frame = sender.alloc('frames')
+    sender.send({'receiver_0': frame, 'receiver_1': frame})
+    sender.release_arena_slots()
+    assert arena.refcount[0] == 2
+
+    for receiver in receivers:
+        receiver.receive()
+        receiver.release_arena_slots()
+    assert arena.num_free() == 1
+
+def test_unsent_slots_are_released(make_node):
+    dag = ProcessingDAG()
+    sender = make_node('sender') # no receiver: nothing is sent
+    arena = dag.create_arena('frames', 1, (2,), np.uint8)
+    sender.arenas.update(dag.arenas)
+    sender.send(sender.alloc('frames'))
+    sender.release_arena_slots()
+    assert arena.num_free() == 1
+
+def test_stop_wakes_up_alloc(make_node):
+    dag = ProcessingDAG()
+    node = make_node('node')
+    dag.create_arena('frames', 1, (2,), np.uint8)
+    node.arenas.update(dag.arenas)
+    node.alloc('frames')
+    Thread(target = lambda: (time.sleep(0.05), node.stop())).start()
+    start = time.monotonic()
+    assert node.alloc('frames') is None
+    assert time.monotonic() - start < 1
+
+def test_late_replicated_items_are_released(make_node):
+    dag = ProcessingDAG()
+    receiver = make_node('receiver', receive_data_timeout = 0.05)
+    queue = Queue()
+    receiver.register_receive_data_queue(queue, 'edge')
+    receiver.reorder = ReorderBuffer(timeout = 0)
+    arena = dag.create_arena('frames', 2, (2,), np.uint8)
+    receiver.arenas.update(dag.arenas)
+    first, second = arena.alloc(), arena.alloc()
+
+    queue.put(Sequenced(1, second))
+    assert receiver.receive() is not None # item 0 is given up on
+    receiver.release_arena_slots()
+    queue.put(Sequenced(0, first))
+    assert receiver.receive() is None
+    assert receiver.reorder.num_late == 1
+    assert arena.num_free() == 2
+
+def test_conflating_edge_rejects_slots(make_node):
+    dag = ProcessingDAG()
+    sender, receiver = make_node('sender'), make_node('receiver')
+    dag.connect_data(sender, receiver, ConflatingQueue(), 'edge')
+    dag.create_arena('frames', 1, (2,), np.uint8)
+    sender.arenas.update(dag.arenas)
+    with pytest.raises(ValueError, match = 'conflating'):
+        sender.send((1, sender.alloc('frames')))
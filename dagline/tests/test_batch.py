@@ -0,0 +1,44 @@
+import time
+from queue import Queue
+from dagline import Batch
+
+def connect(sender, receiver) -> Queue:
+    queue = Queue()
+    sender.register_send_data_queue(queue, 'edge', receiver.receive_data_ready)
+    receiver.register_receive_data_queue(queue, 'edge', sender.send_data_space)
+    return queue
+
+def test_batch_up_to_size(make_node):
+    sender = make_node('sender')
+    receiver = make_node('receiver', receive_data_batch_size = 3, receive_data_batch_timeout = 0.05, receive_data_timeout = 0.1)
+    connect(sender, receiver)
+    for item in range(5):
+        sender.send(item)
+
+    batch = receiver.receive()
+    assert isinstance(batch, Batch)
+    assert batch == [0, 1, 2]
+    
+    start = time.monotonic()
+    assert receiver.receive() == [3, 4] # partial batch after the batch timeout
+    assert time.monotonic() - start >= 0.05
+    assert receiver.receive() is None
+
+def test_no_batch_by_default(make_node):
+    sender, receiver = make_node('sender'), make_node('receiver', receive_data_timeout = 0.1)
+    connect(sender, receiver)
+    sender.send(1)
+    sender.send(2)
+    assert receiver.receive() == 1
+
+def test_batch_is_sent_item_by_item(make_node):
+    sender, receiver = make_node('sender'), make_node('receiver')
+    queue = connect(sender, receiver)
+    sender.send(Batch(['a', 'b']))
+    assert list(queue.queue) == ['a', 'b']
+
+def test_other_containers_are_one_message(make_node):
+    sender, receiver = make_node('sender'), make_node('receiver')
+    queue = connect(sender, receiver)
+    sender.send(['a', 'b'])
+    assert list(queue.queue) == [['a', 'b']]
@@ -0,0 +1,50 @@
+import time
+from dagline import LocalQueue, executor_type
+
+def make_control_node(make_node, **kwargs):
+    node = make_node(executor = executor_type.THREAD, timing_log = False, **kwargs)
+    node.register_receive_data_queue(LocalQueue(), 'in')
+    return node
+
+def test_commands_handled_right_after_send(make_node):
+    node = make_control_node(make_node)
+    for value in range(20):
+        node.send_control('exposure', value)
+        node.poll_control()
+    assert node.commands == [('exposure', value) for value in range(20)]
+    assert node.control_latency_ns[0] == 20
+    assert not node.control_ready.is_set()
+
+def test_nothing_to_do(make_node):
+    node = make_control_node(make_node)
+    node.poll_control()
+    assert node.commands == []
+
+def test_interrupt_blocking_receive(make_node):
+    node = make_control_node(make_node, receive_data_timeout = 5, control_interrupt = True)
+    node.send_control('stop_acquisition')
+    start = time.monotonic()
+    assert node.receive() is None
+    assert time.monotonic() - start < 1
+    node.poll_control()
+    assert node.commands == [('stop_acquisition', None)]
+
+def test_no_interrupt_by_default(make_node):
+    node = make_control_node(make_node, receive_data_timeout = 0.2)
+    node.send_control('stop_acquisition')
+    start = time.monotonic()
+    node.receive()
+    assert time.monotonic() - start >= 0.2
+
+def test_command_still_on_its_way(make_node):
+    node = make_control_node(make_node)
+    node.control_sent.value += 1 # counted, not in the queue yet
+    node.control_ready.set()
+    start = time.monotonic()
+    node.poll_control()
+    assert time.monotonic() - start < 0.1
+    assert node.control_ready.is_set() # looked at again at the next check
+    node.control_queue.put(('exposure', 1, time.monotonic_ns()))
+    node.poll_control()
+    assert node.commands == [('exposure', 1)]
+    assert not node.control_ready.is_set()
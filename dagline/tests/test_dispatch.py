@@ -0,0 +1,61 @@
+import time
+from queue import Queue
+from threading import Thread
+from dagline import dispatch_policy
+
+def fan_out(make_node, policy: dispatch_policy, num_queues: int = 3, maxsize: int = 0, **kwargs):
+    sender = make_node('sender', send_data_dispatch_policy = policy, **kwargs)
+    receivers = []
+    for index in range(num_queues):
+        receiver = make_node(f'receiver_{index}')
+        queue = Queue(maxsize)
+        sender.register_send_data_queue(queue, f'edge_{index}', receiver.receive_data_ready)
+        receiver.register_receive_data_queue(queue, f'edge_{index}', sender.send_data_space)
+        receivers.append(receiver)
+    return sender, sender.send_data_queues, receivers
+
+def test_round_robin(make_node):
+    sender, queues, receivers = fan_out(make_node, dispatch_policy.ROUND_ROBIN)
+    for item in range(6):
+        sender.send(item)
+    assert [list(queue.queue) for queue in queues] == [[0, 3], [1, 4], [2, 5]]
+
+def test_least_loaded(make_node):
+    sender, queues, receivers = fan_out(make_node, dispatch_policy.LEAST_LOADED)
+    for queue, load in zip(queues, [2, 0, 1]):
+        for item in range(load):
+            queue.put(item)
+    sender.send('a')
+    assert list(queues[1].queue) == ['a']
+    sender.send('b')
+    sender.send('c')
+    assert [queue.qsize() for queue in queues] == [2, 2, 2]
+
+def test_power_of_two_picks_the_less_loaded_of_two(make_node):
+    sender, queues, receivers = fan_out(make_node, dispatch_policy.POWER_OF_TWO, num_queues = 2)
+    for item in range(3):
+        queues[0].put(item)
+    for item in range(3):
+        sender.send(item)
+    assert queues[0].qsize() == 3
+    assert queues[1].qsize() == 3
+
+def test_full_queues_block_until_a_receiver_gets(make_node):
+    sender, queues, receivers = fan_out(make_node, dispatch_policy.ROUND_ROBIN, num_queues = 2, maxsize = 1, send_data_timeout = 5)
+    sender.send(0)
+    sender.send(1)
+    Thread(target = lambda: (time.sleep(0.05), receivers[1].receive())).start()
+    start = time.monotonic()
+    sender.send(2)
+    assert 0.04 < time.monotonic() - start < 1
+    assert list(queues[0].queue) == [0]
+    assert list(queues[1].queue) == [2]
+
+def test_full_queues_drop_after_timeout(make_node):
+    sender, queues, receivers = fan_out(make_node, dispatch_policy.LEAST_LOADED, num_queues = 2, maxsize = 1, send_data_timeout = 0.05)
+    sender.send(0)
+    sender.send(1)
+    start = time.monotonic()
+    sender.send(2)
+    assert time.monotonic() - start >= 0.05
+    assert [list(queue.queue) for queue in queues] == [[0], [1]]
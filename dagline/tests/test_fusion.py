@@ -0,0 +1,110 @@
+import time
+from queue import Queue
+import pytest
+from dagline import ProcessingDAG, FusedNode, NodeMetrics, Timing, Batch
+from conftest import Node
+
+class AddOne(Node):
+
+    def process_data(self, data):
+        return data + 1
+
+class Double(Node):
+
+    def process_data(self, data):
+        time.sleep(0.01)
+        return 2 * data
+
+class Split(Node):
+
+    def process_data(self, data):
+        return Batch([data, data + 1])
+
+def chain(make_node, *classes, **kwargs):
+    '''source -> nodes built from classes -> sink, connected in a DAG'''
+    dag = ProcessingDAG()
+    nodes = [make_node('source', **kwargs)]
+    nodes += [make_node(f'node_{index}', node_class = node_class, **kwargs) for index, node_class in enumerate(classes)]
+    nodes += [make_node('sink', receive_data_timeout = 0.1, **kwargs)]
+    for sender, receiver in zip(nodes[:-1], nodes[1:]):
+        dag.connect_data(sender, receiver, Queue(), f'{sender.name}->{receiver.name}')
+    return dag, nodes
+
+def test_fused_stages_pass_data_directly(make_node):
+    dag, [source, first, second, sink] = chain(make_node, AddOne, Double)
+    fused = dag.fuse([first, second])
+
+    assert dag.nodes == [source, fused, sink]
+    assert [(sender, receiver) for sender, receiver, queue, name in dag.data_edges] == [(source, fused), (fused, sink)]
+
+    source.send(3)
+    fused.send(fused.process_data(fused.receive()))
+    assert sink.receive() == 8
+
+def test_batches_go_through_item_by_item(make_node):
+    dag, [source, first, second, sink] = chain(make_node, Split, Double)
+    fused = dag.fuse([first, second])
+    assert fused.process_data(1) == [2, 4]
+
+def test_each_stage_records_its_own_timing(make_node):
+    dag, [source, first, second, sink] = chain(make_node, AddOne, Double, timing_log = False)
+    fused = dag.fuse([first, second])
+    for node in fused.nodes:
+        node.node_metrics = NodeMetrics()
+
+    timing = Timing()
+    timing.start_absolute_ns = time.perf_counter_ns()
+    timing.start_relative_ns = time.monotonic_ns()
+    timing.receive_data_relative_ns = time.monotonic_ns()
+    fused.process_data(1)
+    timing.process_data_relative_ns = timing.send_data_relative_ns = time.monotonic_ns()
+    timing.receive_metadata_relative_ns = timing.process_metadata_relative_ns = timing.send_metadata_relative_ns = timing.send_data_relative_ns
+    timing.stop_absolute_ns = time.perf_counter_ns()
+    fused.record_timing(timing)
+
+    first_counters, second_counters = first.node_metrics.read(), second.node_metrics.read()
+    assert first_counters['iterations'] == second_counters['iterations'] == 1
+    assert second_counters['process_data_time_ns'] >= 10_000_000
+    assert first_counters['process_data_time_ns'] < second_counters['process_data_time_ns']
+
+def test_fused_node_takes_process_settings_from_the_head(make_node):
+    dag, [source, first, second, sink] = chain(make_node, AddOne, Double)
+    first.profile, first.cpu_affinity = True, [0]
+    second.hot = True
+    fused = dag.fuse([first, second])
+    assert fused.profile and fused.cpu_affinity == [0] and fused.hot
+    assert not first.profile and first.cpu_affinity is None
+    assert first.stop_event is fused.stop_event is second.stop_event
+
+def test_fuse_rejects_non_chains(make_node):
+    dag, [source, first, second, sink] = chain(make_node, AddOne, Double)
+    other = make_node('other')
+    dag.connect_data(first, other, Queue(), 'first->other')
+    with pytest.raises(ValueError):
+        dag.fuse([first, second])
+    with pytest.raises(ValueError):
+        dag.fuse([first])
+
+def test_auto_fuse_only_fuses_fusible_chains(make_node):
+    dag = ProcessingDAG()
+    source = make_node('source')
+    a, b, c = [make_node(name, node_class = AddOne, fusible = True) for name in 'abc']
+    d = make_node('d', node_class = AddOne)
+    fan_out = [make_node(name, node_class = AddOne, fusible = True) for name in ['x', 'y']]
+    for sender, receiver in [(source, a), (a, b), (b, c), (c, d), (d, fan_out[0]), (d, fan_out[1])]:
+        dag.connect_data(sender, receiver, Queue(), f'{sender.name}->{receiver.name}')
+
+    fused = dag.auto_fuse()
+    assert len(fused) == 1
+    assert isinstance(fused[0], FusedNode)
+    assert fused[0].nodes == [a, b, c]
+    assert fused[0].process_data(0) == 3
+
+def test_inner_nodes_get_their_commands(make_node):
+    dag, [source, first, second, sink] = chain(make_node, AddOne, Double)
+    fused = dag.fuse([first, second])
+    dag.send_control('node_1', 'gain', 2)
+    fused.poll_control()
+    assert second.commands == [('gain', 2)]
+    assert first.commands == []
+    assert dag.control_stats()['node_1'].commands == 1
@@ -0,0 +1,76 @@
+import os
+import logging
+import pytest
+import numpy as np
+from dagline import Timing
+from dagline.log_tools import parse_log_file, parse_logs, MAX_ENTRY_SIZE
+
+def entry(num: int) -> str:
+    return (
+        f'2024-01-01 12:00:00,{num % 1000:03d} Process-1 Process-1 node INFO #{num} ,\n'
+        f'            t_start: {num}.0,\n'
+        '            receive_data_time: 0.1, \n'
+        '            process_data_time: 0.2, \n'
+        '            send_data_time: 0.3,\n'
+        '            receive_metadata_time: 0.0, \n'
+        '            process_metadata_time: 0.0, \n'
+        '            send_metadata_time: 0.0,\n'
+        '            total_time: 0.6,\n'
+        f'            t_stop: {num}.6,\n'
+        f'            deadline_misses: {num % 3}\n'
+    )
+
+@pytest.fixture
+def log_file(tmp_path):
+    filename = tmp_path / 'timing.log'
+    filename.write_text(''.join(entry(num) for num in range(1000)))
+    return str(filename)
+
+@pytest.mark.parametrize('chunk_size', [2 * MAX_ENTRY_SIZE, 10_000, 64*1024*1024])
+def test_entries_across_chunks(log_file, chunk_size):
+    columns = parse_log_file(log_file, chunk_size)
+    np.testing.assert_array_equal(columns['num'], np.arange(1000))
+    np.testing.assert_allclose(columns['total_time'], 0.6)
+    np.testing.assert_array_equal(columns['deadline_misses'], np.arange(1000) % 3)
+    assert columns['process_name'][0] == 'node'
+
+def test_entries_without_deadline_misses(tmp_path):
+    filename = tmp_path / 'old.log'
+    filename.write_text(''.join(entry(num).replace(f',\n            deadline_misses: {num % 3}', '') for num in range(10)))
+    columns = parse_log_file(str(filename))
+    np.testing.assert_array_equal(columns['num'], np.arange(10))
+    np.testing.assert_array_equal(columns['deadline_misses'], 0)
+
+def test_node_entries(make_node, tmp_path, caplog):
+    node = make_node('node')
+    caplog.set_level(logging.INFO, logger = 'node')
+    ms = 1_000_000
+    node.log_timings(7, Timing(1000*ms, 0, 1*ms, 3*ms, 6*ms, 6*ms, 6*ms, 6*ms, 1006*ms, deadline_misses = 2))
+    filename = tmp_path / 'timing.log'
+    filename.write_text(f'2024-01-01 12:00:00,000 Process-1 Process-1 node INFO {caplog.records[-1].getMessage()}')
+    columns = parse_log_file(str(filename))
+    np.testing.assert_array_equal(columns['num'], [7])
+    np.testing.assert_allclose(columns['process_data_time'], [2])
+    np.testing.assert_array_equal(columns['deadline_misses'], [2])
+
+def test_chunk_smaller_than_entry(log_file):
+    with pytest.raises(ValueError):
+        parse_log_file(log_file, 300)
+
+def test_empty_file(tmp_path):
+    filename = tmp_path / 'empty.log'
+    filename.write_text('')
+    columns = parse_log_file(str(filename))
+    assert len(columns['num']) == 0
+
+def test_cache(log_file):
+    first = parse_logs(log_file)
+    second = parse_logs(log_file)
+    np.testing.assert_array_equal(first['t_start'], second['t_start'])
+
+def test_cache_without_new_columns(log_file):
+    columns = parse_logs(log_file)
+    del columns['deadline_misses']
+    stat = os.stat(log_file)
+    np.savez(log_file + '.npz', _key = np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64), **columns)
+    np.testing.assert_array_equal(parse_logs(log_file)['deadline_misses'], np.arange(1000) % 3)
@@ -2,8 +2,8 @@ import time
 from numpy.typing import NDArray
 import numpy as np
 import cv2
-from ipc_tools import ObjectRingBuffer2, QueueMP
-from dagline import WorkerNode, ProcessingDAG
+from ipc_tools import QueueMP
+from dagline import WorkerNode, ProcessingDAG, ConflatingQueue
 from typing import Tuple, Dict, Optional
 from PyQt5.QtWidgets import QApplication, QLabel, QWidget, QPushButton, QHBoxLayout
 from multiprocessing_logger import Logger
@@ -51,11 +51,9 @@ class Gui(WorkerNode):
 class Sender(WorkerNode):
 
     def __init__(self, fps:int=30, *args, **kwargs):
-        super().__init__(*args, **kwargs)
+        super().__init__(*args, target_fps=fps, **kwargs)
         self.index = 0
         self.state = False
-        self.prev_time = 0
-        self.fps = fps
 
     def initialize(self) -> None:
         super().initialize()
@@ -68,10 +66,6 @@ class Sender(WorkerNode):
         else:
             image = np.random.randint(0,255,(HEIGHT,WIDTH), dtype=np.uint8)
         timestamp = time.perf_counter() - self.start_time
-        while timestamp-self.prev_time < 1/self.fps:
-            timestamp = time.perf_counter() - self.start_time
-            time.sleep(0.01)
-        self.prev_time = timestamp
         return (self.index, timestamp, image)
     
     def process_metadata(self, metadata: Dict) -> Dict:
@@ -131,15 +125,13 @@ if __name__ == '__main__':
     s = Sender(fps=60, name='sender', logger=worker_logger, logger_queues=queue_logger)
     r = Receiver(name='receiver', logger=worker_logger, logger_queues=queue_logger)
 
-    # create IPC
-    q0 = ObjectRingBuffer2(
-        num_items = 100,
+    # create IPC: displays only need the latest image and text
+    q0 = ConflatingQueue(
         data_type = dt_uint8_gray,
         serialize = serialize_image,
-        deserialize = deserialize_image,
-        name = 'images'
+        deserialize = deserialize_image
     )
-    q1 = QueueMP()
+    q1 = ConflatingQueue()
     q2 = QueueMP()
 
     # create DAG
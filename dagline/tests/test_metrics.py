@@ -0,0 +1,89 @@
+import time
+import urllib.request
+from queue import Queue, Full
+import pytest
+from dagline import MeteredQueue, NodeMetrics, MetricsReader, Timing, ProcessingDAG, prometheus_text, serve_metrics
+
+def timing(start: int) -> Timing:
+    return Timing(
+        start_absolute_ns = start,
+        start_relative_ns = start,
+        receive_data_relative_ns = start + 1000,
+        process_data_relative_ns = start + 3000,
+        send_data_relative_ns = start + 4000,
+        receive_metadata_relative_ns = start + 4000,
+        process_metadata_relative_ns = start + 4000,
+        send_metadata_relative_ns = start + 4000,
+        stop_absolute_ns = start + 5000
+    )
+
+def test_metered_queue_counts():
+    queue = MeteredQueue(Queue(maxsize = 2))
+    queue.put(1)
+    queue.put_nowait(2)
+    with pytest.raises(Full):
+        queue.put_nowait(3)
+    assert queue.get() == 1
+
+    counters = queue.read()
+    assert (counters['enqueued'], counters['dequeued'], counters['full']) == (2, 1, 1)
+    assert queue.qsize() == 1
+
+def test_node_metrics():
+    metrics = NodeMetrics()
+    metrics.update(timing(0))
+    metrics.update(timing(10_000))
+
+    counters = metrics.read()
+    assert counters['iterations'] == 2
+    assert counters['process_data_time_ns'] == 2000
+    assert counters['process_data_time_total_ns'] == 4000
+    assert counters['total_time_total_ns'] == 10_000
+
+def test_snapshot_rates_and_depth():
+    metrics, queue = NodeMetrics(), MeteredQueue(Queue())
+    reader = MetricsReader()
+    first = reader.snapshot({'node': metrics}, {'edge': queue})
+    assert first['edges']['edge']['enqueue_rate_hz'] is None
+    
+    time.sleep(0.01)
+    metrics.update(timing(0))
+    for item in range(3):
+        queue.put(item)
+    queue.get()
+    second = reader.snapshot({'node': metrics}, {'edge': queue})
+
+    assert second['edges']['edge']['depth'] == 2
+    assert second['edges']['edge']['enqueue_rate_hz'] > second['edges']['edge']['dequeue_rate_hz'] > 0
+    assert second['nodes']['node']['iterations'] == 1
+    assert second['nodes']['node']['process_data_time_mean_ms'] == pytest.approx(0.002)
+
+def test_prometheus_text():
+    metrics, queue = NodeMetrics(), MeteredQueue(Queue())
+    metrics.update(timing(0))
+    queue.put(1)
+    lines = prometheus_text({'node': metrics}, {'edge': queue}).splitlines()
+    assert 'dagline_node_iterations_total{node="node"} 1' in lines
+    assert 'dagline_edge_depth{edge="edge"} 1' in lines
+
+def test_serve_metrics():
+    metrics = NodeMetrics()
+    metrics.update(timing(0))
+    server = serve_metrics({'node': metrics}, {}, port = 0)
+    try:
+        port = server.server_address[1]
+        with urllib.request.urlopen(f'http://127.0.0.1:{port}/metrics') as response:
+            body = response.read().decode()
+    finally:
+        server.shutdown()
+    assert 'dagline_node_iterations_total{node="node"} 1' in body
+
+def test_dag_meters_its_edges(make_node):
+    sender, receiver = make_node('sender'), make_node('receiver', receive_data_timeout = 0.1)
+    dag = ProcessingDAG(metrics = True)
+    dag.connect_data(sender, receiver, Queue(), 'edge')
+    assert isinstance(sender.send_data_queues[0], MeteredQueue)
+    sender.send(1)
+    assert receiver.receive() == 1
+    edge = dag.get_metrics()['edges']['edge']
+    assert (edge['enqueued'], edge['dequeued']) == (1, 1)
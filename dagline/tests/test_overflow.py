@@ -0,0 +1,92 @@
+import time
+from queue import Full
+from dagline import ProcessingDAG, LocalQueue, OverflowPolicy, overflow_strategy, send_strategy, dispatch_policy
+from conftest import Node
+
+class Shrink(Node):
+
+    def on_overflow(self, name, item):
+        return item[:2] or None
+
+class SizedQueue(LocalQueue):
+    '''full for items longer than 2'''
+
+    def put(self, item, block = True, timeout = None):
+        if len(item) > 2:
+            raise Full
+        super().put(item, block, timeout)
+
+def make_edge(make_node, policy: OverflowPolicy, queue = None, node_class = Node):
+    dag = ProcessingDAG()
+    sender = make_node('sender', node_class = node_class, send_data_strategy = send_strategy.BROADCAST)
+    receiver = make_node('receiver')
+    queue = queue or LocalQueue(maxsize = 1)
+    dag.connect_data(sender, receiver, queue, 'edge', overflow = policy)
+    return dag, sender, queue
+
+def send(sender, *items) -> None:
+    for item in items:
+        sender.send({'edge': item})
+
+def test_drop_newest(make_node):
+    dag, sender, queue = make_edge(make_node, OverflowPolicy(overflow_strategy.DROP_NEWEST))
+    send(sender, 1, 2, 3)
+    assert list(queue.queue) == [1]
+    assert dag.drop_counts() == {'edge': 2}
+
+def test_drop_oldest(make_node):
+    dag, sender, queue = make_edge(make_node, OverflowPolicy(overflow_strategy.DROP_OLDEST))
+    send(sender, 1, 2, 3)
+    assert list(queue.queue) == [3]
+    assert dag.drop_counts() == {'edge': 2}
+
+def test_block_then_drop(make_node):
+    dag, sender, queue = make_edge(make_node, OverflowPolicy(overflow_strategy.BLOCK, timeout = 0.05))
+    send(sender, 1)
+    start = time.monotonic()
+    send(sender, 2)
+    assert time.monotonic() - start >= 0.05
+    assert list(queue.queue) == [1]
+    assert dag.drop_counts() == {'edge': 1}
+
+def test_sample_while_congested(make_node):
+    dag, sender, queue = make_edge(make_node, OverflowPolicy(overflow_strategy.SAMPLE, sample_every = 3))
+    send(sender, 0, 1, 2, 3, 4) # 1 is found full, then only 4 is tried
+    assert dag.drop_counts() == {'edge': 4}
+    queue.get()
+    send(sender, 5, 6) # dropped without trying
+    assert queue.empty()
+    send(sender, 7)
+    assert list(queue.queue) == [7]
+    assert dag.drop_counts() == {'edge': 6}
+
+def test_degrade(make_node):
+    dag, sender, queue = make_edge(make_node, OverflowPolicy(overflow_strategy.DEGRADE), SizedQueue(), Shrink)
+    send(sender, 'frame')
+    assert list(queue.queue) == ['fr']
+    assert dag.drop_counts() == {'edge': 0}
+    send(sender, 'no') # fits
+    assert list(queue.queue) == ['fr', 'no']
+
+def test_degrade_drops_without_replacement(make_node):
+    dag, sender, queue = make_edge(make_node, OverflowPolicy(overflow_strategy.DEGRADE), SizedQueue())
+    send(sender, 'frame')
+    assert queue.empty()
+    assert dag.drop_counts() == {'edge': 1}
+
+def test_drops_in_metrics(make_node):
+    dag, sender, queue = make_edge(make_node, OverflowPolicy(overflow_strategy.DROP_NEWEST))
+    send(sender, 1, 2)
+    assert dag.get_metrics()['edges']['edge']['dropped'] == 1
+    assert 'dagline_edge_dropped_total{edge="edge"} 1' in dag.get_metrics_text()
+
+def test_dispatch_applies_policy_to_the_queue_it_picks(make_node):
+    dag = ProcessingDAG()
+    sender = make_node('sender', send_data_dispatch_policy = dispatch_policy.ROUND_ROBIN)
+    queues = {name: LocalQueue(maxsize = 1) for name in ['a', 'b']}
+    for name, queue in queues.items():
+        dag.connect_data(sender, make_node(name), queue, name, overflow = OverflowPolicy(overflow_strategy.DROP_OLDEST))
+    for item in [1, 2, 3, 4]:
+        sender.send(item)
+    assert {name: list(queue.queue) for name, queue in queues.items()} == {'a': [3], 'b': [4]}
+    assert dag.drop_counts() == {'a': 1, 'b': 1}
@@ -0,0 +1,42 @@
+import time
+from dagline import overrun_policy, sleep_until, executor_type
+
+PERIOD_S = 0.05
+
+def make_paced_node(make_node, overrun: overrun_policy):
+    return make_node(executor = executor_type.THREAD, timing_log = False, target_fps = 1 / PERIOD_S, overrun = overrun)
+
+def test_sleep_until():
+    deadline = time.perf_counter_ns() + 10_000_000
+    sleep_until(deadline)
+    assert time.perf_counter_ns() >= deadline
+
+def test_on_time(make_node):
+    node = make_paced_node(make_node, overrun_policy.SKIP)
+    start = time.perf_counter()
+    misses = [node.pace() for i in range(4)]
+    assert misses == [0, 0, 0, 0]
+    assert time.perf_counter() - start >= 3 * PERIOD_S
+
+def test_late_by_less_than_a_period(make_node):
+    node = make_paced_node(make_node, overrun_policy.SKIP)
+    node.pace()
+    time.sleep(1.2 * PERIOD_S)
+    assert node.pace() == 1
+
+def test_skip_waits_for_the_grid(make_node):
+    node = make_paced_node(make_node, overrun_policy.SKIP)
+    node.pace()
+    start = node.next_deadline_ns - round(PERIOD_S * 1e9)
+    time.sleep(2.6 * PERIOD_S)
+    assert node.pace() == 2 # deadlines at 1 and 2 periods
+    assert time.perf_counter_ns() >= start + round(3 * PERIOD_S * 1e9)
+    assert node.pace() == 0
+
+def test_catch_up_counts_each_deadline_once(make_node):
+    node = make_paced_node(make_node, overrun_policy.CATCH_UP)
+    node.pace()
+    time.sleep(2.6 * PERIOD_S)
+    misses = [node.pace() for i in range(4)]
+    assert misses[0] == 2
+    assert sum(misses) == 2
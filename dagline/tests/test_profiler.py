@@ -0,0 +1,46 @@
+import time
+from dagline import StackSampler, read_collapsed, merge_collapsed
+
+def busy(duration: float) -> None:
+    deadline = time.process_time() + duration
+    while time.process_time() < deadline:
+        pass
+
+def test_sampler_counts_the_busy_function():
+    sampler = StackSampler(interval = 0.001)
+    sampler.start()
+    try:
+        busy(0.1)
+    finally:
+        sampler.stop()
+    stacks = sampler.collapsed()
+    assert sum(stacks.values()) > 10
+    busy_samples = sum(count for stack, count in stacks.items() if 'busy (test_profiler.py' in stack)
+    assert busy_samples > sum(stacks.values()) / 2
+    assert all(stack.startswith('other;') for stack in stacks) # not called from a main loop
+
+def test_dump_and_read(tmp_path):
+    sampler = StackSampler(interval = 0.001)
+    sampler.start()
+    try:
+        busy(0.05)
+    finally:
+        sampler.stop()
+    filename = str(tmp_path / 'node.collapsed')
+    sampler.dump(filename)
+    assert read_collapsed(filename) == sampler.collapsed()
+
+def test_merge_under_a_root_per_node(tmp_path):
+    for name, stacks in [('camera', 'process_data;grab 3\nsend_data 1\n'), ('display', 'process_data;draw 2\n')]:
+        (tmp_path / f'{name}.collapsed').write_text(stacks)
+    files = {name: str(tmp_path / f'{name}.collapsed') for name in ['camera', 'display', 'missing']}
+    merged = str(tmp_path / 'dag.collapsed')
+
+    total, samples = merge_collapsed(files, merged)
+    assert total == 6
+    assert samples == {'camera': 4, 'display': 2}
+    assert read_collapsed(merged) == {
+        'camera;process_data;grab': 3, 
+        'camera;send_data': 1, 
+        'display;process_data;draw': 2
+    }
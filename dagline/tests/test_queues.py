@@ -0,0 +1,125 @@
+import multiprocessing
+from multiprocessing import RawValue
+import queue
+import time
+import numpy as np
+import pytest
+from ipc_tools import QueueMP, RingBuffer, ObjectRingBuffer2
+from dagline import ConflatingQueue, QueueSpec, ProcessingDAG, make_queue, queue_capacity, tuple_layout, set_start_method, executor_type
+from conftest import Node
+
+def test_queue_capacity():
+    assert queue_capacity(None) == 100
+    assert queue_capacity(100, latency_budget_s = 0.1) == 10
+    assert queue_capacity(1000, consumer_rate_hz = 30, latency_budget_s = 0.1) == 3
+    assert queue_capacity(1, latency_budget_s = 0.1) == 2
+
+def test_tuple_layout():
+    layout = tuple_layout((1, 2.0, np.zeros((2, 2), dtype=np.uint8)))
+    assert layout.names == ('f0', 'f1', 'f2')
+    assert layout['f2'].shape == (2, 2)
+    assert tuple_layout((1, 'text')) is None
+
+def test_queue_for_each_layout():
+    assert isinstance(make_queue(QueueSpec(), 'edge'), QueueMP)
+    assert isinstance(make_queue(QueueSpec(sample = {'exposure': 10}), 'edge'), QueueMP)
+    assert isinstance(make_queue(QueueSpec(sample = np.zeros((4, 4))), 'edge'), RingBuffer)
+    assert isinstance(make_queue(QueueSpec(item_shape = (4, 4), data_type = np.uint8), 'edge'), RingBuffer)
+    assert isinstance(make_queue(QueueSpec(sample = (0, 0.0, np.zeros(4))), 'edge'), ObjectRingBuffer2)
+
+def test_conflating_array_keeps_latest():
+    q = ConflatingQueue((2, 3), np.uint8)
+    with pytest.raises(queue.Empty):
+        q.get_nowait()
+    for value in range(3):
+        q.put(np.full((2, 3), value, dtype=np.uint8))
+    item, skipped = q.get_with_skipped()
+    np.testing.assert_array_equal(item, 2)
+    assert skipped == 2
+    assert q.num_skipped.value == 2
+    assert q.empty()
+
+def test_conflating_pickled():
+    q = ConflatingQueue(max_bytes = 1024)
+    q.put({'exposure': 10})
+    q.put({'exposure': 20})
+    assert q.get(timeout = 0.1) == {'exposure': 20}
+    assert q.skipped == 1
+    with pytest.raises(ValueError):
+        q.put(bytes(2048))
+
+def test_conflating_structured():
+    q = make_queue(QueueSpec(sample = (0, 0.0, np.zeros(4)), conflate = True), 'edge')
+    assert isinstance(q, ConflatingQueue)
+    q.put((1, 0.5, np.arange(4.0)))
+    index, timestamp, array = q.get()
+    assert (index, timestamp) == (1, 0.5)
+    np.testing.assert_array_equal(array, np.arange(4.0))
+
+def put_range(q: ConflatingQueue) -> None:
+    q.put(np.arange(4, dtype=np.int32))
+
+def test_conflating_writer_process():
+    q = ConflatingQueue((4,), np.int32)
+    process = multiprocessing.Process(target = put_range, args = (q,))
+    process.start()
+    process.join()
+    np.testing.assert_array_equal(q.get(timeout = 1.0), np.arange(4))
+
+def test_conflating_get_timeout():
+    q = ConflatingQueue(max_bytes = 64)
+    with pytest.raises(queue.Empty):
+        q.get(timeout = 0.01)
+
+class Source(Node):
+    '''sends (index, index / 2, [index] * 3) tuples'''
+    count = 20
+    def process_data(self, data):
+        if self.iteration > self.count:
+            time.sleep(0.001)
+            return None
+        return (self.iteration, self.iteration / 2, np.full(3, self.iteration))
+
+class Check(Node):
+    '''counts the tuples received intact'''
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.received = RawValue('q', 0)
+        self.last = RawValue('q', 0)
+    def process_data(self, data):
+        if data is None:
+            return None
+        index, half, array = data
+        if half == index / 2 and np.all(array == index):
+            self.received.value += 1
+            self.last.value = index
+        return data
+
+@pytest.fixture
+def spawn():
+    method = multiprocessing.get_start_method()
+    set_start_method('spawn')
+    yield
+    set_start_method(method)
+
+def test_structured_edges_in_spawned_processes(spawn, make_node):
+    # spawn pickles the queues along with their serializers
+    dag = ProcessingDAG()
+    settings = dict(executor = executor_type.PROCESS, timing_log = False, receive_data_timeout = 0.05)
+    source = make_node('source', node_class = Source, **settings)
+    middle = make_node('middle', node_class = Check, **settings)
+    sink = make_node('sink', node_class = Check, **settings)
+    sample = (0, 0.0, np.zeros(3))
+    dag.connect_data(source, middle, QueueSpec(sample = sample, num_items = 100), 'source->middle')
+    dag.connect_data(middle, sink, QueueSpec(sample = sample, conflate = True), 'middle->sink')
+
+    dag.start(timeout = 30)
+    try:
+        deadline = time.monotonic() + 10
+        while sink.last.value < Source.count and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        dag.stop()
+    assert middle.received.value == Source.count
+    assert 0 < sink.received.value <= Source.count
+    assert sink.last.value == Source.count
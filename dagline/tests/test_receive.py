@@ -0,0 +1,128 @@
+import time
+from queue import Queue
+from threading import Thread
+from operator import itemgetter
+from dagline import StreamAligner, receive_strategy, collect_mode, send_strategy
+
+def connect(sender, receiver) -> Queue:
+    queue = Queue()
+    sender.register_send_data_queue(queue, 'edge', receiver.receive_data_ready)
+    receiver.register_receive_data_queue(queue, 'edge')
+    return queue
+
+def send_later(node, data, delay: float = 0.05) -> None:
+    Thread(target = lambda: (time.sleep(delay), node.send(data))).start()
+
+def test_poll_wakes_up_on_send(make_node):
+    sender, receiver = make_node('sender'), make_node('receiver', receive_data_timeout = 5)
+    connect(sender, receiver)
+    send_later(sender, 1)
+    start = time.monotonic()
+    assert receiver.receive() == 1
+    assert time.monotonic() - start < 1
+
+def test_poll_timeout(make_node):
+    sender, receiver = make_node('sender'), make_node('receiver', receive_data_timeout = 0.05)
+    connect(sender, receiver)
+    assert receiver.receive() is None
+    sender.send(2)
+    assert receiver.receive() == 2
+
+def test_stop_wakes_up_poll(make_node):
+    sender, receiver = make_node('sender'), make_node('receiver', receive_data_timeout = 5)
+    connect(sender, receiver)
+    Thread(target = lambda: (time.sleep(0.05), receiver.stop())).start()
+    start = time.monotonic()
+    assert receiver.receive() is None
+    assert time.monotonic() - start < 1
+
+def inputs(node, *names) -> dict:
+    queues = {name: Queue() for name in names}
+    for name, queue in queues.items():
+        node.register_receive_data_queue(queue, name)
+    return queues
+
+def test_aligned_collect(make_node):
+    node = make_node(
+        receive_data_strategy = receive_strategy.COLLECT, 
+        receive_data_aligner = StreamAligner(itemgetter(0)),
+        receive_data_timeout = 0.05
+    )
+    queues = inputs(node, 'left', 'right')
+    for key in [1, 2]:
+        queues['left'].put((key, 'a'))
+    queues['right'].put((2, 'b'))
+    assert node.receive() == {'left': (2, 'a'), 'right': (2, 'b')}
+    assert node.receive_data_aligner.num_discarded == {'left': 1, 'right': 0}
+
+def test_collect_all(make_node):
+    node = make_node(receive_data_strategy = receive_strategy.COLLECT, receive_data_timeout = 0.05)
+    queues = inputs(node, 'left', 'right')
+    queues['left'].put(1)
+    queues['right'].put(2)
+    assert node.receive() == {'left': 1, 'right': 2}
+
+def test_collect_timeout_gives_none_per_input(make_node):
+    node = make_node(receive_data_strategy = receive_strategy.COLLECT, receive_data_timeout = 0.05)
+    queues = inputs(node, 'left', 'middle', 'right')
+    queues['left'].put(1)
+    start = time.monotonic()
+    assert node.receive() == {'left': 1, 'middle': None, 'right': None}
+    assert time.monotonic() - start < 0.09 # one deadline for all inputs
+
+def test_collect_any(make_node):
+    node = make_node(
+        receive_data_strategy = receive_strategy.COLLECT, 
+        receive_data_collect_mode = collect_mode.ANY,
+        receive_data_timeout = 10
+    )
+    queues = inputs(node, 'left', 'right')
+    queues['right'].put(2)
+    assert node.receive() == {'left': None, 'right': 2}
+
+def test_collect_k_of_n_wakes_up_on_send(make_node):
+    sender = make_node('sender', send_data_strategy = send_strategy.BROADCAST)
+    node = make_node(
+        receive_data_strategy = receive_strategy.COLLECT, 
+        receive_data_collect_mode = collect_mode.K_OF_N,
+        receive_data_collect_count = 2,
+        receive_data_timeout = 5
+    )
+    queues = inputs(node, 'a', 'b', 'c')
+    for name, queue in queues.items():
+        sender.register_send_data_queue(queue, name, node.receive_data_ready)
+    queues['a'].put(1)
+    send_later(sender, {'c': 3})
+    start = time.monotonic()
+    assert node.receive() == {'a': 1, 'b': None, 'c': 3}
+    assert time.monotonic() - start < 1
+
+def test_aligned_collect_timeout_with_trace(make_node):
+    node = make_node(
+        receive_data_strategy = receive_strategy.COLLECT, 
+        receive_data_aligner = StreamAligner(itemgetter(0)),
+        receive_data_timeout = 0.01,
+        trace = True
+    )
+    queues = inputs(node, 'left', 'right')
+    queues['left'].put((1, 'a'))
+    assert node.receive() == {'left': None, 'right': None}
+
+class InFlight(Queue):
+    '''counts an item that never becomes readable, like a QueueMP whose feeder thread is stuck'''
+    sweeps = 0
+    def qsize(self):
+        return 1
+    def get_nowait(self):
+        self.sweeps += 1
+        return super().get_nowait()
+
+def test_in_flight_wait_is_bounded(make_node):
+    for strategy in [receive_strategy.POLL, receive_strategy.COLLECT]:
+        node = make_node(receive_data_strategy = strategy, receive_data_timeout = 0.2)
+        queue = InFlight()
+        node.register_receive_data_queue(queue, 'edge')
+        start = time.monotonic()
+        assert node.receive() in [None, {'edge': None}]
+        assert 0.15 < time.monotonic() - start < 1
+        assert queue.sweeps < 500 # blocks on the event in slices instead of yielding until the deadline
@@ -0,0 +1,89 @@
+import time
+import random
+import pytest
+from dagline import ProcessingDAG, ReorderBuffer, LocalQueue, Batch, executor_type, send_strategy, receive_strategy
+from conftest import Node
+
+def test_reorder_in_order():
+    reorder = ReorderBuffer()
+    reorder.push(1, 'b')
+    assert reorder.pop() == (False, None)
+    reorder.push(0, 'a')
+    assert reorder.pop() == (True, 'a')
+    assert reorder.pop() == (True, 'b')
+    assert reorder.pop() == (False, None)
+
+def test_reorder_skips_after_timeout():
+    reorder = ReorderBuffer(timeout = 0.01)
+    reorder.push(2, 'c')
+    assert reorder.pop() == (False, None)
+    time.sleep(0.02)
+    assert reorder.pop() == (True, 'c')
+    assert reorder.num_skipped == 2
+    reorder.push(0, 'a')
+    assert reorder.num_late == 1
+
+def test_reorder_skips_when_full():
+    reorder = ReorderBuffer(timeout = 10, capacity = 2)
+    for sequence in [1, 2, 3]:
+        reorder.push(sequence, sequence)
+    assert reorder.pop() == (True, 1)
+    assert reorder.num_skipped == 1
+
+class Count(Node):
+    '''sends 0, 1, ... count-1 then nothing'''
+    count = 50
+    def process_data(self, data):
+        if self.sequence >= self.count:
+            time.sleep(0.001)
+            return None
+        return self.sequence
+
+class Slow(Node):
+    '''multiplies each item of a batch by ten, taking a random time'''
+    def process_data(self, batch):
+        if batch is None:
+            return None
+        time.sleep(random.uniform(0, 0.005))
+        return Batch([None if item % 7 == 3 else 10 * item for item in batch])
+
+class Collect(Node):
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.received = []
+    def process_data(self, data):
+        if data is not None:
+            self.received.append(data)
+
+def test_replicated_stage_restores_order_with_batches(make_node):
+    dag = ProcessingDAG()
+    settings = dict(executor = executor_type.THREAD, timing_log = False, receive_data_timeout = 0.05)
+    source = make_node('source', node_class = Count, **settings)
+    sink = make_node('sink', node_class = Collect, **settings)
+    replicas = dag.connect_replicated(
+        source, 
+        sink, 
+        lambda index: make_node(f'replica_{index}', node_class = Slow, receive_data_batch_size = 4, receive_data_batch_timeout = 0.01, **settings), 
+        num_replicas = 3,
+        queue_factory = LocalQueue
+    )
+    assert len(replicas) == 3
+
+    expected = [10 * item for item in range(Count.count) if item % 7 != 3]
+    dag.start(timeout = 5)
+    try:
+        deadline = time.monotonic() + 5
+        while len(sink.received) < len(expected) and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        dag.stop()
+    assert sink.received == expected
+    assert sink.reorder.num_skipped == 0
+
+def test_replicated_stage_rejects_conflicting_strategies(make_node):
+    dag = ProcessingDAG()
+    with pytest.raises(ValueError, match = 'DISPATCH'):
+        dag.connect_replicated(make_node('source', send_data_strategy = send_strategy.BROADCAST), make_node('sink'), make_node, 2)
+    with pytest.raises(ValueError, match = 'POLL'):
+        dag.connect_replicated(make_node('source'), make_node('sink', receive_data_strategy = receive_strategy.COLLECT), make_node, 2)
+    assert dag.data_edges == []
@@ -0,0 +1,57 @@
+import time
+from queue import Queue
+from threading import Thread
+from dagline import metadata_schedule
+from conftest import Node
+
+class Recorder(Node):
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.metadata = []
+
+    def process_metadata(self, metadata):
+        self.metadata.append(metadata)
+
+def connect_metadata(sender, receiver) -> Queue:
+    queue = Queue()
+    sender.register_send_metadata_queue(queue, 'edge', receiver.receive_metadata_ready)
+    receiver.register_receive_metadata_queue(queue, 'edge', sender.send_metadata_space)
+    return queue
+
+def test_inline_every_iteration(make_node):
+    node = make_node()
+    assert all(node.metadata_due() for i in range(3))
+
+def test_periodic(make_node):
+    node = make_node(metadata_schedule = metadata_schedule.PERIODIC, metadata_period = 0.05)
+    assert node.metadata_due()
+    assert not node.metadata_due()
+    time.sleep(0.06)
+    assert node.metadata_due()
+
+def test_on_ready(make_node):
+    sender = make_node('sender')
+    node = make_node(metadata_schedule = metadata_schedule.ON_READY)
+    connect_metadata(sender, node)
+    assert not node.metadata_due()
+    sender.send_metadata({'edge': 'exposure'})
+    assert node.metadata_due()
+    assert not node.metadata_due()
+
+def test_thread_wakes_up_on_metadata(make_node):
+    sender = make_node('sender')
+    node = make_node(node_class = Recorder, metadata_schedule = metadata_schedule.THREAD)
+    connect_metadata(sender, node)
+    thread = Thread(target = node.metadata_loop)
+    thread.start()
+
+    sender.send_metadata({'edge': 'exposure'})
+    deadline = time.monotonic() + 1
+    while not node.metadata and time.monotonic() < deadline:
+        time.sleep(0.001)
+    node.stop()
+    thread.join(1)
+
+    assert node.metadata == [{'edge': 'exposure'}]
+    assert not thread.is_alive()
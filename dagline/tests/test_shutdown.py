@@ -0,0 +1,51 @@
+import time
+from multiprocessing import RawValue
+from ipc_tools import QueueMP
+from dagline import ProcessingDAG, executor_type
+from conftest import Node
+
+class Source(Node):
+    '''sends count large items as fast as it can'''
+    count = 300
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.sent = RawValue('q', 0)
+    def process_data(self, data):
+        if self.sent.value >= self.count:
+            time.sleep(0.001)
+            return None
+        self.sent.value += 1
+        return bytes(10_000)
+
+class Slow(Node):
+    def process_data(self, data):
+        time.sleep(0.001)
+        return data
+
+class Count(Node):
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.received = RawValue('q', 0)
+    def process_data(self, data):
+        if data is not None:
+            self.received.value += 1
+
+def test_stop_process_chain_under_load(make_node):
+    dag = ProcessingDAG()
+    settings = dict(executor = executor_type.PROCESS, timing_log = False, receive_data_timeout = 0.01)
+    source = make_node('source', node_class = Source, **settings)
+    middle = make_node('middle', node_class = Slow, **settings)
+    sink = make_node('sink', node_class = Count, **settings)
+    dag.connect_data(source, middle, QueueMP(), 'source->middle')
+    dag.connect_data(middle, sink, QueueMP(), 'middle->sink')
+
+    dag.start(timeout = 5)
+    time.sleep(0.05) # stop while items are still queued, most of them in the source's feeder thread
+    start = time.monotonic()
+    drain_stats = dag.stop(drain_timeout = 5)
+
+    assert time.monotonic() - start < 10
+    assert not any(node.process.is_alive() for node in [source, middle, sink])
+    assert 0 < source.sent.value
+    assert sink.received.value == source.sent.value
+    assert all(stats.remaining == 0 for stats in drain_stats.values())
@@ -0,0 +1,53 @@
+import time
+import pytest
+from dagline import ProcessingDAG, LocalQueue, executor_type
+from conftest import Node
+
+class SlowStart(Node):
+
+    def initialize(self) -> None:
+        super().initialize()
+        time.sleep(self.delay)
+
+class CountWarmup(Node):
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.calls = 0
+        self.warmup_calls = None
+
+    def process_data(self, data):
+        self.calls += 1
+        return data
+
+    def warmup(self) -> None:
+        super().warmup()
+        self.warmup_calls = self.calls
+
+def make_dag(make_node, delay: float):
+    dag = ProcessingDAG()
+    source = make_node('source', node_class = SlowStart, executor = executor_type.THREAD, timing_log = False)
+    source.delay = delay
+    sink = make_node('sink', node_class = CountWarmup, executor = executor_type.THREAD, timing_log = False, warmup_iterations = 3, receive_data_timeout = 0.01)
+    dag.connect_data(source, sink, LocalQueue(), 'edge')
+    return dag, source, sink
+
+def test_start_reports_startup_durations(make_node):
+    dag, source, sink = make_dag(make_node, delay = 0.05)
+    startup = dag.start(timeout = 5)
+    try:
+        assert startup['source'].initialize_s >= 0.05
+        assert startup['source'].ready_s >= startup['source'].initialize_s
+        assert startup['sink'].ready_s is not None
+        assert sink.warmup_calls == 3
+        assert source.ready.is_set() and sink.ready.is_set()
+    finally:
+        dag.stop()
+
+def test_start_timeout_names_the_late_nodes(make_node):
+    dag, source, sink = make_dag(make_node, delay = 0.5)
+    with pytest.raises(TimeoutError, match = 'source'):
+        dag.start(timeout = 0.1)
+    assert not dag.running
+    source.process.join(2)
+    assert not source.process.is_alive()
@@ -0,0 +1,48 @@
+import multiprocessing
+import numpy as np
+from dagline import TimingRing, Timing, timing_durations
+
+def timing(start: int) -> Timing:
+    return Timing(
+        start_absolute_ns = start,
+        start_relative_ns = start,
+        receive_data_relative_ns = start + 1_000_000,
+        process_data_relative_ns = start + 3_000_000,
+        send_data_relative_ns = start + 4_000_000,
+        receive_metadata_relative_ns = start + 4_000_000,
+        process_metadata_relative_ns = start + 4_000_000,
+        send_metadata_relative_ns = start + 4_000_000,
+        stop_absolute_ns = start + 4_000_000
+    )
+
+def test_ring_keeps_latest_records_in_order():
+    ring = TimingRing(num_items = 4)
+    for iteration in range(1, 7):
+        ring.write(iteration, timing(iteration * 10_000_000))
+    records = ring.read()
+    np.testing.assert_array_equal(records['iteration'], [3, 4, 5, 6])
+
+def test_ring_every():
+    ring = TimingRing(num_items = 10, every = 2)
+    for iteration in range(1, 7):
+        ring.write(iteration, timing(0))
+    np.testing.assert_array_equal(ring.read()['iteration'], [2, 4, 6])
+
+def write_one(ring: TimingRing) -> None:
+    ring.write(1, timing(0))
+
+def test_ring_spawned_writer():
+    # spawn pickles the ring: the records view must be rebuilt on the shared buffer
+    ring = TimingRing(num_items = 4)
+    process = multiprocessing.get_context('spawn').Process(target = write_one, args = (ring,))
+    process.start()
+    process.join()
+    np.testing.assert_array_equal(ring.read()['iteration'], [1])
+
+def test_durations():
+    ring = TimingRing(num_items = 4)
+    ring.write(1, timing(0))
+    durations = timing_durations(ring.read())
+    np.testing.assert_allclose(durations['receive_data_time'], [1])
+    np.testing.assert_allclose(durations['process_data_time'], [2])
+    np.testing.assert_allclose(durations['total_time'], [4])
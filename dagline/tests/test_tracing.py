@@ -0,0 +1,50 @@
+from queue import Queue
+from dagline import TraceContext, Traced, receive_strategy
+
+def connect(sender, receiver, name: str = 'edge') -> Queue:
+    queue = Queue()
+    sender.register_send_data_queue(queue, name, receiver.receive_data_ready)
+    receiver.register_receive_data_queue(queue, name, sender.send_data_space)
+    return queue
+
+def test_forward_appends_a_hop():
+    context = TraceContext(sequence = 1, origin_ns = 100, sent_ns = 150)
+    context = context.forward('node', received_ns = 200, sent_ns = 260)
+    assert context.hops == (('node', 50, 60),)
+    assert (context.origin_ns, context.sent_ns) == (100, 260)
+
+def test_context_travels_along_the_chain(make_node):
+    source, middle, sink = [make_node(name, trace = True, receive_data_timeout = 0.1) for name in ['source', 'middle', 'sink']]
+    edge = connect(source, middle)
+    connect(middle, sink)
+
+    source.receive() # no input: the item originates here
+    source.send('frame')
+    assert isinstance(edge.queue[0], Traced)
+    assert middle.receive() == 'frame'
+    middle.send('result')
+    assert sink.receive() == 'result'
+
+    context = sink.trace_context
+    assert [hop[0] for hop in context.hops] == ['source', 'middle']
+    assert context.origin_ns == source.trace_received_ns
+    assert all(wait_ns >= 0 and busy_ns >= 0 for node, wait_ns, busy_ns in context.hops)
+
+def test_collect_keeps_the_oldest_context(make_node):
+    early, late = make_node('early', trace = True), make_node('late', trace = True)
+    sink = make_node('sink', trace = True, receive_data_strategy = receive_strategy.COLLECT, receive_data_timeout = 0.1)
+    connect(early, sink, 'early')
+    connect(late, sink, 'late')
+
+    early.receive()
+    late.receive()
+    late.send(2)
+    early.send(1)
+    assert sink.receive() == {'early': 1, 'late': 2}
+    assert sink.trace_context.hops[0][0] == 'early'
+
+def test_untraced_nodes_send_plain_data(make_node):
+    source, sink = make_node('source'), make_node('sink', receive_data_timeout = 0.1)
+    edge = connect(source, sink)
+    source.send('frame')
+    assert edge.queue[0] == 'frame'
@@ -1,17 +1,27 @@
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
-from multiprocessing import Event, Process, Barrier
-from typing  import Any, Optional, Dict, Iterator, Iterable
+import multiprocessing
+from multiprocessing import Event, Process, Barrier, RawArray, RawValue, Value
+from threading import BrokenBarrierError
+from typing  import Any, Optional, Dict, Iterator, Iterable, List, Tuple, NamedTuple, Callable, TYPE_CHECKING
 import time
-from itertools import cycle
+import random
+from itertools import cycle, islice
+from collections import deque
 from queue import Empty, Full
 from enum import Enum
 import cProfile
 import pstats
 from multiprocessing_logger import Logger
-from ipc_tools import QueueLike
+from ipc_tools import QueueLike, QueueMP
 import os
 import gc
+from threading import Thread
+from .arena import ArenaHandle, map_leaves, find_handles
+from .profiler import StackSampler
+
+if TYPE_CHECKING:
+    from .telemetry import TimingRing # telemetry imports Timing from this module
 
 @dataclass
 class Timing:
@@ -24,6 +34,7 @@ class Timing:
     process_metadata_relative_ns: int = 0
     send_metadata_relative_ns: int = 0
     stop_absolute_ns: int = 0
+    deadline_misses: int = 0 # deadlines missed since the previous iteration, with target_fps
 
     @property
     def t_start_ms(self):
@@ -61,16 +72,189 @@ class Timing:
     def total_time_ms(self):
         return (self.stop_absolute_ns - self.start_absolute_ns) * 1e-6
     
+class TraceContext(NamedTuple):
+    '''
+    Travels with a data item through the DAG when tracing is enabled.
+    Timestamps come from perf_counter_ns, which is system-wide on linux.
+    Each hop is (node name, time waiting in the input queue, time spent in the node), in ns.
+    '''
+
+    sequence: int
+    origin_ns: int
+    sent_ns: int
+    hops: Tuple[Tuple[str, int, int], ...] = ()
+
+    def forward(self, node: str, received_ns: int, sent_ns: int) -> 'TraceContext':
+        '''new context with the hop through node appended'''
+        queue_wait_ns = max(received_ns - self.sent_ns, 0)
+        hop = (node, queue_wait_ns, sent_ns - received_ns)
+        return self._replace(sent_ns = sent_ns, hops = self.hops + (hop,))
+
+class Traced(NamedTuple):
+    '''envelope for data sent with a trace context, edges must be able to carry python objects'''
+    context: TraceContext
+    payload: Any
+
+def oldest_trace(a: Optional[TraceContext], b: Optional[TraceContext]) -> Optional[TraceContext]:
+    if a is None or (b is not None and b.origin_ns < a.origin_ns):
+        return b
+    return a
+
+class Sequenced(NamedTuple):
+    '''envelope numbering the items sent to a replicated stage so that order can be restored'''
+    sequence: int
+    payload: Any
+
+class ReorderBuffer:
+    '''
+    Restore sequence order on the output of a replicated stage. 
+    If the next item is missing for more than timeout seconds, or more than capacity
+    items are waiting, give up on it and skip to the oldest item available.
+    '''
+
+    def __init__(self, timeout: float = 1.0, capacity: int = 1000) -> None:
+        self.timeout = timeout
+        self.capacity = capacity
+        self.items = {}
+        self.next_sequence = 0
+        self.waiting_since = None
+        self.num_skipped = 0
+        self.num_late = 0
+        self.discarded = [] # late items, for the node to release their arena slots
+
+    def push(self, sequence: int, item: Any) -> None:
+        if sequence < self.next_sequence:
+            self.num_late += 1 # already skipped
+            self.discarded.append(item)
+            return
+        self.items[sequence] = item
+
+    def pop(self) -> Tuple[bool, Any]:
+        '''(True, item) if the next item in sequence is available, (False, None) otherwise'''
+
+        if self.next_sequence in self.items:
+            self.waiting_since = None
+            item = self.items.pop(self.next_sequence)
+            self.next_sequence += 1
+            return True, item
+        
+        if not self.items:
+            self.waiting_since = None
+            return False, None
+
+        now = time.monotonic()
+        if self.waiting_since is None:
+            self.waiting_since = now
+
+        if now - self.waiting_since > self.timeout or len(self.items) > self.capacity:
+            oldest = min(self.items)
+            self.num_skipped += oldest - self.next_sequence
+            self.next_sequence = oldest
+            return self.pop()
+
+        return False, None
+
+    def time_to_skip(self) -> float:
+        '''seconds before the missing item is skipped'''
+        if self.waiting_since is None:
+            return float('inf')
+        return max(self.timeout - (time.monotonic() - self.waiting_since), 0)
+
+class StreamAligner:
+    '''
+    Join inputs of a COLLECT node by timestamp or sequence number instead of taking 
+    one item per queue. key(item) gives the timestamp (or sequence number) of an item,
+    for instance operator.itemgetter(1) for (index, timestamp, image) tuples. 
+    Each input keeps up to capacity items. A match is emitted as soon as every input 
+    has an item within tolerance of the latest head: for each input, the buffered item 
+    nearest to it. Items older than the match, or too old to ever match, are discarded
+    and counted per input. Keys must increase along each input.
+    '''
+
+    def __init__(self, key: Callable[[Any], float], tolerance: float = 0, capacity: int = 16) -> None:
+        self.key = key
+        self.tolerance = tolerance
+        self.capacity = capacity
+        self.buffers = {}
+        self.num_discarded = {}
+        self.num_matched = 0
+        self.discarded = [] # discarded items, for the node to release their arena slots
+
+    def add_input(self, name: str) -> None:
+        self.buffers[name] = deque()
+        self.num_discarded[name] = 0
+
+    def discard(self, name: str, item: Any) -> None:
+        self.num_discarded[name] += 1
+        self.discarded.append(item)
+
+    def push(self, name: str, item: Any) -> None:
+        payload = item.payload if isinstance(item, Traced) else item
+        buffer = self.buffers[name]
+        buffer.append((self.key(payload), item))
+        if len(buffer) > self.capacity:
+            self.discard(name, buffer.popleft()[1])
+
+    def pop(self) -> Optional[Dict[str, Any]]:
+        '''one item per input, matched within tolerance, or None if no match is possible yet'''
+
+        buffers = self.buffers
+        while buffers and all(buffers.values()):
+
+            reference = max(buffer[0][0] for buffer in buffers.values())
+
+            # heads too old to match the reference won't match anything later either
+            stale = False
+            for name, buffer in buffers.items():
+                while buffer and buffer[0][0] < reference - self.tolerance:
+                    self.discard(name, buffer.popleft()[1])
+                    stale = True
+            if stale:
+                continue
+
+            match = {}
+            for name, buffer in buffers.items():
+                best = min(range(len(buffer)), key=lambda index: abs(buffer[index][0] - reference))
+                for index in range(best):
+                    self.discard(name, buffer.popleft()[1])
+                match[name] = buffer.popleft()[1]
+
+            self.num_matched += 1
+            return match
+
+        return None
+
+class Batch(list):
+    '''
+    List of items received or sent together. process_data receives a Batch when
+    receive_data_batch_size > 1, and a Batch returned by process_data is unpacked 
+    and sent item by item. Return any other container to forward it as one message.
+    '''
+
 class receive_strategy(Enum):
     '''
     POLL: All queues convey the same type of data. Cycle through queues until one is ready to retrieve data.
     COLLECT: Wait for data from all queues to arrive and label the data by queue.
-             Queues can transmit different types of data.
+             Queues can transmit different types of data. With a StreamAligner, 
+             items are matched by timestamp or sequence number.
     '''
 
     POLL = 1
     COLLECT = 2
 
+class collect_mode(Enum):
+    '''
+    When COLLECT returns, waiting on all inputs at once until the timeout at most:
+    ALL: every input delivered an item.
+    ANY: at least one input delivered an item.
+    K_OF_N: at least receive_data_collect_count inputs delivered an item.
+    Inputs without an item are None.
+    '''
+
+    ALL = 1
+    ANY = 2
+    K_OF_N = 3
+
 class send_strategy(Enum):
     '''
     DISPATCH: All queues convey the same type of data. Cycle through queues until one is ready to send data.
@@ -80,6 +264,138 @@ class send_strategy(Enum):
     DISPATCH = 1
     BROADCAST = 2 # TODO this is maybe a bad name, think of something else
 
+class dispatch_policy(Enum):
+    '''
+    ROUND_ROBIN: Try queues in turn, starting after the last one used.
+    LEAST_LOADED: Try queues by increasing occupancy (qsize).
+    POWER_OF_TWO: Pick two queues at random and try the least loaded one first.
+    '''
+
+    ROUND_ROBIN = 1
+    LEAST_LOADED = 2
+    POWER_OF_TWO = 3
+
+class overflow_strategy(Enum):
+    '''
+    What a sender does with an item when an edge is full:
+    BLOCK: Wait up to timeout seconds for space (None waits forever), then drop the item.
+    DROP_NEWEST: Drop the new item.
+    DROP_OLDEST: Evict the oldest item from the queue to make room for the new one.
+    SAMPLE: While the edge stays full, only every sample_every-th item is tried, the 
+            others are dropped without trying.
+    DEGRADE: Try once more with the item returned by the sender's on_overflow(name, item) 
+             hook (e.g. a smaller version), drop it if the hook returns None.
+    '''
+
+    BLOCK = 1
+    DROP_NEWEST = 2
+    DROP_OLDEST = 3
+    SAMPLE = 4
+    DEGRADE = 5
+
+@dataclass
+class OverflowPolicy:
+    strategy: overflow_strategy = overflow_strategy.DROP_NEWEST
+    timeout: Optional[float] = None # BLOCK only
+    sample_every: int = 10 # SAMPLE only
+
+def queue_load(queue: QueueLike) -> int:
+    '''number of items waiting in a queue, 0 if the queue can't tell'''
+    try:
+        return queue.qsize()
+    except NotImplementedError:
+        return 0
+
+class metadata_schedule(Enum):
+    '''
+    INLINE: Receive, process and send metadata after every data item.
+    PERIODIC: In the main loop, at most once every metadata_period seconds.
+    ON_READY: In the main loop, only when a sender has put new metadata. 
+              Nodes that only send metadata never run process_metadata.
+    THREAD: In a separate thread of the node, woken up by incoming metadata or 
+            every metadata_period seconds. process_metadata runs concurrently 
+            with process_data, protect shared state accordingly.
+            Nodes that only send metadata need a metadata_period, otherwise they 
+            fall back to INLINE.
+    In all cases, the metadata stage is skipped entirely if the node has no metadata queues.
+    '''
+
+    INLINE = 1
+    PERIODIC = 2
+    ON_READY = 3
+    THREAD = 4
+
+class executor_type(Enum):
+    '''
+    PROCESS: Run the node in its own process (fork). Data is pickled through IPC queues.
+    THREAD: Run the node in a thread of the parent process. Use for GIL-releasing 
+            (NumPy, OpenCV) or I/O bound work. Edges between two THREAD nodes can 
+            use in-memory queues which pass object references.
+    '''
+
+    PROCESS = 1
+    THREAD = 2
+
+class profiler_type(Enum):
+    '''
+    CPROFILE: deterministic profiler, every call is timed. Accurate call counts but 
+              slows down the node, dumps <name>.prof
+    SAMPLING: counts the call stack every profile_interval seconds of cpu time, with 
+              stacks attributed to main loop stages. Almost no overhead, processes 
+              only, dumps <name>.collapsed. See ProcessingDAG.merge_profiles
+    '''
+
+    CPROFILE = 1
+    SAMPLING = 2
+
+class overrun_policy(Enum):
+    '''
+    What a paced node (target_fps) does when an iteration starts later than its deadline:
+    SKIP: Drop the missed deadlines and wait for the next one on the original grid.
+    CATCH_UP: Keep every deadline, run late iterations back to back until back on time.
+    Either way, each deadline that passes before its iteration starts is counted once.
+    '''
+
+    SKIP = 1
+    CATCH_UP = 2
+
+def sleep_until(deadline_ns: int, spin_ns: int = 200_000, stop: Optional[Event] = None) -> None:
+    '''
+    Sleep until an absolute time.perf_counter_ns() deadline: sleep until spin_ns before 
+    it, then spin to absorb the scheduler's wake-up latency. Return early if stop is set.
+    '''
+    remaining_ns = deadline_ns - time.perf_counter_ns()
+    if remaining_ns > spin_ns:
+        if stop is not None:
+            if stop.wait((remaining_ns - spin_ns) * 1e-9):
+                return
+        else:
+            time.sleep((remaining_ns - spin_ns) * 1e-9)
+    while time.perf_counter_ns() < deadline_ns:
+        pass
+
+def set_start_method(method: str = 'forkserver', preload_modules: Optional[List[str]] = None) -> None:
+    '''
+    How node processes are started: 'fork' (default on linux), 'spawn' or 'forkserver'.
+    With 'forkserver', a small server process imports preload_modules once 
+    (e.g. ['numpy', 'cv2']) and each node is forked from it instead of from the parent.
+    Call once at the top of the main script, before creating nodes, queues and arenas:
+    their events and locks must belong to the same start method.
+    '''
+    multiprocessing.set_start_method(method, force=True)
+    if method == 'forkserver' and preload_modules:
+        multiprocessing.set_forkserver_preload(preload_modules)
+
+# how long a receiver keeps yielding for an item counted by a queue but not readable yet, see in_flight
+IN_FLIGHT_TIMEOUT = 0.002
+
+QUEUE_GROUPS = [
+    ('receive_data', 'receive_data_space'), 
+    ('send_data', 'send_data_ready'), 
+    ('receive_metadata', 'receive_metadata_space'), 
+    ('send_metadata', 'send_metadata_ready')
+]
+
 #TODO: data and metadata methods share a lot of duplicated code. Can I do better without 
 # sacrificing readability ? 
 class WorkerNode(ABC):
@@ -93,20 +409,44 @@ class WorkerNode(ABC):
             send_data_block: bool = False,
             send_data_timeout: Optional[float] = None,
             send_data_strategy: send_strategy = send_strategy.DISPATCH, 
+            send_data_dispatch_policy: dispatch_policy = dispatch_policy.ROUND_ROBIN,
             receive_data_block: bool = True, # TODO maybe wether to block and timeout duration should be defined on a per queue basis
             receive_data_timeout: Optional[float] = 10.0,
             receive_data_strategy: receive_strategy = receive_strategy.POLL,
+            receive_data_spin_time: Optional[float] = 0.0,
+            receive_data_batch_size: int = 1,
+            receive_data_batch_timeout: float = 0.0,
+            receive_data_aligner: Optional[StreamAligner] = None,
+            receive_data_collect_mode: collect_mode = collect_mode.ALL,
+            receive_data_collect_count: int = 1,
             send_metadata_block: bool = False,
             send_metadata_timeout: Optional[float] = None,
             send_metadata_strategy: send_strategy = send_strategy.BROADCAST, 
+            send_metadata_dispatch_policy: dispatch_policy = dispatch_policy.ROUND_ROBIN,
             receive_metadata_block: bool = False,
             receive_metadata_timeout: Optional[float] = 10.0,
             receive_metadata_strategy: receive_strategy = receive_strategy.COLLECT,
+            receive_metadata_spin_time: Optional[float] = 0.0,
+            metadata_schedule: metadata_schedule = metadata_schedule.INLINE,
+            metadata_period: Optional[float] = None,
             profile: bool = False,
+            profiler: profiler_type = profiler_type.CPROFILE,
+            profile_interval: float = 0.005,
             cpu_affinity: Optional[Iterable] = None,
             scheduler_policy: int = 0, # os.SCHED_OTHER on linux
             process_priority: int = 0,
-            disable_gc: bool = False
+            hot: bool = False, # busy node, gets a physical core of its own from ProcessingDAG.plan_affinity
+            fusible: bool = False, # cheap node, ProcessingDAG.auto_fuse may run it in its neighbour's process
+            disable_gc: bool = False,
+            warmup_iterations: int = 0,
+            target_fps: Optional[float] = None,
+            overrun: overrun_policy = overrun_policy.SKIP,
+            pacing_spin_time: float = 0.0002,
+            control_interrupt: bool = False, # a control command wakes up a blocking receive
+            timing_log: bool = True,
+            timing_ring: Optional['TimingRing'] = None,
+            trace: bool = False,
+            executor: executor_type = executor_type.PROCESS
         ) -> None:
         
         super().__init__()
@@ -122,78 +462,204 @@ class WorkerNode(ABC):
 
         self.receive_data_queues = []
         self.receive_data_queue_names = []
+        self.receive_data_space = []
         self.receive_data_queues_iterator = None
         self.receive_data_block = receive_data_block
         self.receive_data_timeout = receive_data_timeout
         self.receive_data_strategy = receive_data_strategy
+        self.receive_data_spin_time = receive_data_spin_time
+        self.receive_data_batch_size = receive_data_batch_size
+        self.receive_data_batch_timeout = receive_data_batch_timeout
+        self.receive_data_aligner = receive_data_aligner
+        self.receive_data_collect_mode = receive_data_collect_mode
+        self.receive_data_collect_count = receive_data_collect_count
+        self.receive_data_ready = Event() # set by senders after each put
 
         self.send_data_queues = []
         self.send_data_queue_names = []
+        self.send_data_ready = []
         self.send_data_queues_iterator = None
         self.send_data_block = send_data_block
         self.send_data_timeout = send_data_timeout
         self.send_data_strategy = send_data_strategy
+        self.send_data_dispatch_policy = send_data_dispatch_policy
+        self.send_data_space = Event() # set by receivers after each get
+        self.send_data_overflow = {} # per-edge OverflowPolicy, set by ProcessingDAG.connect_data
+        self.overflow_congested = {} # SAMPLE edges that are full: items offered since
+        self.drops = {} # number of dropped items per outgoing edge, in shared memory
 
         self.receive_metadata_queues = []
         self.receive_metadata_queue_names = []
+        self.receive_metadata_space = []
         self.receive_metadata_queues_iterator = None
         self.receive_metadata_block = receive_metadata_block
         self.receive_metadata_timeout = receive_metadata_timeout
         self.receive_metadata_strategy = receive_metadata_strategy
+        self.receive_metadata_spin_time = receive_metadata_spin_time
+        self.receive_metadata_ready = Event() # set by senders after each put
+        self.metadata_schedule = metadata_schedule
+        self.metadata_period = metadata_period
+        self.metadata_deadline = 0
+        self.metadata_thread = None
 
         self.send_metadata_queues = []
         self.send_metadata_queue_names = []
+        self.send_metadata_ready = []
         self.send_metadata_queues_iterator = None
         self.send_metadata_block = send_metadata_block
         self.send_metadata_timeout = send_metadata_timeout
         self.send_metadata_strategy = send_metadata_strategy
+        self.send_metadata_dispatch_policy = send_metadata_dispatch_policy
+        self.send_metadata_space = Event() # set by receivers after each get
 
         self.profile = profile
+        self.profiler_type = profiler
+        self.profile_interval = profile_interval
+        self.profiler = None
 
         self.cpu_affinity = cpu_affinity
         self.scheduler_policy = scheduler_policy
         self.process_priority = process_priority
+        self.hot = hot
+        self.fusible = fusible
         self.disable_gc = disable_gc
 
+        self.warmup_iterations = warmup_iterations
+
+        self.target_fps = target_fps
+        self.overrun_policy = overrun
+        self.pacing_spin_time = pacing_spin_time
+        self.next_deadline_ns = None
+        self.missed_deadline_ns = None # last deadline counted as missed
+
+        self.control_queue = QueueMP() # priority lane, see send_control
+        self.control_ready = Event() # set by send_control after each put
+        self.control_interrupt = control_interrupt
+        self.control_latency_ns = RawArray('q', 3) # commands handled, total and max latency
+        self.control_sent = Value('q', 0) # commands put, locked: there may be several senders
+
+        self.ready = Event() # set once initialized and warmed up
+        self.stopped = Event() # set once out of the loop, sent items may still be flushing
+        self.startup_ns = RawArray('q', 3) # initialize duration, warmup duration, monotonic time when ready
+
+        self.timing_log = timing_log
+        self.timing_ring = timing_ring
+        self.node_metrics = None # set by ProcessingDAG(metrics=True)
+
+        self.arenas = {} # set by ProcessingDAG.create_arena
+        self.arena_views = {} # id(view): (view, handle) of the slots held during this iteration
+
+        self.trace = trace
+
+        self.executor = executor
+
+        # set by ProcessingDAG.connect_replicated
+        self.send_data_sequence = False
+        self.sequence = 0
+        self.received_sequence = None # a list for a batch
+        self.reorder = None
+        self.trace_context = None
+        self.trace_received_ns = 0
+
+    def __getstate__(self) -> Dict:
+        '''nodes are pickled when started with spawn or forkserver: leave out processes, threads and iterators'''
+        state = self.__dict__.copy()
+        for attr in ['process', 'metadata_thread']:
+            state.pop(attr, None)
+        state['profiler'] = None
+        for group, events in QUEUE_GROUPS:
+            state[f'{group}_queues_iterator'] = None
+        return state
+
+    def __setstate__(self, state: Dict) -> None:
+        self.__dict__.update(state)
+        self.metadata_thread = None
+        for group, events in QUEUE_GROUPS:
+            if getattr(self, f'{group}_queues'):
+                setattr(self, f'{group}_queues_iterator', cycle(zip(
+                    getattr(self, f'{group}_queue_names'), 
+                    getattr(self, f'{group}_queues'), 
+                    getattr(self, events)
+                )))
+
     def set_barrier(self, barrier: Barrier) -> None:
         self.barrier = barrier
 
-    def register_receive_data_queue(self, queue: QueueLike, name: str):
+    def register_receive_data_queue(self, queue: QueueLike, name: str, space: Optional[Event] = None):
+        '''
+        space is the sender's event, set after each successful get. Puts from outside the DAG 
+        don't set receive_data_ready: use receive_data_spin_time=None to keep polling such queues.
+        '''
         if queue not in self.receive_data_queues:  # should I enforce that?
             self.receive_data_queues.append(queue)
             self.receive_data_queue_names.append(name)
-            self.receive_data_queues_iterator = cycle(zip(self.receive_data_queue_names, self.receive_data_queues))
-
-    def register_send_data_queue(self, queue: QueueLike, name: str):
+            self.receive_data_space.append(space)
+            if self.receive_data_aligner is not None:
+                self.receive_data_aligner.add_input(name)
+            self.receive_data_queues_iterator = cycle(zip(self.receive_data_queue_names, self.receive_data_queues, self.receive_data_space))
+
+    def register_send_data_queue(self, queue: QueueLike, name: str, ready: Optional[Event] = None):
+        '''
+        ready is the receiver's readiness event, set after each successful put. Without it, 
+        the receiver is not woken up by this queue: past its spin time it sleeps until 
+        another input or its timeout. Pass receiver.receive_data_ready when wiring by hand.
+        '''
         if queue not in self.send_data_queues: # should I enforce that?
             self.send_data_queues.append(queue)
             self.send_data_queue_names.append(name)
-            self.send_data_queues_iterator = cycle(zip(self.send_data_queue_names, self.send_data_queues))
+            self.send_data_ready.append(ready)
+            self.drops.setdefault(name, RawValue('q', 0))
+            self.send_data_queues_iterator = cycle(zip(self.send_data_queue_names, self.send_data_queues, self.send_data_ready))
 
-    def register_receive_metadata_queue(self, queue: QueueLike, name: str):
+    def register_receive_metadata_queue(self, queue: QueueLike, name: str, space: Optional[Event] = None):
+        '''space is the sender's event, set after each successful get'''
         if queue not in self.receive_metadata_queues:  # should I enforce that?
             self.receive_metadata_queues.append(queue)
             self.receive_metadata_queue_names.append(name)
-            self.receive_metadata_queues_iterator = cycle(zip(self.receive_metadata_queue_names, self.receive_metadata_queues))
+            self.receive_metadata_space.append(space)
+            self.receive_metadata_queues_iterator = cycle(zip(self.receive_metadata_queue_names, self.receive_metadata_queues, self.receive_metadata_space))
 
-    def register_send_metadata_queue(self, queue: QueueLike, name: str):
+    def register_send_metadata_queue(self, queue: QueueLike, name: str, ready: Optional[Event] = None):
+        '''ready is the receiver's readiness event, set after each successful put'''
         if queue not in self.send_metadata_queues: # should I enforce that?
             self.send_metadata_queues.append(queue)
             self.send_metadata_queue_names.append(name)
-            self.send_metadata_queues_iterator = cycle(zip(self.send_metadata_queue_names, self.send_metadata_queues))
+            self.send_metadata_ready.append(ready)
+            self.drops.setdefault(name, RawValue('q', 0))
+            self.send_metadata_queues_iterator = cycle(zip(self.send_metadata_queue_names, self.send_metadata_queues, self.send_metadata_ready))
 
     def main_loop(self):
 
+        start = time.monotonic_ns()
         self.initialize()
+        initialized = time.monotonic_ns()
+        self.warmup()
+        ready = time.monotonic_ns()
+        self.startup_ns[:] = [initialized - start, ready - initialized, ready]
+        self.ready.set()
         print(f'{self.name} initialized')
 
         self.synchronize_workers() 
 
+        has_metadata = self.has_metadata()
+        if has_metadata and self.metadata_schedule == metadata_schedule.THREAD:
+            if self.metadata_period is None and not self.receive_metadata_queues:
+                # nothing would ever wake the thread up
+                print(f'{self.name}: metadata thread without inputs needs a metadata_period, servicing metadata inline')
+                self.metadata_schedule = metadata_schedule.INLINE
+            else:
+                self.metadata_thread = Thread(target = self.metadata_loop, daemon = True)
+                self.metadata_thread.start()
+
         timing = Timing()
 
         while not self.stop_event.is_set():
             self.iteration += 1
 
+            ## PACING -----------------------------------------------------
+            if self.target_fps:
+                timing.deadline_misses = self.pace()
+
             ## START TIMER ----------------------------------------------
             timing.start_absolute_ns = time.perf_counter_ns()
             timing.start_relative_ns = time.monotonic_ns()
@@ -201,31 +667,174 @@ class WorkerNode(ABC):
             ## DATA -----------------------------------------------------
             data = self.receive()
             timing.receive_data_relative_ns = time.monotonic_ns() 
+            self.poll_control()
 
             results = self.process_data(data)
             timing.process_data_relative_ns = time.monotonic_ns()
+            self.poll_control()
 
             self.send(results)
+            if self.arena_views:
+                self.release_arena_slots()
             timing.send_data_relative_ns = time.monotonic_ns()
+            self.poll_control()
+
+            if self.trace and not self.send_data_queues:
+                self.log_trace()
 
             ## METADATA --------------------------------------------------
-            metadata = self.receive_metadata()
-            timing.receive_metadata_relative_ns = time.monotonic_ns()
+            if has_metadata and self.metadata_due():
+                metadata = self.receive_metadata()
+                timing.receive_metadata_relative_ns = time.monotonic_ns()
 
-            results_md = self.process_metadata(metadata)
-            timing.process_metadata_relative_ns = time.monotonic_ns()
+                results_md = self.process_metadata(metadata)
+                timing.process_metadata_relative_ns = time.monotonic_ns()
 
-            self.send_metadata(results_md)
-            timing.send_metadata_relative_ns = time.monotonic_ns()
+                self.send_metadata(results_md)
+                timing.send_metadata_relative_ns = time.monotonic_ns()
+            else:
+                timing.receive_metadata_relative_ns = timing.send_data_relative_ns
+                timing.process_metadata_relative_ns = timing.send_data_relative_ns
+                timing.send_metadata_relative_ns = timing.send_data_relative_ns
+
+            self.poll_control()
 
             ## STOP TIMER -------------------------------------------------
             timing.stop_absolute_ns = time.perf_counter_ns()
 
             ## LOG TIMINGS ------------------------------------------------
-            self.log_timings(self.iteration,timing)
-            
+            self.record_timing(timing)
+
+        if self.metadata_thread is not None:
+            self.metadata_thread.join()
+
+        self.stopped.set()
         self.cleanup()
 
+    def pace(self) -> int:
+        '''wait for the next deadline at target_fps, return the number of deadlines newly missed'''
+
+        period_ns = round(1e9 / self.target_fps)
+        now = time.perf_counter_ns()
+        if self.next_deadline_ns is None:
+            self.next_deadline_ns = now
+            self.missed_deadline_ns = now - period_ns
+
+        # deadlines are on a fixed grid: no drift
+        missed = 0
+        if now > self.next_deadline_ns:
+            last_passed = self.next_deadline_ns + (now - self.next_deadline_ns) // period_ns * period_ns
+            if self.overrun_policy == overrun_policy.SKIP:
+                missed = (last_passed - self.next_deadline_ns) // period_ns + 1
+                self.next_deadline_ns = last_passed + period_ns
+            else:
+                # late iterations run back to back: only count deadlines not counted yet
+                counted = max(self.missed_deadline_ns, self.next_deadline_ns - period_ns)
+                missed = max(last_passed - counted, 0) // period_ns
+                self.missed_deadline_ns = max(counted, last_passed)
+
+        sleep_until(self.next_deadline_ns, round(self.pacing_spin_time * 1e9), self.stop_event)
+        self.next_deadline_ns += period_ns
+        return missed
+
+    def send_control(self, command: str, value: Any = None) -> None:
+        '''
+        Queue a command on the control lane of the node, from any process. The node
+        checks the lane between stages instead of once per iteration like metadata, 
+        and with control_interrupt=True a blocking receive returns early (None).
+        '''
+        self.control_queue.put((command, value, time.monotonic_ns()))
+        with self.control_sent.get_lock():
+            self.control_sent.value += 1
+        self.control_ready.set()
+        if self.control_interrupt:
+            self.receive_data_ready.set()
+
+    def interrupted(self) -> bool:
+        '''whether a blocking receive should give up'''
+        return self.stop_event.is_set() or (self.control_interrupt and self.control_ready.is_set())
+
+    def poll_control(self) -> None:
+        # cheap check, run between stages
+        if self.control_ready.is_set():
+            self.handle_control()
+
+    def handle_control(self) -> None:
+        # send_control puts, counts then sets: clearing first can't miss a command
+        self.control_ready.clear()
+        self.drain_control()
+
+    def drain_control(self) -> None:
+        '''pass pending commands to process_control and record how long they waited'''
+
+        # QueueMP.put returns before the item reaches the pipe, get_nowait could miss it:
+        # take as many commands as were counted, waiting a little for the ones still on 
+        # their way, and look again at the next check rather than holding up the node
+        while self.control_latency_ns[0] < self.control_sent.value:
+            try:
+                command, value, sent_ns = self.control_queue.get(timeout=IN_FLIGHT_TIMEOUT)
+            except Empty:
+                self.control_ready.set()
+                return
+            latency_ns = time.monotonic_ns() - sent_ns
+            self.control_latency_ns[0] += 1
+            self.control_latency_ns[1] += latency_ns
+            self.control_latency_ns[2] = max(self.control_latency_ns[2], latency_ns)
+            self.process_control(command, value)
+
+    def process_control(self, command: str, value: Any) -> None:
+        '''override to handle control commands, the default ignores them'''
+        pass
+
+    def has_metadata(self) -> bool:
+        return bool(self.receive_metadata_queues or self.send_metadata_queues)
+
+    def record_timing(self, timing: Timing) -> None:
+        '''publish the timings of the current iteration'''
+
+        if self.timing_ring is not None:
+            self.timing_ring.write(self.iteration, timing)
+
+        if self.node_metrics is not None:
+            self.node_metrics.update(timing)
+
+        if self.timing_log:
+            self.log_timings(self.iteration,timing)
+
+    def metadata_due(self) -> bool:
+        '''whether the main loop runs the metadata stage in this iteration'''
+
+        if self.metadata_schedule == metadata_schedule.INLINE:
+            return True
+        
+        if self.metadata_schedule == metadata_schedule.PERIODIC:
+            now = time.monotonic()
+            if now < self.metadata_deadline:
+                return False
+            self.metadata_deadline = now + (self.metadata_period or 0)
+            return True
+        
+        if self.metadata_schedule == metadata_schedule.ON_READY:
+            # senders put then set, so clearing before receiving can't miss anything
+            if not self.receive_metadata_ready.is_set():
+                return False
+            self.receive_metadata_ready.clear()
+            return True
+        
+        return False
+
+    def metadata_loop(self) -> None:
+        '''service metadata in its own thread'''
+
+        while not self.stop_event.is_set():
+            self.receive_metadata_ready.wait(self.metadata_period)
+            self.receive_metadata_ready.clear()
+            if self.stop_event.is_set():
+                break
+            metadata = self.receive_metadata()
+            results_md = self.process_metadata(metadata)
+            self.send_metadata(results_md)
+
     def log_timings(self, iteration: int, timing: Timing):
 
         self.local_logger.info(f'''
@@ -238,7 +847,8 @@ class WorkerNode(ABC):
             process_metadata_time: {timing.process_metadata_time_ms}, 
             send_metadata_time: {timing.send_metadata_time_ms},
             total_time: {timing.total_time_ms},
-            t_stop: {timing.t_stop_ms}
+            t_stop: {timing.t_stop_ms},
+            deadline_misses: {timing.deadline_misses}
         ''')
 
     def initialize(self) -> None:
@@ -246,7 +856,7 @@ class WorkerNode(ABC):
 
         if os.name != 'nt':
             
-            pid = os.getpid()
+            pid = 0 # calling thread, which is the main thread of the process for executor_type.PROCESS
 
             # set process affinity
             if self.cpu_affinity is not None:
@@ -264,20 +874,44 @@ class WorkerNode(ABC):
                 except PermissionError:
                     print("Permission denied. Run as root or grant CAP_SYS_NICE to the Python executable.")
 
-        # initialize loggers
-        self.logger.configure_emitter(self.log_level)
-        self.logger_queues.configure_emitter(self.log_level)
+        # initialize loggers. Threads share the emitters of the parent process
+        if self.executor == executor_type.PROCESS:
+            self.logger.configure_emitter(self.log_level)
+            self.logger_queues.configure_emitter(self.log_level)
 
-        if self.profile:
+        if self.profile and self.profiler_type == profiler_type.CPROFILE:
             self.profiler = cProfile.Profile()
             self.profiler.enable()
 
+        if self.profile and self.profiler_type == profiler_type.SAMPLING:
+            if self.executor == executor_type.THREAD:
+                print(f'{self.name}: the sampling profiler needs a process of its own, not profiling')
+            else:
+                self.profiler = StackSampler(self.profile_interval)
+                self.profiler.start()
+
         if self.disable_gc:
-            gc.disable()
+            gc.disable() # process-wide, also affects the parent for executor_type.THREAD
+
+    def warmup(self) -> None:
+        '''
+        Call process_data(None) warmup_iterations times before the DAG starts, 
+        so that the first real items don't pay for lazy initialization. 
+        Results are discarded. Override to feed representative inputs.
+        '''
+        for i in range(self.warmup_iterations):
+            self.process_data(None)
+            if self.arena_views:
+                self.release_arena_slots()
 
     def synchronize_workers(self) -> None:
         if self.barrier:
-            self.barrier.wait()
+            try:
+                self.barrier.wait()
+            except BrokenBarrierError:
+                # the DAG gave up waiting for other nodes
+                self.stop_event.set()
+                return
         print(f'{self.name} initialized. starting work...')
 
     def cleanup(self) -> None:   
@@ -286,36 +920,49 @@ class WorkerNode(ABC):
             gc.enable()
             gc.collect()
 
-        for q in self.send_data_queues:
-            q.cancel_join_thread()
-
-        for q in self.send_metadata_queues:
-            q.cancel_join_thread()
-
-        self.logger.queue.cancel_join_thread()
-        self.logger_queues.queue.cancel_join_thread()
+        # queues are flushed when the process exits: ProcessingDAG.stop joins it once downstream is drained
 
-        if self.profile:
+        if isinstance(self.profiler, cProfile.Profile):
             self.profiler.disable()
             ps = pstats.Stats(self.profiler)
             ps.dump_stats(self.name + '.prof')
 
+        if isinstance(self.profiler, StackSampler):
+            self.profiler.stop()
+            self.profiler.dump(self.name + '.collapsed')
+
         print(f'{self.name} closing...')
 
     def receive(self) -> Optional[Any]:
         '''receive data'''
-        if self.receive_data_strategy == receive_strategy.COLLECT:
-            return self.collect(
+        data = None
+        self.received_sequence = None
+        if self.receive_data_strategy == receive_strategy.COLLECT and self.receive_data_aligner is not None:
+            data = self.collect_aligned(self.receive_data_timeout)
+        elif self.receive_data_strategy == receive_strategy.COLLECT:
+            data = self.collect(
                 self.receive_data_queue_names,
                 self.receive_data_queues,
+                self.receive_data_space,
                 self.receive_data_block,
-                self.receive_data_timeout
+                self.receive_data_timeout,
+                self.receive_data_ready,
+                self.receive_data_spin_time,
+                self.receive_data_collect_mode,
+                self.receive_data_collect_count
             )
         elif self.receive_data_strategy == receive_strategy.POLL:
-            return self.poll(
-                self.receive_data_queues_iterator,
-                self.receive_data_timeout
-            )
+            data = self.poll_data(self.receive_data_timeout)
+            if data is not None and self.receive_data_batch_size > 1:
+                data = self.receive_batch(data)
+
+        if self.trace:
+            data = self.receive_trace(data)
+
+        if self.arenas:
+            data = map_leaves(data, lambda item: self.arena_view(item) if isinstance(item, ArenaHandle) else item)
+
+        return data
 
     def receive_metadata(self) -> Optional[Any]:
         '''receive metadata'''
@@ -323,13 +970,19 @@ class WorkerNode(ABC):
             return self.collect(
                 self.receive_metadata_queue_names,
                 self.receive_metadata_queues,
+                self.receive_metadata_space,
                 self.receive_metadata_block,
-                self.receive_metadata_timeout
+                self.receive_metadata_timeout,
+                self.receive_metadata_ready,
+                self.receive_metadata_spin_time
             )
         elif self.receive_metadata_strategy == receive_strategy.POLL:
             return self.poll(
                 self.receive_metadata_queues_iterator,
-                self.receive_metadata_timeout
+                self.receive_metadata_timeout,
+                len(self.receive_metadata_queues),
+                self.receive_metadata_ready,
+                self.receive_metadata_spin_time
             )
     
     # static method    
@@ -337,69 +990,489 @@ class WorkerNode(ABC):
             self,
             receive_queue_names: list, 
             receive_queues: list, 
+            receive_space: list,
             receive_block:bool, 
-            receive_timeout: Optional[float]
+            receive_timeout: Optional[float],
+            ready: Optional[Event] = None,
+            spin_time: Optional[float] = None,
+            mode: collect_mode = collect_mode.ALL,
+            count: int = 1
         ) -> Dict:
-        '''Each receive queue must receive data'''
+        '''Take one item per queue, as they arrive, until enough queues delivered (see collect_mode)
+        or a single deadline for all queues. Sweep the queues for spin_time seconds, then block on 
+        the ready event between sweeps. Spin until timeout if spin_time is None. Without 
+        receive_block, sweep once. Queues without an item are None.'''
+
+        data = {name: None for name in receive_queue_names}
+        pending = list(zip(receive_queue_names, receive_queues, receive_space))
+
+        if mode == collect_mode.ALL:
+            needed = len(pending)
+        elif mode == collect_mode.ANY:
+            needed = min(1, len(pending))
+        else:
+            needed = min(count, len(pending))
+
+        now = time.monotonic()
+        if not receive_block:
+            deadline = now
+        elif receive_timeout is None:
+            deadline = float('inf')
+        else:
+            deadline = now + receive_timeout
+
+        if spin_time is None or ready is None:
+            spin_deadline = deadline
+        else:
+            spin_deadline = now + spin_time
+
+        in_flight_since = None
+        while True:
+
+            # senders put then set: clear before sweeping so that no put is missed
+            waiting = now >= spin_deadline
+            if waiting:
+                ready.clear()
+
+            for name, queue, space in list(pending):
+                try:
+                    data[name] = queue.get_nowait()
+                except Empty:
+                    continue
+                pending.remove((name, queue, space))
+                in_flight_since = None
+                if space is not None:
+                    space.set()
 
-        data = {}
-        for name, queue in zip(receive_queue_names, receive_queues):
+            if len(receive_queues) - len(pending) >= needed:
+                return data
+
+            now = time.monotonic()
+            if now >= deadline or self.interrupted():
+                return data
+
+            if waiting:
+                in_flight_since = self.wait_for_data(ready, [queue for name, queue, space in pending], deadline, now, in_flight_since)
+
+    def wait_for_data(
+            self,
+            ready: Event,
+            queues: List[QueueLike],
+            deadline: float,
+            now: float,
+            in_flight_since: Optional[float]
+        ) -> Optional[float]:
+        '''
+        Block on ready until a sender signals data, or deadline. If an item is on its way
+        (see in_flight), its event is already spent: yield to let it arrive instead, for
+        IN_FLIGHT_TIMEOUT seconds since in_flight_since at most, then only block for
+        IN_FLIGHT_TIMEOUT at a time. Return when the current wait for an item in flight
+        started, None if there is none.
+        '''
+        timeout = None if deadline == float('inf') else deadline - now
+
+        if not self.in_flight(queues):
+            self.wait_on(ready, timeout, 'receive_blocked_ns')
+            return None
+
+        if in_flight_since is None:
+            in_flight_since = now
+
+        if now - in_flight_since < IN_FLIGHT_TIMEOUT:
+            time.sleep(0) # let the sender's feeder thread flush, then sweep again
+        else:
+            self.wait_on(ready, IN_FLIGHT_TIMEOUT if timeout is None else min(timeout, IN_FLIGHT_TIMEOUT), 'receive_blocked_ns')
+        return in_flight_since
+
+    def wait_on(self, event: Event, timeout: Optional[float], counter: str) -> bool:
+        '''wait for an event, adding the time blocked to a node metrics counter'''
+        if self.node_metrics is None:
+            return event.wait(timeout)
+        start = time.perf_counter_ns()
+        result = event.wait(timeout)
+        self.node_metrics.add(counter, time.perf_counter_ns() - start)
+        return result
+
+    # static method
+    def in_flight(self, queues: Iterable[QueueLike]) -> bool:
+        '''
+        Whether a queue found empty by get_nowait still counts items. Multiprocessing queues
+        (QueueMP) return from put before a feeder thread writes the item to the pipe, so the
+        sender's event can be set before the item can be read: don't sleep on the event then.
+        '''
+        for queue in queues:
             try:
-                data[name] = queue.get(block=receive_block, timeout=receive_timeout)
-            except Empty:
-                data[name] = None
+                if queue.qsize() > 0:
+                    return True
+            except NotImplementedError:
+                return True # no qsize on macOS, can't tell
+        return False
 
-        return data
-    
     # static method
     def poll(
             self,
             receive_queues_iterator: Optional[Iterator],
             receive_timeout: Optional[float],
-
+            num_queues: int = 1,
+            ready: Optional[Event] = None,
+            spin_time: Optional[float] = None
         ) -> Optional[Any]:
-        '''Use if all queues are equivalent. Return data from the first queue that is ready'''
+        '''Use if all queues are equivalent. Return data from the first queue that is ready.
+        Cycle through the queues for spin_time seconds, then block on the ready event
+        until a sender signals new data. Spin until timeout if spin_time is None.'''
 
         if receive_queues_iterator is not None:
 
+            now = time.monotonic()
             if receive_timeout is None:
                 deadline = float('inf')
             else:
-                deadline = time.monotonic() + receive_timeout
+                deadline = now + receive_timeout
 
-            for name, queue in receive_queues_iterator:
-                
-                if time.monotonic() > deadline:
-                    return None
+            if spin_time is None or ready is None:
+                spin_deadline = deadline
+            else:
+                spin_deadline = now + spin_time
+
+            missed = []
+            in_flight_since = None
+            for name, queue, space in receive_queues_iterator:
                 
                 try:
-                    return queue.get_nowait()
+                    data = queue.get_nowait()
+                    if space is not None:
+                        space.set()
+                    return data
                 except Empty:
-                    pass
+                    missed.append(queue)
 
-                # sleep a bit ?
+                # only take a decision after a full sweep over the queues
+                if len(missed) < num_queues:
+                    continue
+                swept, missed = missed, []
+
+                now = time.monotonic()
+                if now > deadline:
+                    return None
+                
+                if now < spin_deadline:
+                    continue
+
+                # Senders put then set the event, so if it is set there may be data
+                # in a queue that was already visited: clear and sweep again.
+                # Otherwise sleep until a sender (or stop) sets it.
+                if ready.is_set():
+                    ready.clear()
+                else:
+                    in_flight_since = self.wait_for_data(ready, swept, deadline, now, in_flight_since)
+
+                if self.interrupted():
+                    return None
 
     def send(self, data: Optional[Any]) -> None:
         '''sends data'''
 
-        if data is None:
+        # replica receiving a batch: tag each output with the sequence of its input
+        sequences = self.received_sequence
+        if isinstance(sequences, list):
+            if data is None:
+                data = Batch([None] * len(sequences))
+            if not isinstance(data, Batch) or len(data) != len(sequences):
+                raise ValueError(f'{self.name} received a batch of {len(sequences)} items on a replicated edge, it must return a Batch of as many items or None')
+            try:
+                for sequence, item in zip(sequences, data):
+                    self.received_sequence = sequence
+                    self.send(item)
+            finally:
+                self.received_sequence = sequences
+            return
+
+        if isinstance(data, Batch):
+            for item in data:
+                self.send(item)
+            return
+
+        # replicas send a marker even without output so that the reorder buffer doesn't wait
+        sequence = self.received_sequence
+        if data is None and sequence is None:
             return
+
+        # send arena views as handles
+        if self.arena_views:
+            data = map_leaves(data, lambda item: self.arena_views[id(item)][1] if id(item) in self.arena_views else item)
+        
+        if data is not None and self.trace:
+            data = self.send_trace(data)
+
+        if sequence is None and self.send_data_sequence:
+            sequence = self.sequence
+            self.sequence += 1
+
+        if sequence is not None:
+            data = Sequenced(sequence, data)
             
         if self.send_data_strategy == send_strategy.BROADCAST:
-            self.broadcast(
+            # each receiver holds a reference to the slots it is sent
+            handles = {}
+            if self.arenas:
+                for name in self.send_data_queue_names:
+                    if name in data:
+                        handles[name] = find_handles(data[name])
+                        self.retain_arena_slots(handles[name])
+
+            sent = self.broadcast(
                 data,
                 self.send_data_queue_names,
                 self.send_data_queues,
+                self.send_data_ready,
                 self.send_data_block,
-                self.send_data_timeout
+                self.send_data_timeout,
+                self.send_data_overflow
                 )
+            
+            for name in handles:
+                if name not in sent:
+                    self.release_arena_slots(handles[name])
+
         elif self.send_data_strategy == send_strategy.DISPATCH:
-            self.dispatch(
+            handles = []
+            if self.arenas:
+                handles = find_handles(data)
+                self.retain_arena_slots(handles)
+
+            # queues are equivalent and share the policy of the first edge
+            policy = self.send_data_overflow.get(self.send_data_queue_names[0]) if self.send_data_queues else None
+            timeout = self.send_data_timeout
+            if policy is not None:
+                timeout = policy.timeout if policy.strategy == overflow_strategy.BLOCK else 0
+
+            sent = self.dispatch(
                 data,
+                self.send_data_queues,
+                self.send_data_ready,
                 self.send_data_queues_iterator,
-                self.send_data_timeout
+                timeout,
+                self.send_data_dispatch_policy,
+                self.send_data_space
+            )
+
+            if not sent and self.send_data_queues:
+                sent = self.dispatch_overflow(
+                    data,
+                    self.send_data_queue_names,
+                    self.send_data_queues,
+                    self.send_data_ready,
+                    self.send_data_queues_iterator,
+                    self.send_data_dispatch_policy,
+                    policy
+                )
+
+            if not sent:
+                self.release_arena_slots(handles)
+
+    def alloc(self, arena: str, block: bool = True, timeout: Optional[float] = None) -> Optional[Any]:
+        '''
+        NumPy array on a free slot of a shared arena (see ProcessingDAG.create_arena),
+        to fill in place. When process_data returns it, alone or inside a tuple, list or 
+        dict, a small handle is sent instead and receivers get a view on the same memory. 
+        None if no slot is free before timeout, or if the node is stopped.
+        '''
+        handle = self.arenas[arena].alloc(block, timeout, self.stop_event)
+        if handle is None:
+            return None
+        return self.arena_view(handle)
+
+    def arena_view(self, handle: ArenaHandle) -> Any:
+        '''view on an arena slot, the node holds a reference to it until the end of the iteration'''
+        view = self.arenas[handle.arena].view(handle)
+        self.arena_views[id(view)] = (view, handle)
+        return view
+
+    def retain_arena_slots(self, handles: List[ArenaHandle]) -> None:
+        for handle in handles:
+            self.arenas[handle.arena].retain(handle)
+
+    def release_arena_slots(self, handles: Optional[List[ArenaHandle]] = None) -> None:
+        '''release the given handles, or all the slots held during this iteration'''
+
+        if handles is None:
+            handles = [handle for view, handle in self.arena_views.values()]
+            self.arena_views.clear()
+
+        for handle in handles:
+            self.arenas[handle.arena].release(handle)
+
+    def poll_data(self, timeout: Optional[float]) -> Optional[Any]:
+        '''poll the data queues, restoring sequence order if the node has a reorder buffer'''
+
+        if self.reorder is not None:
+            return self.poll_in_order(timeout)
+
+        data = self.poll(
+            self.receive_data_queues_iterator,
+            timeout,
+            len(self.receive_data_queues),
+            self.receive_data_ready,
+            self.receive_data_spin_time
+        )
+
+        # replica: remember the sequence number to tag the output with
+        if isinstance(data, Sequenced):
+            self.received_sequence = data.sequence
+            data = data.payload
+
+        return data
+    
+    def poll_in_order(self, timeout: Optional[float]) -> Optional[Any]:
+        '''poll until the next item in sequence is available'''
+
+        if timeout is None:
+            deadline = float('inf')
+        else:
+            deadline = time.monotonic() + timeout
+
+        while True:
+
+            available, data = self.reorder.pop()
+            if available:
+                if data is None: 
+                    continue # the replica did not produce anything for this item
+                return data
+            
+            now = time.monotonic()
+            if now > deadline:
+                return None
+            
+            wait = min(deadline - now, self.reorder.time_to_skip())
+            item = self.poll(
+                self.receive_data_queues_iterator,
+                None if wait == float('inf') else wait,
+                len(self.receive_data_queues),
+                self.receive_data_ready,
+                self.receive_data_spin_time
             )
 
+            if isinstance(item, Sequenced):
+                self.reorder.push(item.sequence, item.payload)
+                if self.reorder.discarded:
+                    if self.arenas:
+                        self.release_arena_slots(find_handles(self.reorder.discarded))
+                    self.reorder.discarded.clear()
+            elif item is not None:
+                return item
+            elif self.interrupted():
+                return None
+
+    def collect_aligned(self, timeout: Optional[float]) -> Dict:
+        '''drain all data queues into the aligner until it has a match, all inputs None on timeout like collect'''
+
+        aligner = self.receive_data_aligner
+        deadline = float('inf') if timeout is None else time.monotonic() + timeout
+
+        in_flight_since = None
+        while True:
+
+            match = aligner.pop()
+            if aligner.discarded:
+                if self.arenas:
+                    self.release_arena_slots(find_handles(aligner.discarded))
+                aligner.discarded.clear()
+            if match is not None:
+                return match
+
+            # senders put then set: clear before sweeping so that no put is missed
+            self.receive_data_ready.clear()
+            received = False
+            for name, queue, space in zip(self.receive_data_queue_names, self.receive_data_queues, self.receive_data_space):
+                for i in range(aligner.capacity):
+                    try:
+                        item = queue.get_nowait()
+                    except Empty:
+                        break
+                    aligner.push(name, item)
+                    received = True
+                    if space is not None:
+                        space.set()
+            if received:
+                in_flight_since = None
+                continue
+
+            now = time.monotonic()
+            if now > deadline or self.interrupted():
+                return {name: None for name in self.receive_data_queue_names}
+            in_flight_since = self.wait_for_data(self.receive_data_ready, self.receive_data_queues, deadline, now, in_flight_since)
+
+    def receive_batch(self, first: Any) -> Batch:
+        '''after the first item, take up to receive_data_batch_size items arriving within receive_data_batch_timeout'''
+
+        batch = Batch([first])
+        sequences = [self.received_sequence]
+        deadline = time.monotonic() + self.receive_data_batch_timeout
+
+        while len(batch) < self.receive_data_batch_size:
+            self.received_sequence = None
+            item = self.poll_data(max(deadline - time.monotonic(), 0))
+            if item is None:
+                break
+            batch.append(item)
+            sequences.append(self.received_sequence)
+
+        # replica: one sequence number per item
+        self.received_sequence = sequences if sequences[0] is not None else None
+        return batch
+
+    def receive_trace(self, data: Optional[Any]) -> Optional[Any]:
+        '''strip trace contexts from received data and keep the oldest one'''
+
+        self.trace_context = None
+        self.trace_received_ns = time.perf_counter_ns()
+
+        if data is None:
+            return None
+
+        if self.receive_data_strategy == receive_strategy.COLLECT:
+            for name, item in data.items():
+                if isinstance(item, Traced):
+                    data[name] = item.payload
+                    self.trace_context = oldest_trace(self.trace_context, item.context)
+        elif isinstance(data, Batch):
+            for index, item in enumerate(data):
+                if isinstance(item, Traced):
+                    data[index] = item.payload
+                    self.trace_context = oldest_trace(self.trace_context, item.context)
+        elif isinstance(data, Traced):
+            self.trace_context = data.context
+            data = data.payload
+
+        return data
+    
+    def send_trace(self, data: Any) -> Any:
+        '''attach the current trace context to outgoing data'''
+
+        now = time.perf_counter_ns()
+        context = self.trace_context or TraceContext(
+            sequence = self.iteration, 
+            origin_ns = self.trace_received_ns, 
+            sent_ns = self.trace_received_ns
+        )
+        context = context.forward(self.name, self.trace_received_ns, now)
+
+        if self.send_data_strategy == send_strategy.BROADCAST:
+            return {name: Traced(context, item) for name, item in data.items()}
+        return Traced(context, data)
+
+    def log_trace(self) -> None:
+        '''log the complete path of the current item, called by sink nodes'''
+
+        if self.trace_context is None:
+            return
+
+        context = self.trace_context.forward(self.name, self.trace_received_ns, time.perf_counter_ns())
+        hops = ';'.join(f'{node}:{wait_ns*1e-6}:{busy_ns*1e-6}' for node, wait_ns, busy_ns in context.hops)
+        self.local_logger.info(
+            f'trace #{context.sequence}, origin: {context.origin_ns*1e-6}, latency: {(context.sent_ns-context.origin_ns)*1e-6}, hops: {hops}'
+        )
+
     def send_metadata(self, metadata: Optional[Any]) -> None:
         '''sends data'''
 
@@ -411,15 +1484,22 @@ class WorkerNode(ABC):
                 metadata,
                 self.send_metadata_queue_names,
                 self.send_metadata_queues,
+                self.send_metadata_ready,
                 self.send_metadata_block,
                 self.send_metadata_timeout
                 )
         elif self.send_metadata_strategy == send_strategy.DISPATCH:
-            self.dispatch(
+            sent = self.dispatch(
                 metadata,
+                self.send_metadata_queues,
+                self.send_metadata_ready,
                 self.send_metadata_queues_iterator,
-                self.send_metadata_timeout
+                self.send_metadata_timeout,
+                self.send_metadata_dispatch_policy,
+                self.send_metadata_space
             )
+            if not sent and self.send_metadata_queues:
+                self.count_drop(self.send_metadata_queue_names[0])
 
     # static method
     def broadcast(
@@ -427,32 +1507,140 @@ class WorkerNode(ABC):
             data_dict: Optional[Dict],
             send_queue_names: list,
             send_queues: list,
+            send_ready: list,
             send_block: bool,
-            send_timeout: Optional[float]
-        ) -> None:
-        '''send data to all queues with proper names'''
-
+            send_timeout: Optional[float],
+            overflow: Optional[Dict[str, OverflowPolicy]] = None
+        ) -> List[str]:
+        '''
+        send data to all queues with proper names, return the names of the queues that accepted it.
+        Full edges follow their overflow policy, by default send_block and send_timeout.
+        '''
+
+        sent = []
         if data_dict is None:
-            return
+            return sent
+
+        default = OverflowPolicy(
+            overflow_strategy.BLOCK if send_block else overflow_strategy.DROP_NEWEST, 
+            send_timeout
+        )
 
-        for name, queue in zip(send_queue_names, send_queues):      
+        for name, queue, ready in zip(send_queue_names, send_queues, send_ready):      
             if name in data_dict:
+                policy = overflow.get(name, default) if overflow else default
+                if not self.put_with_policy(name, queue, data_dict[name], policy):
+                    continue
+                if ready is not None:
+                    ready.set()
+                sent.append(name)
+
+        return sent
+
+    def put_with_policy(self, name: str, queue: QueueLike, item: Any, policy: OverflowPolicy) -> bool:
+        '''put item in queue, following the overflow policy if it is full. Return whether the item was sent'''
+
+        strategy = policy.strategy
+
+        if strategy == overflow_strategy.SAMPLE and name in self.overflow_congested:
+            self.overflow_congested[name] += 1
+            if self.overflow_congested[name] % policy.sample_every:
+                self.count_drop(name)
+                return False
+
+        try:
+            if strategy == overflow_strategy.BLOCK:
+                queue.put(item, block=True, timeout=policy.timeout)
+            else:
+                queue.put_nowait(item)
+            self.overflow_congested.pop(name, None)
+            return True
+        except Full:
+            pass
+
+        if strategy == overflow_strategy.DROP_OLDEST:
+            try:
+                evicted = queue.get_nowait()
+            except Empty:
+                pass
+            else:
+                self.count_drop(name)
+                if self.arenas:
+                    self.release_arena_slots(find_handles(evicted))
+            try:
+                queue.put_nowait(item)
+                return True
+            except Full:
+                pass
+
+        elif strategy == overflow_strategy.DEGRADE:
+            item = self.on_overflow(name, item)
+            if item is not None:
                 try:
-                    queue.put(data_dict[name], block=send_block, timeout=send_timeout)
+                    queue.put_nowait(item)
+                    return True
                 except Full:
                     pass
 
+        elif strategy == overflow_strategy.SAMPLE:
+            self.overflow_congested.setdefault(name, 0)
+
+        self.count_drop(name)
+        return False
+
+    def dispatch_overflow(
+            self,
+            data: Any,
+            send_queue_names: list,
+            send_queues: list,
+            send_ready: list,
+            send_queues_iterator: Iterator,
+            order: dispatch_policy,
+            policy: Optional[OverflowPolicy]
+        ) -> bool:
+        '''dispatch found every queue full: apply the policy to the queue the dispatch policy picks (already waited for BLOCK)'''
+
+        queue, ready = next(self.dispatch_order(send_queues, send_ready, send_queues_iterator, order))
+        name = next(name for name, candidate in zip(send_queue_names, send_queues) if candidate is queue)
+        if policy is None or policy.strategy == overflow_strategy.BLOCK:
+            self.count_drop(name)
+            return False
+        
+        sent = self.put_with_policy(name, queue, data, policy)
+        if sent and ready is not None:
+            ready.set()
+        return sent
+
+    def count_drop(self, name: str) -> None:
+        counter = self.drops.get(name)
+        if counter is not None:
+            counter.value += 1
+
+    def drop_counts(self) -> Dict[str, int]:
+        '''number of items dropped per outgoing edge, readable from the parent while the node runs'''
+        return {name: counter.value for name, counter in self.drops.items()}
+
+    def on_overflow(self, name: str, item: Any) -> Optional[Any]:
+        '''hook for overflow_strategy.DEGRADE: cheaper replacement for item, or None to drop it'''
+        return None
+
     # static method
     def dispatch(
             self, 
             data: Any,
+            send_queues: list,
+            send_ready: list,
             send_queues_iterator: Optional[Iterator],
-            send_timeout: Optional[bool]
-        ) -> None:
-        '''Use if all queues are equivalent. Send data alternatively to each queue'''
+            send_timeout: Optional[float],
+            policy: dispatch_policy = dispatch_policy.ROUND_ROBIN,
+            space: Optional[Event] = None
+        ) -> bool:
+        '''Use if all queues are equivalent. Send data to one of the queues chosen according 
+        to policy. If every queue is full, wait for a receiver to signal free space.
+        Return whether a queue accepted the data.'''
 
         if data is None:
-            return
+            return False
 
         if send_queues_iterator is not None:
 
@@ -461,59 +1649,140 @@ class WorkerNode(ABC):
             else:
                 deadline = time.monotonic() + send_timeout
 
-            for name, queue in send_queues_iterator:
-                
-                if time.monotonic() > deadline:
-                    return None
+            while True:
+
+                for queue, ready in self.dispatch_order(send_queues, send_ready, send_queues_iterator, policy):
+                    try:
+                        queue.put_nowait(data)
+                        if ready is not None:
+                            ready.set()
+                        return True
+                    except Full:
+                        pass
+
+                now = time.monotonic()
+                if now > deadline:
+                    return False
                 
-                try:
-                    return queue.put_nowait(data)
-                except Full:
-                    pass
+                if space is None:
+                    continue
+
+                # same clear/sweep/wait logic as in poll
+                if space.is_set():
+                    space.clear()
+                else:
+                    self.wait_on(space, None if deadline == float('inf') else deadline - now, 'send_blocked_ns')
 
-                # sleep a bit ?
+                if self.stop_event.is_set():
+                    return False
+
+        return False
+
+    # static method
+    def dispatch_order(
+            self,
+            send_queues: list,
+            send_ready: list,
+            send_queues_iterator: Iterator,
+            policy: dispatch_policy
+        ) -> Iterator[Tuple[QueueLike, Optional[Event]]]:
+        '''Order in which dispatch tries the queues'''
+
+        if policy == dispatch_policy.ROUND_ROBIN:
+            # lazy, so that the cycle only advances past the queues actually tried
+            for name, queue, ready in islice(send_queues_iterator, len(send_queues)):
+                yield queue, ready
+            return
+        
+        targets = list(zip(send_queues, send_ready))
+
+        if policy == dispatch_policy.LEAST_LOADED:
+            targets.sort(key = lambda target: queue_load(target[0]))
+        
+        elif policy == dispatch_policy.POWER_OF_TWO:
+            random.shuffle(targets)
+            targets[:2] = sorted(targets[:2], key = lambda target: queue_load(target[0]))
+
+        yield from targets
 
     @abstractmethod
     def process_data(self, data: Any) -> Any:
         '''does the actual processing'''
 
+    def output_sample(self) -> Optional[Any]:
+        '''example of process_data output used to lay out queues declared with a QueueSpec, None if unknown'''
+        return None
+
     @abstractmethod
     def process_metadata(self, metadata: Any) -> Any:
         '''handles and generate metadata'''
 
     def reset(self):
         self.stop_event.clear()
+        self.ready.clear()
+        self.stopped.clear()
         self.barrier = None
         self.receive_data_queues = []
         self.receive_data_queue_names = []
+        self.receive_data_space = []
         self.receive_data_queues_iterator = None
         self.send_data_queues = []
         self.send_data_queue_names = []
+        self.send_data_ready = []
         self.send_data_queues_iterator = None
         self.receive_metadata_queues = []
         self.receive_metadata_queue_names = []
+        self.receive_metadata_space = []
         self.receive_metadata_queues_iterator = None
         self.send_metadata_queues = []
         self.send_metadata_queue_names = []
+        self.send_metadata_ready = []
         self.send_metadata_queues_iterator = None
+        self.send_data_overflow = {}
+        self.overflow_congested = {}
+        self.drops = {}
+        self.send_data_sequence = False
+        self.sequence = 0
+        self.reorder = None
         
     def start(self):
-        '''start the loop in a separate process'''
-        self.process = Process(target = self.main_loop)
+        '''start the loop in a separate process or thread'''
+        if self.executor == executor_type.THREAD:
+            self.process = Thread(target = self.main_loop, name = self.name, daemon = True)
+        else:
+            self.process = Process(target = self.main_loop)
         self.process.start()
         
     def stop(self):
         '''stop the loop and join process'''
         self.stop_event.set()
+        # wake up the node if it is blocked waiting for data or space
+        self.receive_data_ready.set()
+        self.receive_metadata_ready.set()
+        self.send_data_space.set()
+        self.send_metadata_space.set()
     
-    def join(self):
-        self.process.join() # this may hang if queues are not empty
-        print(f'{self.name} succesfully exited...')
+    def join(self, timeout: Optional[float] = None):
+        '''wait for the node to exit, a process only exits once the items it sent are read'''
+        self.process.join(timeout)
+        if not self.process.is_alive():
+            print(f'{self.name} succesfully exited...')
 
     def kill(self):
         '''stop the loop and join process'''
-        self.stop_event.set()
-        self.process.terminate() # stop even if queues are not empty
+        # give up flushing what the node sent, it may never be read
+        for q in self.send_data_queues + self.send_metadata_queues:
+            q.cancel_join_thread()
+        if self.executor == executor_type.THREAD:
+            # threads can't be terminated, ask nicely and don't wait forever
+            self.stop()
+            self.process.join(timeout = 1.0)
+            if self.process.is_alive():
+                print(f'{self.name} still running...')
+                return
+        else:
+            self.stop_event.set()
+            self.process.terminate() # stop even if queues are not empty
         print(f'{self.name} succesfully exited...')
 
 